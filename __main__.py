@@ -57,6 +57,11 @@ parser.add_argument('--no-jedi', default=False,
             action="store_true",
             help='Do not use Jedi library for code completion even if available.')
 
+parser.add_argument('--recover', default=False,
+            action="store_true",
+            help=('Replay the edits journaled by a previous session that did not end well. '
+                  'If no file is given, every file that has a journal gets opened.'))
+
 parser.add_argument("files", default=None,
             help="List of files to Open.", 
             nargs='*') 
@@ -138,6 +143,9 @@ def raise_unraisable(unraisable):
     print_tb(unraisable.exc_traceback)
     type_, value_, trace_ = sys.exc_info()
     print('cannot recover from async threads failures')
+    from vy.filetypes.journal import flush_journals
+    flush_journals()
+    print('your last edits are journaled, use: python -m vy --recover')
     raise_signal(SIGKILL)
     
 threading.excepthook = raise_unraisable
@@ -168,10 +176,28 @@ if global_config.DEBUG:
             Editor = new = EditorFactory(*[old.current_buffer.path, *cmdline.files], command_line=cmdline)
     
 from vy.editor import _Editor        
+from vy.filetypes.journal import discard_journals, find_journals, replay
+
+if cmdline.recover:
+    journals = find_journals()
+    if not cmdline.files:
+        cmdline.files = list(journals)
+
 try:
     Editor = _Editor(*cmdline.files, command_line=cmdline)
+    if cmdline.recover:
+        report = []
+        for buffer in Editor.cache:
+            if (file := journals.get(str(buffer.path))) is None:
+                continue
+            try:
+                report.append(f'{replay(file, buffer)} edits recovered in {buffer.path}')
+            except (OSError, ValueError) as exc:
+                report.append(f'cannot recover {buffer.path}: {exc}')
+        Editor.warning('\n'.join(report) or 'nothing to recover')
     Editor()
 except SystemExit:
+    discard_journals()
     print('Thanks for using Vy in its beta version.\n'
           'Any comment or issue posted on github.com/nophke/vy will be taken into account.')
     
@@ -21,7 +21,7 @@ def erase_word_backward(editor: _Editor, *args, **kwargs):
         else:
             start_of_deletion = curbuf.find_previous_delim()
             
-            while curbuf.string[start_of_deletion] in '\t ':
+            while curbuf[start_of_deletion] in '\t ':
                 start_of_deletion -=1
             del curbuf[start_of_deletion:curbuf.cursor]       
             curbuf.cursor = start_of_deletion
@@ -148,10 +148,8 @@ def move_line_up(editor, reg=None, part=None, arg=None, count=1):
         if cur_lin_idx > 0:
             line_1 = curbuf.splited_lines[cur_lin_idx]
             line_2 = curbuf.splited_lines[cur_lin_idx - 1]
-            
-            curbuf.splited_lines[cur_lin_idx] = line_2
-            curbuf.splited_lines[cur_lin_idx - 1] = line_1
-            curbuf.string = ''.join(curbuf.splited_lines)
+            start = curbuf.lines_offsets[cur_lin_idx - 1]
+            curbuf[start:start + len(line_2) + len(line_1)] = line_1 + line_2
 
             curbuf.cursor_lin_col = (cur_lin_idx - 1, 0)
             if curbuf.current_line.strip():
@@ -167,11 +165,9 @@ def move_line_down(editor, reg=None, part=None, arg=None, count=1):
         if cur_lin_idx < curbuf.number_of_lin - 1:
             line_1 = curbuf.splited_lines[cur_lin_idx]
             line_2 = curbuf.splited_lines[cur_lin_idx + 1]
-            
-            curbuf.splited_lines[cur_lin_idx] = line_2
-            curbuf.splited_lines[cur_lin_idx + 1] = line_1
-            curbuf.string = ''.join(curbuf.splited_lines)
-            
+            start = curbuf.lines_offsets[cur_lin_idx]
+            curbuf[start:start + len(line_1) + len(line_2)] = line_2 + line_1
+
             curbuf.cursor_lin_col = (cur_lin_idx + 1, 0)
             if curbuf.current_line.strip():
                 curbuf.move_cursor('_')
@@ -43,7 +43,7 @@ def format_line(editor: _Editor, reg=None, count=1, **kwargs):
         to_lin = len(cur_buf)
         
     target = slice(from_lin, to_lin)
-    cur_buf[target] = '\n'.join(wrapper(cur_buf.string[target]))
+    cur_buf[target] = '\n'.join(wrapper(cur_buf[target]))
     
 @_sa_commands('# v_# :comment')
 def comment_current_line(editor, reg=None, part=None, arg=None, count=1):
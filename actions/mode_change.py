@@ -178,7 +178,7 @@ def do_insert_C_O(editor, **kwargs):
 
 @_atomic_commands('vy:paste i_vy:paste')
 def paste_from_os_clipboard_event(editor: _Editor, *args, **kwrags):
-    editor.current_buffer.insert(editor.read_stdin())
+    editor.current_buffer.paste(editor.read_stdin())
     
 @_atomic_commands('v_vy:paste')
 def replace_selected_text_from_os_clipboard_event(editor: _Editor, *args, **kwrags):
@@ -28,6 +28,7 @@ window redraw by example.
 """
 
 from vy.keys import _escape
+from re import escape as _re_escape
 from vy import keys as _k
 from vy.editor import _Editor
 
@@ -310,22 +311,19 @@ def do_normal_n(editor, reg=None, part=None, arg=None, count=1):
         raise editor.MustGiveUp(' ( No previous search. )')
 
     curbuf = editor.current_buffer
-    find = curbuf.string.find
-    current_offset = curbuf.cursor
-    
-    offset = find(needle, current_offset) 
-    if offset == current_offset:
-        offset = find(needle, current_offset + 1)
-
-    if offset == -1:
-        editor.screen.minibar(f'String: «{needle}» not found, retrying from first line.')
-        offset = find(needle)
-
-    if offset == -1:
-        editor.screen.minibar(f'String: «{needle}» not found!')
-    else:
-        curbuf.cursor = offset    
-        editor.actions.normal('zz')
+    index = curbuf.search_index
+    index.set_needle(needle)
+    offset = curbuf.cursor
+    for _ in range(count):
+        if (found := index.next_match(offset)) is None:
+            editor.screen.minibar(f'String: «{needle}» not found!')
+            return
+        offset, wrapped = found
+        if wrapped:
+            editor.screen.minibar(f'String: «{needle}» not found, retrying from first line.')
+
+    curbuf.cursor = offset    
+    editor.actions.normal('zz')
         
     
 @_motion_commands("N")
@@ -334,31 +332,31 @@ def do_normal_N(editor: _Editor, reg=None, part=None, arg=None, count=1):
     Moves the cursor to previous occurrence of last searched text.
     """
     needle = editor.registr['/']
-    curbuf = editor.current_buffer
-    current_offset = curbuf.cursor
-    
-    if needle:
-        offset = curbuf.string.rfind(needle, 0, curbuf.cursor)
+    if not needle:
+        raise editor.MustGiveUp(' ( No previous search. )')
 
-        if offset == current_offset:
-            offset = curbuf.string.rfind(needle, 0, curbuf.cursor - 1)
-    
-        if offset == -1:
-            editor.screen.minibar('String not found: back to the end.')
-            offset = curbuf._string.rfind(needle)
-    
-        if offset == -1:
+    curbuf = editor.current_buffer
+    index = curbuf.search_index
+    index.set_needle(needle)
+    offset = curbuf.cursor
+    for _ in range(count):
+        if (found := index.previous_match(offset)) is None:
             editor.screen.minibar('String not found!')
-            return 'normal'
-    
-        curbuf.cursor = offset    
-        editor.actions.normal('zz')
-    else:
-        editor.minibar(' ( No previous search. )')
+            return
+        offset, wrapped = found
+        if wrapped:
+            editor.screen.minibar('String not found: back to the end.')
+
+    curbuf.cursor = offset    
+    editor.actions.normal('zz')
 
 @_motion_commands('*')
 def do_normal_star(editor, reg=None, part=None, arg=None, count=1):
-    editor.registr['/'] = editor.current_buffer[editor.current_buffer.inner_word()].strip()
+    """
+    Searches the next occurrence of the word under the cursor.
+    """
+    word = editor.current_buffer[editor.current_buffer.inner_word()].strip()
+    editor.registr['/'] = rf'\b{_re_escape(word)}\b' if word.isidentifier() else _re_escape(word)
     editor.actions.normal('n')
 
 @_motion_commands(')')
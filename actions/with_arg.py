@@ -46,6 +46,20 @@ _c_with_buffer_header = """
     aliases: %s"""
 _with_buffer = _CompletableCommand(_c_with_buffer_header, 'buffer')
 
+_c_with_project_file_header = """
+    This command is part of command mode «with project file» commands.
+
+    [SYNTAX]      :%s {fuzzy_file_name}
+    aliases: %s"""
+_with_project_file = _CompletableCommand(_c_with_project_file_header, 'project_file')
+
+_c_with_symbol_header = """
+    This command is part of command mode «with python symbol» commands.
+
+    [SYNTAX]      :%s {symbol_name}
+    aliases: %s"""
+_with_symbol = _CompletableCommand(_c_with_symbol_header, 'symbol')
+
 #
 # Start of public actions
 #
@@ -143,39 +157,169 @@ def do_edit(editor, reg=None, part=None, arg=None, count=1):
     if arg:
         editor.edit(arg)
 
+@_with_project_file(":find :fin")
+def find_project_file(editor, reg=None, part=None, arg=None, count=1):
+    """
+    Opens a file of the project (the current directory and its sub-
+    folders, minus what git ignores).  The letters of {fuzzy_file_name}
+    must be found in the path of the file, in the same order, so that
+    ':find edpy' opens 'vy/editor.py'.  The best match is opened, use
+    <TAB> to list and choose from the matching files while typing.
+    """
+    from os.path import isfile
+    from vy.project import project_index
+    if not arg:
+        editor.warning(find_project_file.__doc__)
+        return 'normal'
+    if isfile(arg):
+        editor.edit(arg)
+        return 'normal'
+    index = project_index()
+    found = index.find(arg, limit=1)
+    if not found:
+        status = '' if index.ready else ' ( the project is still being indexed )'
+        raise editor.MustGiveUp(f'no file matches {arg}{status}')
+    editor.edit(f'{index.root}/{found[0]}')
+    return 'normal'
+
+@_with_symbol(":tag :ta :symbol :workspace_symbol")
+def goto_symbol(editor, reg=None, part=None, arg=None, count=1):
+    """
+    Jumps to the definition of a class, a function, a method or a global
+    variable of the python files of the project.  If {symbol_name} is
+    defined more than once, the definition found in the current file is
+    prefered, then the first one that is not an import.  Use <TAB> to
+    list and choose from every definition whose name looks like
+    {symbol_name} (the letters must be found in the same order).
+    """
+    from vy.symbols import symbol_index
+    if not arg:
+        editor.warning(goto_symbol.__doc__)
+        return 'normal'
+    index = symbol_index()
+    qualname, _, where = arg.strip().rpartition(' ')
+    path, _, lin = where.rpartition(':')
+    name = (qualname or where).rpartition('.')[2]
+    found = index.lookup(name, editor.current_buffer.path)
+    if qualname and lin.isdigit():
+        # chosen from the completion, the exact definition is known
+        position = (f'{index.root}/{path}', qualname, int(lin))
+        found = [symbol for symbol in found if symbol[:2] + symbol[3:4] == position] or found
+    if not found:
+        status = '' if index.ready else ' ( the project is still being indexed )'
+        guesses = list(dict.fromkeys(qualname for _, qualname, *_ in index.find(name, limit=5)))
+        if guesses:
+            status += '  did you mean: ' + ', '.join(guesses)
+        raise editor.MustGiveUp(f'no symbol named {name}{status}')
+    path, qualname, kind, lin, col = found[0]
+    buffer = editor.edit(path)
+    buffer.cursor_lin_col = (lin - 1, col + 1)
+    if len(found) > 1:
+        editor.screen.minibar(f'{kind} {qualname} ( 1 of {len(found)} definitions )')
+    return 'normal'
+
 @_with_args(':%s')
 def replace_all(editor, reg=None, part=None, arg=None, count=1):
     """
-    WIP !
+    [SYNTAX]      :%s {pattern} {string}
+    Replace every occurence of {pattern} by {string} in the whole buffer.
+    ---
+    NOTE: The vim syntax ':%s/{pattern}/{string}/g' is also understood.
     """
-    if not arg or not ' ' in arg:
-        editor.warning('bad syntax')
-        return
-    with editor.current_buffer as curbuf:
-        old, new = arg.split(' ', maxsplit=1)
-        for idx, line in enumerate(curbuf.splited_lines):
-            curbuf._splited_lines[idx] = line.replace(old, new)
-        curbuf._lines_offsets.clear()
-        curbuf._string = ''.join(curbuf._splited_lines)
-        curbuf._lengh = len(curbuf._string)
+    return substitute(editor, part=slice(0, len(editor.current_buffer)), arg=arg)
 
 @_with_args(':s :su :substitute')
-def substitute(editor, arg=None, **kwargs):
+def substitute(editor, reg=None, part=None, arg=None, count=1):
     """
-    [SYNTAX]      :s {rhs} {lhs}          
-    Replace {rhs} by {lhs} on current line.
-    ---
-    NOTE: This command does not follow the vim-syntax.  The main
-    difference being the use of spaces to delimit {rhs} and {lhs}.
+    [SYNTAX]      :[range]s/{pattern}/{string}/[flags]
+    Replace the matches of {pattern} by {string} on the lines of [range],
+    or on the current line, or on the selected lines.
+
+    {pattern} is a python regular expression, {string} may refer to the
+    whole match with & and to the captured groups with \\1 to \\9.
+
+    [range] may be % (the whole buffer), a line number, '.' (the current
+    line), '$' (the last line), each followed by +{n} or -{n}, or two of
+    those separated by a comma.
+
+    [flags] may be 'g' to replace every match of each line instead of
+    the first one, 'c' to confirm each replacement, 'i' to ignore case,
+    'n' to only count the matches, and 'e' to not complain when there is
+    no match.
     ---
-    NOTE: In Vy, a space is *allways* needed after the command and
-    before the first argument.
+    NOTE: The old syntax ':s {pattern} {string}' replaces every occurence
+    of {pattern} on the current line.
     """
-    if ' ' in arg:
-        rhs, lhs = arg.split(' ', maxsplit=1)
-        editor.current_buffer.current_line = editor.current_buffer.current_line.replace(rhs, lhs)
-    else:
+    from re import IGNORECASE, escape, error as RegexError
+    from vy.filetypes.substitute import (parse_substitute, vim_template,
+                                         substitute as do_substitute, count_matches)
+    from vy.filetypes.searchindex import compile_needle
+    if not arg:
         editor.warning(substitute.__doc__)
+        return 'normal'
+    try:
+        needle, string, flags = parse_substitute(arg)
+    except ValueError:
+        if ' ' not in arg:
+            editor.warning(substitute.__doc__)
+            return 'normal'
+        needle, string = arg.split(' ', maxsplit=1)
+        needle, string, flags = escape(needle), string.replace('\\', '\\\\').replace('&', '\\&'), 'g'
+
+    needle = needle or editor.registr['/']
+    if not needle:
+        raise editor.MustGiveUp('no previous pattern')
+    pattern = compile_needle(needle, IGNORECASE if 'i' in flags else 0)
+    editor.registr['/'] = needle
+
+    curbuf = editor.current_buffer
+    if part is None:
+        first = last = curbuf.current_line_idx
+    else:
+        first = curbuf._offset_to_lin(part.start)
+        last = curbuf._offset_to_lin(max(part.start, part.stop - 1))
+
+    if 'n' in flags:
+        found = count_matches(curbuf, first, last, pattern, every='g' in flags)
+        editor.screen.minibar(f'{found} matches on {last - first + 1} lines')
+        return 'normal'
+
+    accept = None
+    if 'c' in flags:
+        every_next = last_one = False
+        def accept(index, match):
+            nonlocal every_next, last_one
+            if last_one:
+                return None
+            if every_next:
+                return True
+            curbuf.cursor_lin_col = index, match.start() + 1
+            editor.screen.minibar(f'replace with {match.expand(template)!r} ? (y/n/a/q/l)')
+            key = editor.read_stdin()
+            every_next = key == 'a'
+            last_one = key == 'l'
+            return True if key in ('y', 'a', 'l') else False if key == 'n' else None
+        curbuf.search_index.highlight = pattern
+
+    try:
+        template = vim_template(string)
+        done, last_changed = do_substitute(curbuf, first, last, pattern, template,
+                                           every='g' in flags, accept=accept)
+    except RegexError as exc:
+        raise editor.MustGiveUp(f'invalid replacement string: {exc}')
+    finally:
+        if accept is not None:
+            curbuf.search_index.highlight = None
+            editor.screen.minibar('')
+
+    if not done:
+        if 'e' not in flags:
+            raise editor.MustGiveUp(f'pattern not found: {needle}')
+        return 'normal'
+    curbuf.cursor_lin_col = last_changed, 0
+    curbuf.cursor = curbuf.find_first_non_blank_char_in_line()
+    editor.screen.minibar(f'{done} substitutions on {last - first + 1} lines')
+    return 'normal'
 
 @_with_args(':debug')
 def debug_tool(editor, reg=None, part=None, arg='reload', count=1):
@@ -307,22 +451,26 @@ def draw_a_box_around_text(editor, reg=None, part=None, arg=' ', count=1):
 def grep_in_directory(editor: _Editor, arg=None, *args, **kwargs):
     """
     Scan for occurences of a pattern in files within the current directory.
+    Use ':grep {pattern} {directory}' to search another directory.  The
+    matches are listed in a new buffer while the search goes on, where
+    <CR> jumps to the match under the cursor, and <C-C> stops the search.
+    Files ignored by git are not searched.
     """
-    from subprocess import run, TimeoutExpired
+    from os.path import isdir
+    from vy.filetypes.grepfile import GrepFile
     if not arg:
         editor.warning(grep_in_directory.__doc__)
         return 'normal'
-    
-    command = f"grep -T -n -r {arg}"
-    try:
-        completed = run(command, capture_output=True, shell=True, text=True, timeout=4)
-    except TimeoutExpired:
-        raise editor.MustGiveUp('this command got cancelled for beeing too long')
-        
-    if completed.returncode:
-       raise editor.MustGiveUp(f"error while evaluating '{command}'")
-    
-    editor.warning(completed.stdout)
+
+    needle, _, root = arg.rpartition(' ')
+    if not needle or not isdir(root):
+        needle, root = arg, '.'
+
+    for buffer in editor.cache:
+        if isinstance(buffer, GrepFile):
+            buffer.cancel()
+    editor.edit(editor.cache.add(GrepFile(needle, root)))
+    return 'normal'
 
 @_with_args(':show_work_done_since_original')
 def diff_saved_and_unsaved_changes(editor: _Editor, arg=None, *args, **kwargs):
@@ -333,7 +481,9 @@ def diff_saved_and_unsaved_changes(editor: _Editor, arg=None, *args, **kwargs):
     from vy.filetypes.textfile import TextFile
     buffer: TextFile = editor.current_buffer
     current = buffer.splited_lines
-    original = buffer.undo_list.data[0][0].splitlines(True)
+    if (original := buffer.original_string()) is None:
+        raise editor.MustGiveUp('the undo history does not go back to the original state')
+    original = original.splitlines(True)
     diff = ''.join(difflib.unified_diff(current, original)) or 'no work done yet'
     editor.warning(diff)
     
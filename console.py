@@ -8,7 +8,9 @@ console.
 
 It defines the getch() blocking function to read a single keypress.  And
 getch_noblock() is used by Editor.input_thread to feed the input_queue
-and Editor.read_stdin().
+and Editor.read_stdin().  It reads whatever stdin holds at once, and
+lets an InputDecoder split it into keys, so that a pasted text is
+read in a few calls whatever its size.
 
 setnonblocking() puts the terminal in non blocking mode allowing to
 return immediatly with an empty string from a call to stdin.read(). This
@@ -21,10 +23,15 @@ it.  And setraw being a dependency of getch, copying 10 lines of code
 prevented several call to the import machinery.
 """
 
+from codecs import getincrementaldecoder
+from os import read
 from select import select
 from sys import __stdin__ as stdin
 from termios import tcgetattr, tcsetattr
 
+READ_SIZE = 1 << 16     # bytes asked to stdin at once
+ESCAPE_DELAY = 0.025    # seconds to wait for the end of an escape sequence
+
 #### All Flags above could have been imported
 ##   from the termios module, but here is an oportunity to document
 ##   what those actualy do on a modern linux machine... (if they
@@ -115,70 +122,187 @@ def getch():
     return rv
 
 
+class InputDecoder:
+    """
+    Incremental decoder turning the bytes read from the terminal into
+    key presses.  Bytes may be fed in chunks of any size, an escape
+    sequence or an utf-8 character cut between two chunks is kept until
+    the rest comes.
+
+    A bracketed paste is given as 'vy:paste' followed by the whole
+    pasted text, and a mouse click as 'vy:mouse:<button>' followed by
+    its column and its line.  Both the legacy (X10) and the SGR (1006)
+    mouse reports are understood.  The mouse wheel is given as arrows.
+
+    >>> decoder = InputDecoder()
+    >>> decoder.feed(b'a\\xc3')
+    ['a']
+    >>> decoder.feed(b'\\xa9\\x1b[A\\x1b[<0;12;5M\\x1b[<0;12;5m\\x1b')
+    ['é', '\\x1b[A', 'vy:mouse:left', '12', '5']
+    >>> decoder.waiting
+    True
+    >>> decoder.flush()
+    ['\\x1b']
+    >>> decoder.feed(b'\\x1b[200~one\\rtwo')
+    []
+    >>> decoder.feed(b'\\x1b[201~')
+    ['vy:paste', 'one\\ntwo']
+    """
+    PASTE_START = b'\x1b[200~'
+    PASTE_END = b'\x1b[201~'
+
+    def __init__(self):
+        self._data = bytearray()
+        self._paste = None
+        self._text = getincrementaldecoder('utf-8')(errors='replace')
+
+    @property
+    def waiting(self):
+        """
+        True if an escape sequence was cut, flush() should be called if
+        its end does not come soon.
+        """
+        return bool(self._data) and self._paste is None
+
+    def feed(self, data):
+        """
+        Returns the list of the keys completed by the bytes data.
+        """
+        self._data += data
+        data = self._data
+        keys = []
+        position = 0
+        while position < len(data):
+            if self._paste is not None:
+                end = data.find(self.PASTE_END, position)
+                if end == -1:
+                    # keep what may be the start of PASTE_END
+                    keep = max(position, len(data) - len(self.PASTE_END) + 1)
+                    self._paste.append(bytes(data[position:keep]))
+                    position = keep
+                    break
+                self._paste.append(bytes(data[position:end]))
+                text = b''.join(self._paste).decode('utf-8', errors='replace')
+                keys.append('vy:paste')
+                keys.append(text.replace('\r\n', '\n').replace('\r', '\n'))
+                self._paste = None
+                position = end + len(self.PASTE_END)
+            elif data[position] == 0x1b:
+                stop = self._escape(data, position, keys)
+                if stop is None:
+                    break
+                position = stop
+            else:
+                stop = data.find(b'\x1b', position)
+                if stop == -1:
+                    stop = len(data)
+                keys.extend(self._text.decode(bytes(data[position:stop])))
+                position = stop
+        del data[:position]
+        return keys
+
+    def flush(self):
+        """
+        Gives up waiting for the end of a cut escape sequence, and
+        returns the keys it holds.
+        """
+        keys = []
+        while self.waiting:
+            rest = bytes(self._data[1:])
+            self._data.clear()
+            keys.append('\x1b')
+            keys.extend(self.feed(rest))
+        return keys
+
+    def _escape(self, data, position, keys):
+        # Appends to keys the escape sequence found at position and
+        # returns where it ends, or None if it is not complete.
+        size = len(data)
+        if position + 1 >= size:
+            return None
+        second = data[position + 1]
+        if second == 0x5b:                              # CSI: ESC [
+            stop = position + 2
+            while stop < size and not 0x40 <= data[stop] <= 0x7e:
+                stop += 1
+            if stop == size:
+                return None
+            stop += 1
+            sequence = bytes(data[position:stop])
+            if sequence == self.PASTE_START:
+                self._paste = []
+            elif sequence == b'\x1b[M':
+                if stop + 3 > size:
+                    return None
+                button, col, lin = (byte - 32 for byte in data[stop:stop + 3])
+                self._mouse(button, col, lin, keys)
+                stop += 3
+            elif sequence.startswith(b'\x1b[<'):
+                try:
+                    button, col, lin = map(int, sequence[3:-1].split(b';'))
+                except ValueError:
+                    pass
+                else:
+                    if sequence.endswith(b'M'):        # not a release
+                        self._mouse(button, col, lin, keys)
+            else:
+                keys.append(sequence.decode('ascii', errors='replace'))
+            return stop
+        if second == 0x4f:                              # SS3: ESC O
+            if position + 2 >= size:
+                return None
+            keys.append(bytes(data[position:position + 3]).decode('ascii', errors='replace'))
+            return position + 3
+        if second == 0x1b:
+            keys.append('\x1b')
+            return position + 1
+        lenght = 4 if second >= 0xf0 else 3 if second >= 0xe0 else 2 if second >= 0xc0 else 1
+        if position + 1 + lenght > size:
+            return None
+        keys.append(bytes(data[position:position + 1 + lenght]).decode('utf-8', errors='replace'))
+        return position + 1 + lenght
+
+    @staticmethod
+    def _mouse(button, col, lin, keys):
+        if button & 32:                                 # motion
+            return
+        if button == 64:
+            keys.append('\x1b[A')
+        elif button == 65:
+            keys.append('\x1b[B')
+        elif button in (0, 1, 2):
+            keys.append(('vy:mouse:left', 'vy:mouse:middle', 'vy:mouse:right')[button])
+            keys.append(str(col))
+            keys.append(str(lin))
+        else:
+            keys.append(f'vy:mouse:{button=}')
+
+
 def getch_noblock():
     """
     This is the couter-part of the getch() function from the same
     module.  getch_noblock() returns a generator yielding key strokes or
-    None every 0.1 seconds
+    an empty string every 0.1 seconds.  Whatever is available on stdin
+    is read at once and decoded by an InputDecoder.
     """
     old_mode = tcgetattr(stdin)
-    buffer = stdin.buffer
+    fd = stdin.fileno()
+    decoder = InputDecoder()
     try:
         setraw(stdin)  # First,
         setnonblocking(stdin)  # Second,
         while True:
-            select([buffer], [], [], 0.1)
-            ret = buffer.read(1)
-            if ret != b"\x1b":
-                while True:
-                    try:
-                        yield ret.decode("utf-8")
-                        break
-                    except UnicodeDecodeError:
-                        ret += buffer.read(1)
-                continue
-                
-            next_one = buffer.read(1)
-            if next_one != b"[":
-                yield (ret + next_one).decode("ascii")
-                continue
-                
-            ret = ret + next_one + buffer.read(1)
-
-            while ret[-1] not in range(0x40, 0x7E + 1):
-                ret += buffer.read(1)
-
-            if ret == b"\x1b[200~":
-                ret = buffer.read(1)
-                while not ret.endswith(b"\x1b[201~"):
-                    ret += buffer.read(1)
-                ret = ret.removesuffix(b"\x1b[201~")
-                yield "vy:paste"
-                yield ret.replace(b"\r", b"\n").decode("utf-8")
-
-            elif ret == b"\x1b[M":
-                button = ord(buffer.read(1)) - 32  # 32 == ord(ascii(' '))
-                coord_x = str(ord(buffer.read(1)) - 32)  # 32 == ord(ascii(' '))
-                coord_y = str(ord(buffer.read(1)) - 32)  # 32 == ord(ascii(' '))
-                if button == 64:
-                    yield "\x1b[A"
-                elif button == 65:
-                    yield "\x1b[B"
-                else:
-                    if button == 0:
-                        yield f"vy:mouse:left"
-                    elif button == 1:
-                        yield "vy:mouse:middle"
-                    elif button == 2:
-                        yield "vy:mouse:right"
-                    else:
-                        yield f"vy:mouse:{button=}"
-                        continue  # discard coordonates
-                    yield coord_x
-                    yield coord_y
+            waiting = decoder.waiting
+            if select([fd], [], [], ESCAPE_DELAY if waiting else 0.1)[0]:
+                keys = decoder.feed(read(fd, READ_SIZE))
+            elif waiting:
+                keys = decoder.flush()
             else:
-                yield ret.decode("ascii")
-
+                keys = None
+            if keys:
+                yield from keys
+            else:
+                yield ''
     finally:
         tcsetattr(stdin, TCSAFLUSH, old_mode)
 
@@ -254,36 +378,3 @@ if sys.platform == 'darwin':
                 rv += esc_seq
         tcsetattr(stdin, TCSAFLUSH, mode)
         return rv
-    
-    def getch_noblock():
-        """
-        This is the couter-part of the getch() function also defined in the
-        current module. getch_noblock() returns a generator yielding key strokes
-        or None every 0.1 seconds
-        """
-        old_mode = tcgetattr(stdin)
-        try:
-            setraw(stdin)           # First,
-            setnonblocking(stdin)   # Second, 
-            while True:
-                select([stdin],[],[], 0.1)       # wait for a character
-                # rely on .read(1) not splitting multi-bytes chars
-                ret = stdin.read(1)
-                if ret == '\x1b':
-                    esc_seq = stdin.read(1) 
-                    while esc_seq:
-                        # While there are things left in the buffer this sould be 
-                        # considered as part of the escape sequence, but if we read 
-                        # <ESC> again this mean the user is holding the key. 
-                        # There is a subtil bug! if user holds a special key and
-                        # presses a normal key very quickly.... What can we do ?
-                        if esc_seq == '\x1b':
-                            yield ret
-                            ret = ''
-                        ret += esc_seq
-                        esc_seq = stdin.read(1)
-                yield ret
-        finally:
-            tcsetattr(stdin, TCSAFLUSH, old_mode)
-    
-    
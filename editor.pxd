@@ -40,6 +40,7 @@ cdef class _Editor:
         save_in_jump_list(self)
         bint _async_io_flag
         bint _running
+        bint _full_redraw
         #dict __dict__
         #Interface interface
         object interface
@@ -14,7 +14,7 @@ the classes defined in this module directly.
 from pathlib import Path
 from bdb import BdbQuit
 from itertools import repeat, chain
-from time import sleep, time
+from time import sleep
 from threading import Thread, Lock
 from queue import Queue
 from signal import signal, SIGWINCH
@@ -23,7 +23,7 @@ from vy.screen import Screen
 from vy.interface import Interface
 from vy.filetypes import Open_path
 from vy.console import getch_noblock
-from vy.utils import _HistoryList
+from vy.utils import _HistoryList, redraw_needed
 from vy.clipboard import _Register
 from vy.global_config import DEBUG
 from vy import keys
@@ -77,6 +77,15 @@ class _Cache:
             new_buffer.cache_id = key
             return new_buffer
 
+    def add(self, buffer):
+        """
+        Caches a buffer that was not created from a path, and returns it.
+        """
+        self._dic[self._counter] = buffer
+        buffer.cache_id = self._counter
+        self._counter += 1
+        return buffer
+
     @staticmethod
     def _make_key(key):
         if hasattr(key, 'cache_id'):
@@ -91,7 +100,9 @@ class _Cache:
 
     def __delitem__(self, key):
         """ Use this function to delete a buffer from cache. """
-        self._dic.pop(self._make_key(key))
+        buffer = self._dic.pop(self._make_key(key))
+        # its words should not be proposed for completion anymore
+        buffer.word_set.clear()
 
     def __repr__(self):
         from pprint import pformat
@@ -134,6 +145,8 @@ class _Editor:
     class NewInfo(Exception):
         pass
 
+    IDLE_REDRAW = 1.0   # seconds without any event before refreshing anyway
+
     def _init_actions(self):
         from vy.actions import __dict__ as action_dict
 #        from vy.actions.mode_change import normal_mode
@@ -190,6 +203,7 @@ class _Editor:
         self._input_queue = Queue()
         self._skip_next_undo = False
         self._screen_lock = Lock()
+        self._full_redraw = False
         
     def save_in_jump_list(self):
         curbuf = self.current_buffer
@@ -207,6 +221,9 @@ class _Editor:
     def read_stdin(self):
         if self._macro_keys:
             return self._macro_keys.pop(0)
+        if self._input_queue.empty():
+            # every key got processed, time to show the result
+            redraw_needed.set()
         key_press = self._input_queue.get(block=True)
         if self.record_macro:
             try:
@@ -294,29 +311,32 @@ class _Editor:
         return self.screen.focused.buff
 
     def print_loop(self):
-        from vy.utils import async_update
-        
-        old_screen = list()
+        """
+        Renders the screen each time redraw_needed gets set, by buffers
+        being modified, by the minibar, by a resize of the terminal, or
+        by read_stdin() once all the pending keys are processed.  Only
+        the lines that differ from the previous frame are printed.
+        """
         infobar = self.screen.infobar
         missed = 0
         ok_flag = True
         get_line_list = self.screen.get_line_list
         left_keys = self._input_queue.qsize
-        start = 0
         filtered = ''
         new_screen = list()
         old_screen = list()
         error = 'editor initialising'
         
-
+        redraw_needed.set()
         while self._async_io_flag:
-            sleep(0.04)             # do not try too much
+            redraw_needed.wait(self.IDLE_REDRAW)
+            redraw_needed.clear()
             if not self._async_io_flag:
                 break
                 
-            if ((now := time()) - start) > 5: # and force redraw sometimes
+            if self._full_redraw:
+                self._full_redraw = False
                 old_screen.clear()
-                start = now
 
             with self._screen_lock:
                 if ok_flag and not left_keys(): # > 1:
@@ -324,14 +344,16 @@ class _Editor:
                     self.screen.infobar(f' {self.current_mode.upper()} ', 
                                         f'recording macro: {self.record_macro}' if self.record_macro else 
                                         f'waiting keystrokes: {left_keys():3}' if left_keys() else
-                                        '' )
-                else:
-                    sleep(0.1)
+                                        self.current_buffer.save_status)
+                elif missed > 3:
                     self.screen.infobar(' ___ SCREEN OUT OF SYNC -- STOP TOUCHING KEYBOARD___ ',
                                         f'Failed: {missed:3} time(s), waiting keystrokes: {left_keys():3}, {error= :4} ' )
 
                 new_screen, ok_flag, error = get_line_list()
     
+            if len(new_screen) != len(old_screen):
+                old_screen.clear()
+
             filtered = ''
             for index, (line, old_line) in enumerate(
                             zip(new_screen, chain(old_screen, repeat(''))),
@@ -346,7 +368,10 @@ class _Editor:
                 missed = 0
                 old_screen = new_screen
             else:
+                # the buffer is being modified, retry soon
                 missed += 1
+                sleep(0.01)
+                redraw_needed.set()
 
     def input_loop(self):
         reader = getch_noblock()
@@ -362,7 +387,7 @@ class _Editor:
         del reader
 
     def start_async_io(self):
-#        signal(SIGWINCH, lambda x, y: self.screen.set_redraw_needed())
+        signal(SIGWINCH, self._terminal_resized)
         from vy.global_config import BG_COLOR
         assert not self._async_io_flag
 
@@ -381,6 +406,10 @@ class _Editor:
         self.input_thread.start()
         self.print_thread.start()
 
+    def _terminal_resized(self, signum, frame):
+        self._full_redraw = True
+        redraw_needed.set()
+
     def stop_async_io(self):
         if self._async_io_flag:
             self._async_io_flag = False
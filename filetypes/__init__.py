@@ -17,6 +17,9 @@ from os import access, W_OK
 import pkgutil
 import importlib
 from vy.filetypes.textfile import TextFile
+from vy.filetypes.largefile import LargeFile
+from vy.filetypes.folder import Folder
+from vy import global_config
 
 known_extensions = {}
 
@@ -82,7 +85,14 @@ def Open_path(location):
                         ' argument must be None, str or Path object')
 
     location = location.resolve()
-    
+
+    try:
+        if location.stat().st_size >= global_config.LARGE_FILE_SIZE \
+                and location.is_file():
+            return LargeFile(path=location)
+    except FileNotFoundError:
+        pass
+
     try:
         init_text = location.read_text() 
     except FileNotFoundError:
@@ -1,11 +1,11 @@
 from cython import locals
-from vy.utils cimport _HistoryList, Cancel
+from vy.utils cimport _UndoList, Cancel
 
 from threading import Event, Lock
 from queue import Queue
 
-cdef set make_word_set(str string) noexcept
-cdef set ANY_BUFFER_WORD_SET
+cdef object ANY_BUFFER_WORD_SET
+cdef object _generations
 
 cdef class BaseFile:
     cpdef void insert(self,  text) noexcept
@@ -23,7 +23,7 @@ cdef class BaseFile:
         public object _lock
         public tuple _cursor_lin_col # 
         public int _number_of_lin    # but screen uses those vars
-        public list _splited_lines   # to only "visit" ephemeral values
+        public object _splited_lines # to only "visit" ephemeral values
 #        public bint set_number       # TODO should go private
 #        public bint set_wrap
 #        public int set_tabsize
@@ -31,16 +31,32 @@ cdef class BaseFile:
 #        public bint set_autoindent
         int _virtual_col
         
-        list _states
         str _init_text
         tuple _selected      
         str _repr
-        list _lines_offsets
         object _lenght
         int _recursion
         str _current_line
         #bint _no_undoing
-        public _HistoryList undo_list
+        public _UndoList undo_list
+        public object search_index
+        int _lsp_version
+        list _lsp_changes
+        object _lsp_timer
+        int _display_generation
+        list _display_changes
+        list _pending_display_changes
+        int _edit_generation
+        int _saved_generation
+        int _original_generation
+        object _saved_lenght
+        object _saved_hash
+        object _original_lenght
+        object _original_hash
+        object _saving
+        object _journal
+        public object save_progress
+        public object save_error
         public object cache_id
         public object path
 
@@ -23,6 +23,12 @@ To modify the content of the buffer: use one of its three setters
 properties. (string,  current_line and cursor). Any modifications of one
 of those properties will immediatly invalidate any other property that 
 depend on it. 
+
+The text itself is held by a LineStore (see vy.filetypes.linestore), a
+list of lines stored in small chunks.  Edits only touch the lines they
+modify and the flat string is only built (and then cached until next
+modification) when the string property is read.
+
 Properties being lazily evaluated, a few «fast paths» are provided
 to speed up common operations upon the internal data structure.
 Do not rely on them!  Being lazily computed, a lot of the
@@ -59,24 +65,31 @@ NOTE: the word «offset» will be used to speak about characters and their
      positions, whereas «index» will be used for line numbers.
 """
 
-from vy.lsp_client import open_lsp_channel
-from vy.utils import _HistoryList, DummyLine, Cancel
-
-from threading import RLock
+from vy.lsp_client import code_units, open_lsp_channel
+from vy.utils import _UndoList, DummyLine, Cancel, redraw_needed
+from vy import global_config
+from vy.filetypes.linestore import LineStore
+from vy.filetypes.wordindex import WordIndex, first_word, last_word
+from vy.filetypes.searchindex import SearchIndex
+
+from threading import RLock, Thread, Timer
+from itertools import chain, count
+from hashlib import blake2b
+from os import chmod, fsync, replace, stat, unlink
 from sys import intern
-from re import split as _split
 from functools import lru_cache
 
 DELIMS = '+=#/?*<> ,;:/!%.{}()[]():\n\t\"\''
 
-def make_word_set(string):
-    """
-    >>> raise Error
-    """
-    return set(_split(r'[{}\. :,()\[\]]|$|\t', string))
+# every content a buffer goes through gets a new generation number
+_generations = count(1)
+
+def _hash_of(text):
+    # the hash of the saved and original contents, not to keep a copy
+    return blake2b(text.encode('utf-8', 'surrogateescape'), digest_size=16).digest()
 
 class BaseFile:
-    ANY_BUFFER_WORD_SET = set()
+    ANY_BUFFER_WORD_SET = WordIndex()
 
     modifiable = True
     actions = {}
@@ -90,6 +103,8 @@ class BaseFile:
 
     _lsp_server = None
     _lsp_lang_id = None
+    _lsp_debounce = 0.15  # seconds
+    MAX_DISPLAY_CHANGES = 256
 
     def __init__(self, /, cursor=0, init_text='', path=None):
         # start of private
@@ -97,25 +112,40 @@ class BaseFile:
         self._selected = None
         self._repr = '' #TODO delete me ?
         self._undo_flag = True
-        self._states = [init_text]
         self._number_of_lin = 0
         self._cursor_lin_col = ()
         self._current_line = ''
-        self._lines_offsets = list()
         self._async_tasks = Cancel()
         self._lock = RLock()
         self._recursion = 0
+        self._lsp_version = 1
+        self._lsp_changes = []
+        self._lsp_timer = None
+        self._display_generation = 0
+        self._display_changes = []
+        self._pending_display_changes = []
+        self._edit_generation = self._saved_generation = next(_generations)
+        self._original_generation = self._edit_generation
+        self._saved_hash = None
+        self._saved_lenght = len(init_text)
+        self._original_hash = _hash_of(init_text)
+        self._original_lenght = len(init_text)
+        self._saving = None
+        self._journal = None
+        self.save_progress = None
+        self.save_error = None
 
         self.path = path # must be first
-        self.undo_list = _HistoryList(initial=(init_text, (0,0)), name='undo list')
-        self.word_set = set()
+        self.undo_list = _UndoList(max_size=global_config.UNDO_MAX_SIZE, name='undo list')
+        self.word_set = WordIndex(self.ANY_BUFFER_WORD_SET)
+        self.search_index = SearchIndex(self)
 
         # give the buffer its initial content
         self._lenght = len(init_text)
         self._cursor = cursor
         self._string = init_text
         _splited_lines = init_text.splitlines(True)
-        self._splited_lines = _splited_lines
+        self._splited_lines = LineStore(_splited_lines)
 
         # trigger properties computation
         self.cursor_lin_col
@@ -124,33 +154,104 @@ class BaseFile:
         if self._lsp_server:
             self._lsp_server = open_lsp_channel(self._lsp_server, self)
         if self._lsp_server:
-            self._lsp_server.text_document_did_open(self._path_as_uri, self._lsp_lang_id, 1, self.string) 
-            
-        for line in _splited_lines:
-            for w in make_word_set(line):
-                if w not in self.word_set:
-                    self.ANY_BUFFER_WORD_SET.add(w)
-                self.word_set.add(w)
+            self._lsp_server.text_document_did_open(self._path_as_uri, self._lsp_lang_id, self._lsp_version, self.string) 
+
+        self.word_set.add_lines(_splited_lines)
 
 
     def _notify_lsp_content_change(self):
-        """ Notify the LSP server of file content and cursor changes. """
-        if self._lsp_server:
-            self._lsp_server.text_document_did_change(self._path_as_uri, 1, [{ "text": self.string }]) 
+        """
+        Schedules the notification of the recorded changes to the LSP
+        server.  Changes made during the next _lsp_debounce seconds will
+        be sent along in the same notification.
+        """
+        if self._lsp_server and self._lsp_changes and self._lsp_timer is None:
+            self._lsp_timer = Timer(self._lsp_debounce, self._flush_lsp_changes)
+            self._lsp_timer.daemon = True
+            self._lsp_timer.start()
+
+    def _flush_lsp_changes(self):
+        """
+        Sends the recorded changes to the LSP server right now.  Call it
+        before any request depending on the buffer content.
+        """
+        with self._lock:
+            if self._lsp_timer is not None:
+                self._lsp_timer.cancel()
+                self._lsp_timer = None
+            changes, self._lsp_changes = self._lsp_changes, []
+            if changes and self._lsp_server:
+                self._lsp_version += 1
+                if not self._lsp_server.incremental_sync:
+                    content_changes = [{"text": self.string}]
+                else:
+                    content_changes = [
+                        {"range": {"start": {"line": start_lin, "character": start_col},
+                                   "end": {"line": end_lin, "character": end_col}},
+                         "text": text} for start_lin, start_col, end_lin, end_col, text in changes]
+                self._lsp_server.text_document_did_change(self._path_as_uri, self._lsp_version,
+                                                          content_changes)
+
+    def _lsp_full_sync(self):
+        """
+        Sends the whole content of the buffer to a (re)started LSP server.
+        """
+        with self._lock:
+            if self._lsp_timer is not None:
+                self._lsp_timer.cancel()
+                self._lsp_timer = None
+            self._lsp_changes = []
+            if self._lsp_server:
+                self._lsp_version += 1
+                self._lsp_server.text_document_did_open(self._path_as_uri, self._lsp_lang_id,
+                                                        self._lsp_version, self.string)
+
+    def _record_lsp_change(self, offset, removed, inserted):
+        # The columns are converted to the code units of the server, from
+        # the edited lines, that still hold the removed text.
+        encoding = self._lsp_server.position_encoding
+        lines = self._splited_lines
+        lin = lines.line_at(offset) if lines else 0
+        head = lines[lin][:offset - lines.offset_of(lin)] if lines else ''
+        col = code_units(head, encoding)
+        if '\n' in removed:
+            end_lin = lin + removed.count('\n')
+            end_col = code_units(removed[removed.rfind('\n') + 1:], encoding)
+        else:
+            end_lin, end_col = lin, col + code_units(removed, encoding)
+
+        changes = self._lsp_changes
+        if changes and not removed:
+            # while typing, merge the insertion with the previous one
+            last_lin, last_col, last_end_lin, last_end_col, last_text = changes[-1]
+            if (last_lin == last_end_lin == lin and last_col == last_end_col and '\n' not in last_text
+                    and last_col + code_units(last_text, encoding) == col):
+                changes[-1] = (lin, last_col, lin, last_col, last_text + inserted)
+                return
+        changes.append((lin, col, end_lin, end_col, inserted))
            
     
     def auto_complete(self):
+        """
+        Returns a tuple (candidates, prefix_len) where candidates are the
+        known words starting with the word before the cursor, looked up
+        in the current buffer first, then in any buffer.
+        """
 #        with self._lock:
-            word = self.string[self.find_previous_delim():self.cursor+1].strip()
-            prefix_len = len(word)
-            if prefix_len:
-                rv = [item for item in self.word_set if item.startswith(word)]
-                if not rv or (len(rv) == 1 and rv[0] == word):
-                    rv = [item for item in self.ANY_BUFFER_WORD_SET if item.startswith(word)]
-            else:
-                rv = []
-                
-            return rv, prefix_len
+        lin, col = self.cursor_lin_col
+        line = self.current_line
+        word = last_word(line, 0, col - 1).group()
+        prefix_len = len(word)
+        if prefix_len:
+            # the word being typed is indexed too, it is not a candidate
+            typed = word + first_word(line, col - 1).group()
+            rv = [found for found in self.word_set.complete(word) if found != typed]
+            if not rv:
+                rv = [found for found in self.ANY_BUFFER_WORD_SET.complete(word) if found != typed]
+        else:
+            rv = []
+            
+        return rv, prefix_len
 
 
     def __enter__(self):
@@ -168,6 +269,10 @@ class BaseFile:
             self._recursion -=    1
             if self._recursion == 0:
 #                self._test_all_assertions()
+                if self._pending_display_changes:
+                    for change in self._pending_display_changes:
+                        self._mark_dirty_lines(*change)
+                    self._pending_display_changes.clear()
                 self._async_tasks.allow_work()
                 if self._lsp_server:
                     self._notify_lsp_content_change()
@@ -180,13 +285,18 @@ class BaseFile:
         its value triggers the registered callbacks and invalidates the
         properties that depend on it.
         
-        As there is no way of knowing in advance what the new value will
-        be, avoid modifying it directly.  This will invalidate most
-        computation allready done.
+        Setting it compares the new value with the lines of the buffer,
+        and only replaces the lines that differ, as a single edit.  It
+        still has to split the whole new value, so prefer slice
+        assignment (buffer[a:b] = text) when the modified part is known.
+
+        Reading it joins all the lines of the buffer on first access
+        after a modification, prefer slicing the buffer (buffer[a:b])
+        or visiting splited_lines when only a part of it is needed.
         """
         with self._lock:
             if not self._string:
-                self._string = ''.join(self._splited_lines)
+                self._string = self._splited_lines.getvalue()
             return self._string
 
     @property
@@ -236,19 +346,12 @@ class BaseFile:
         lines are 0 based indexed, and cols are 1-based.
         """
         with self._lock:
-            if self._lines_offsets and self._cursor_lin_col:
+            lines = self.splited_lines
+            if self._cursor_lin_col:
                 lin, _ = self._cursor_lin_col
-                return lin, self._lines_offsets[lin]
-
-            cursor = self.cursor
-            lin = offset = 0
-            for lin, offset in enumerate(self.lines_offsets):
-                if offset == cursor:
-                    return lin, offset
-                if offset > self.cursor:
-                    return lin - 1, self._lines_offsets[lin - 1 ]
             else:
-                return lin, offset
+                lin = lines.line_at(self._cursor)
+            return lin, lines.offset_of(lin)
 
     @property
     def current_line_idx(self):
@@ -263,23 +366,18 @@ class BaseFile:
     def lines_offsets(self):
         """
         This is the list of the offsets of all the beginning of lines,
-        first line starts at 0
+        first line starts at 0.  It is a read-only view over the index
+        kept up to date by the LineStore, indexing it costs O(log n).
         """
         with self._lock:
-            if not self._lines_offsets:
-                final = list()
-                offset = 0
-                for line in self.splited_lines:
-                    final.append(offset)
-                    offset += len(line)
-                self._lines_offsets = final
-            return self._lines_offsets
+            return self.splited_lines.offsets
 
     @property
     def splited_lines(self):
         r"""
         This is the list of the lines contained in the buffer, each should 
-        have a trailing newline.
+        have a trailing newline.  It is the LineStore holding the text of
+        the buffer, not a copy of it.
         -
         >>> assert all(
         ... sum(len(lines) for lines in x.splited_lines[:index])
@@ -289,7 +387,7 @@ class BaseFile:
         """
         with self._lock:
             if not self._splited_lines:
-                self._splited_lines = self._string.splitlines(True)
+                self._splited_lines = LineStore.from_string(self.string)
             return self._splited_lines
 
     @property
@@ -321,8 +419,6 @@ class BaseFile:
         with self:
             if self._splited_lines:
                 self._list_suppr()
-            else:
-                self._string_suppr()
 
     def _list_suppr(self):
         lin, col = self.cursor_lin_col
@@ -332,16 +428,16 @@ class BaseFile:
             self.join_line_with_next()
 #            self._string_suppr()
             return
+        self._record_edit(self._cursor, cur_lin[col], '')
         self._current_line  = f'{cur_lin[:col]}{cur_lin[col + 1:]}'
         self._splited_lines[lin] = self._current_line
+        self.word_set.update((cur_lin,), (self._current_line,))
         self._string = ''
         self._lenght -= 1
-        self._lines_offsets.clear()
 
     def _string_suppr(self):
-        string = self.string
         cur = self.cursor
-        self.string  = string[:cur] + string[cur + 1:]
+        self._replace_range(cur, cur + 1, '')
 
     def backspace(self):
         """
@@ -366,28 +462,135 @@ class BaseFile:
                 else:
                     self._string_insert(value)
 
+    def paste(self, value):
+        """
+        Inserts a pasted text, of any size, at the cursor position.
+        Cursor will move to end of inserted text value.  The text is
+        split in lines once and spliced into the LineStore as a single
+        edit (one undo step, one LSP change), only the inserted lines
+        get indexed and lexed again.
+        """
+        if self.modifiable and value:
+            with self:
+                self._string_insert(value)
+
     def _string_insert(self, value):
-        string = self.string
         cur = self.cursor
-        self._string = f'{string[:cur]}{value}{string[cur:]}'
+        self._replace_range(cur, cur, value)
         self._cursor += len(value)
-        self._number_of_lin = self._string.count('\n')
-        self._lines_offsets.clear()
-        self._lenght = len(self._string)
+
+    def _offset_to_lin(self, offset):
+        """
+        Returns the index of the line holding the character at offset.
+        """
+        return self.splited_lines.line_at(offset)
+
+    def _replace_range(self, start, stop, value):
+        """
+        Replaces the text between offsets start and stop by value.  This
+        is the «slow path» every multi-line modification goes through.
+        Only the lines holding the replaced text are modified inside the
+        LineStore, the cursor offset is not moved but its (lin, col)
+        position gets invalidated.
+        """
+        lines = self._splited_lines
+        if not lines:
+            new_text = value if value.endswith(self.ending) else value + self.ending
+            self._record_edit(0, '', new_text)
+            self._splited_lines = LineStore.from_string(new_text)
+            self.word_set.add_lines(self._splited_lines)
+            self._lenght = len(new_text)
+            self._number_of_lin = len(self._splited_lines)
+        else:
+            offsets = self.lines_offsets
+            first = self._offset_to_lin(start)
+            # the line holding stop is included so that a tail is always kept
+            last = self._offset_to_lin(stop) if stop < self._lenght else len(lines) - 1
+            last_line = lines[last]
+            old_size = offsets[last] + len(last_line) - offsets[first]
+            head = lines[first][:start - offsets[first]]
+            tail = last_line[stop - offsets[last]:]
+            new_text = f'{head}{value}{tail}'
+            if last == len(lines) - 1 and (new_text or not first) \
+                    and not new_text.endswith(self.ending):
+                new_text += self.ending
+            old_text = ''.join(lines.iter_range(first, last + 1))
+            self._record_edit(offsets[first] + len(head),
+                              old_text[len(head):len(old_text) - len(tail)],
+                              new_text[len(head):len(new_text) - len(tail)])
+            new_lines = new_text.splitlines(True)
+            self.word_set.update(lines.iter_range(first, last + 1), new_lines)
+            lines[first:last + 1] = new_lines
+            self._lenght += len(new_text) - old_size
+            self._number_of_lin += len(new_lines) - (last + 1 - first)
+        self._string = ''
         self._current_line = ''
         self._cursor_lin_col = ()
-        self._splited_lines.clear()
+
+    def _record_edit(self, offset, removed, inserted):
+        """
+        Records that the text removed, found at offset, is about to be
+        replaced by inserted.  This goes to the undo list and to the
+        changes to send to the LSP server.  Every modification of the
+        text goes through here, subclasses may extend it to follow the
+        modified lines.
+        """
+        self._edit_generation = next(_generations)
+        if self._undo_flag:
+            self.undo_list.record(offset, removed, inserted, self.cursor_lin_col)
+        if self._lsp_server:
+            self._record_lsp_change(offset, removed, inserted)
+        self.search_index.record_edit(offset, len(removed), len(inserted))
+        if self.path is not None:
+            (self._journal or self._open_journal()).record(offset, len(removed), inserted)
+        lines = self._splited_lines
+        lin = lines.line_at(offset) if lines else 0
+        inserted_lines = inserted.count('\n')
+        # published when the lock gets released, the edit being done
+        self._pending_display_changes.append(
+            (lin, lin + inserted_lines + 1, inserted_lines - removed.count('\n')))
+
+    def _open_journal(self):
+        from vy.filetypes.journal import open_journal
+        self._journal = open_journal(self.path.resolve())
+        return self._journal
+
+    def _mark_dirty_lines(self, first, stop, shift=0):
+        """
+        Tells the screen that the lines from first to stop must be drawn
+        again, and if shift is not null, that the following lines moved.
+        """
+        self._display_generation += 1
+        changes = self._display_changes
+        changes.append((self._display_generation, first, stop, shift))
+        if len(changes) > self.MAX_DISPLAY_CHANGES:
+            del changes[:len(changes) // 2]
+        redraw_needed.set()
+
+    def dirty_lines_since(self, generation):
+        """
+        Returns a tuple (new_generation, changes) where changes is the
+        list of (first, stop, shift) marked since generation, or None if
+        they are too old to be known.
+        """
+        changes = list(self._display_changes)
+        if not changes or changes[-1][0] <= generation:
+            return generation, []
+        if changes[0][0] > generation + 1:
+            return changes[-1][0], None
+        return changes[-1][0], [change[1:] for change in changes if change[0] > generation]
 
     def _list_insert(self, value):
         lin, col = self.cursor_lin_col
         string = self.current_line
+        self._record_edit(self._cursor, '', value)
         self._string = ''
         cur = col - 1
         self._cursor += len(value)
         self._cursor_lin_col = (lin, col + len(value))
         self._current_line = f'{string[:cur]}{value}{string[cur:]}'
         self._splited_lines[lin] = self._current_line
-        self._lines_offsets.clear()
+        self.word_set.update((string,), (self._current_line,))
         self._lenght += len(value)
 
     def start_selection(self):
@@ -448,11 +651,11 @@ class BaseFile:
             next_line_idx = line_idx + 1
             if next_line_idx != self.number_of_lin:
                 # nothing to do on last line
-                self._current_line = self.current_line.removesuffix('\n') \
-                                     + self.splited_lines[next_line_idx]
-                self._splited_lines[line_idx] = self._current_line
-                self._splited_lines.pop(next_line_idx)
-                self._lines_offsets.clear()
+                self._record_edit(self.lines_offsets[line_idx] + len(self.current_line) - 1, '\n', '')
+                old_lines = (self.current_line, self.splited_lines[next_line_idx])
+                self._current_line = old_lines[0].removesuffix('\n') + old_lines[1]
+                self._splited_lines[line_idx:next_line_idx + 1] = [self._current_line]
+                self.word_set.update(old_lines, (self._current_line,))
                 self._lenght -=1
                 self._number_of_lin -= 1
                 self._string = ''
@@ -470,16 +673,17 @@ class BaseFile:
                     self._lenght += 1
                     self._number_of_lin += 1
                     lin, col = self.cursor_lin_col
+                    self._record_edit(self._cursor, '', '\n')
 
-                    top = (self._splited_lines[lin])[:col-1] + '\n'
-                    bottom = (self._splited_lines[lin])[col-1:]
-                    self._splited_lines.insert(lin, top)
-                    self._splited_lines[lin+1] = bottom
+                    old_line = self._splited_lines[lin]
+                    top = old_line[:col-1] + '\n'
+                    bottom = old_line[col-1:]
+                    self._splited_lines[lin:lin + 1] = [top, bottom]
+                    self.word_set.update((old_line,), (top, bottom))
                     self._current_line = bottom
                     self._string = ''
                     self._cursor_lin_col = (lin+1, 1)
                     self._cursor += 1
-                    self._lines_offsets.clear()
     
                 else:
                     self._string_insert('\n')
@@ -498,13 +702,13 @@ class BaseFile:
                 assert value.endswith('\n') and '\n' not in value[:-1], f'{repr(value) = }'
                 lin = self.current_line_idx
                 old_val = self._splited_lines[lin]
+                self._record_edit(self.lines_offsets[lin], old_val, value)
                 self._lenght -= len(old_val) - len(value)
 
                 self._splited_lines[lin] = value
+                self.word_set.update((old_val,), (value,))
                 self._string = ''
                 self._current_line = value
-                self._lines_offsets.clear()
-                self._notify_lsp_content_change()
     
     @property
     def cursor(self):
@@ -528,54 +732,118 @@ class BaseFile:
     def string(self, value):
         if self.modifiable:
             with self:
-                self._current_line = ''
-                self._splited_lines.clear()
-                self._lines_offsets.clear()
-                
                 if not value.endswith(self.ending):
                     value += self.ending
-                    
-                self._string = value
-                self._number_of_lin = value.count('\n')
-                self._lenght = len(self._string)
-                self._cursor_lin_col = ()
-                self._notify_lsp_content_change()
+                lines = self._splited_lines
+                if not lines:
+                    self._replace_range(0, 0, value)
+                    return
+                # only the lines that differ get replaced
+                new_lines = value.splitlines(True)
+                limit = min(len(lines), len(new_lines))
+                head = 0
+                for old_line, new_line in zip(lines, new_lines):
+                    if old_line != new_line:
+                        break
+                    head += 1
+                if head == len(lines) == len(new_lines):
+                    return
+                head = min(head, limit - 1)
+                tail = 0
+                while tail < limit - head and lines[-1 - tail] == new_lines[-1 - tail]:
+                    tail += 1
+                offsets = self.lines_offsets
+                stop = offsets[len(lines) - tail] if tail else self._lenght
+                self._replace_range(offsets[head], stop,
+                                    ''.join(new_lines[head:len(new_lines) - tail]))
+                self._cursor = max(0, min(self._cursor, self._lenght - 1))
 
     def set_undo_point(self):
-        try:
-            last_saved = self.undo_list.last_record()[0]
-        except IndexError:
-            last_saved = ''
-            
+        """
+        Groups all the modifications made since last call into a single
+        undo step.  The editor calls it after each command.
+        """
         with self._lock:
-            value = self.string
-            if last_saved != value:	
-                position = self.cursor_lin_col
-                self.undo_list.append((value, position))
+            self.undo_list.close(self.cursor_lin_col)
+
+    def _replay_edits(self, edits):
+        self._undo_flag = False
+        try:
+            for offset, removed, inserted in edits:
+                self._replace_range(offset, offset + len(removed), inserted)
+        finally:
+            self._undo_flag = True
 
     def undo(self):
+        """
+        Reverts the last undo step.  Raises IndexError if there is none.
+        This only costs the size of the reverted modifications.
+        """
         with self:
-#            self.undo_list.skip_next()            # first
-            txt, pos = self.undo_list.pop()    # second
-            if isinstance(txt, str):
-                self.string = txt
-            elif isinstance(txt, list):
-                self._splited_lines = txt
-            else:
-                raise TypeError
-                
-            if isinstance(pos, tuple):
-                self.cursor_lin_col = pos
-            elif isinstance(pos, int):
-                self.cursor = pos
-            else:
-                raise TypeError
-            
+            self.set_undo_point()
+            edits, before, _ = self.undo_list.pop()    # raises
+            self._replay_edits((offset, inserted, removed) for offset, removed, inserted
+                                                           in reversed(edits))
+            self.cursor_lin_col = before
+            self._recognize_known_state()
+
     def redo(self):
+        """
+        Re-applies the last reverted undo step.  Raises IndexError if
+        there is none.
+        """
         with self:
-            txt, pos = self.undo_list.push() # raises
-            self.string = txt
-            self.cursor_lin_col = pos
+            edits, _, after = self.undo_list.push() # raises
+            self._replay_edits(edits)
+            self.cursor_lin_col = after
+            self._recognize_known_state()
+
+    def _recognize_known_state(self):
+        # Undoing or redoing edits gives new generations to a content that
+        # may be the original or the saved one, in which case it gets its
+        # old generation back.  Contents are only compared if the lenghts
+        # match.
+        if self._lenght == self._original_lenght and self._original_hash == self._content_hash():
+            self._edit_generation = self._original_generation
+        elif self._lenght == self._saved_lenght and self._saved_hash is not None \
+                and self._saved_hash == self._content_hash():
+            self._edit_generation = self._saved_generation
+
+    def _content_hash(self):
+        # the same hash as the one computed by _save_away()
+        return _hash_of(self.string)
+
+    def original_string(self):
+        """
+        Returns the text the buffer was opened with, rebuilt by reverting
+        the undo history, or None if the history does not go back that
+        far.
+        """
+        with self._lock:
+            chunks = self._splited_lines.snapshot()
+            undo_list = self.undo_list
+            steps = undo_list.data[:undo_list.pointer]
+            reverted = [list(edits) for edits, _, _ in steps]
+        # the edits are reverted on a copy of the lines, only splicing
+        # the lines each of them modified
+        lines = LineStore(chain.from_iterable(chunks))
+        for edits in reversed(reverted):
+            for offset, removed, inserted in reversed(edits):
+                if not lines:
+                    lines.extend(removed.splitlines(True))
+                    continue
+                stop = offset + len(inserted)
+                first = lines.line_at(offset)
+                last = lines.line_at(stop) if stop < lines.size else len(lines) - 1
+                head = lines[first][:offset - lines.offset_of(first)]
+                tail = lines[last][stop - lines.offset_of(last):]
+                lines[first:last + 1] = f'{head}{removed}{tail}'.splitlines(True)
+        if lines.size != self._original_lenght:
+            return None
+        text = lines.getvalue()
+        if _hash_of(text) == self._original_hash:
+            return text
+        return None
         
     def find_end_of_line(self):
         r"""
@@ -584,10 +852,7 @@ class BaseFile:
         >>> x.find_end_of_line()
         6
         """
-        offset = self.string.find('\n', self.cursor)
-        if offset == -1:
-            return len(self)
-        return offset
+        return self._skip(self.cursor, lambda char: char != '\n')
 
     def find_end_of_word(self):
         r"""
@@ -598,35 +863,24 @@ class BaseFile:
         #>>> # breaks        3    7  11  15  19  23  27                 
         """
         global DELIMS
-        places = set()
         if (start := self.cursor + 2) > len(self):
             return self.cursor
-        for char in DELIMS:
-            loc = self.string[start:].find(char)
-            if loc > -1:
-                loc += self.cursor
-                places.add(loc+1)
-        if places:
-            return min(places)
+        found = self._skip(start, lambda char: char not in DELIMS)
+        if found < len(self):
+            return found - 1
         return self.cursor
 
     def find_end_of_WORD(self):
-        start = self.cursor
-        try:
-            while self.string[start].isspace():
-                start += 1
-
-            start = self.cursor + 2
-            if start > len(self):
-                return self.cursor
-            sp_offset = self.string.find(' ', start)
-            nl_offset = self.string.find('\n', start)
-            offset = min(sp_offset, nl_offset)
-            if offset == -1:
-                return len(self)
-            return start + offset
-        except IndexError:
+        if self._skip(self.cursor, str.isspace) >= len(self):
             return self.cursor
+        start = self.cursor + 2
+        if start > len(self):
+            return self.cursor
+        sp_offset = self._skip(start, lambda char: char != ' ')
+        nl_offset = self._skip(start, lambda char: char != '\n')
+        if max(sp_offset, nl_offset) >= len(self):
+            return len(self)
+        return start + min(sp_offset, nl_offset)
 
     def find_begining_of_line(self):
         with self._lock:
@@ -634,18 +888,14 @@ class BaseFile:
 
     def find_first_non_blank_char_in_line(self):
         pos = self.lines_offsets[self.current_line_idx]
-        stop = pos + len(self.current_line) - 1
-        string = self.string
-        while string[pos].isspace() and pos < stop:
-            pos += 1
-        return pos
+        line = self.current_line
+        index = 0
+        while line[index].isspace() and index < len(line) - 1:
+            index += 1
+        return pos + index
 
     def find_next_non_blank_char(self):
-        pos = self.cursor
-        string = self.string
-        while string[pos].isspace() and pos < len(string):
-            pos += 1
-        return pos
+        return self._skip(self.cursor, str.isspace)
 
     def find_normal_k(self):
         with self._lock:
@@ -653,7 +903,7 @@ class BaseFile:
             if not lin:
                 return 0
             current_line_start = self.lines_offsets[lin]
-            previous_line = self._lines_offsets[lin-1]
+            previous_line = self.lines_offsets[lin-1]
 
             if previous_line + col < current_line_start:
                 return previous_line + col - 1
@@ -679,25 +929,16 @@ class BaseFile:
 
     def find_next_WORD(self):
 #TODO CHeck for end of file
-        cursor = self.cursor +1
-        try:
-            if not self.string[cursor].isspace():
-                while not self.string[cursor].isspace():
-                    cursor += 1
-            while self.string[cursor].isspace():
-                cursor += 1
-        except IndexError:
-            pass
-        finally:
-            return cursor
+        cursor = self._skip(self.cursor + 1, lambda char: not char.isspace())
+        return self._skip(cursor, str.isspace)
 
     def find_first_char_of_word(self):
         if self.cursor == 0:
             return 0
-        elif self.string[self.cursor - 1].isspace():
+        elif self[self.cursor - 1].isspace():
             return self.cursor
         else:
-            return self.string[:self.cursor].rfind(' ') + 1
+            return self._skip(self.cursor - 1, lambda char: char != ' ', backward=True) + 1
 
     def find_normal_B(self):
         lin, col = self.cursor_lin_col
@@ -711,51 +952,29 @@ class BaseFile:
 
     def find_next_non_delim(self):
         global DELIMS
-        cursor = self.cursor
-        try:
-            while self.string[cursor] in DELIMS:
-                cursor +=1
-            return cursor
-        except IndexError:
-            return len(self)
+        return min(self._skip(self.cursor, lambda char: char in DELIMS), len(self))
 
     def find_next_delim(self):
         global DELIMS
         cursor = self.cursor
 
-        if self.string[cursor] in DELIMS:
+        if self[cursor] in DELIMS:
             return self.find_next_non_delim()
 
-        try:
-            while self.string[cursor] not in DELIMS:
-                cursor +=1
-            while self.string[cursor].isspace():
-                cursor +=1
-            return cursor
-        except IndexError:
-            return len(self)
+        cursor = self._skip(cursor, lambda char: char not in DELIMS)
+        return self._skip(cursor, str.isspace)
 
     def find_previous_delim(self):
         global DELIMS
-        cursor = self.cursor
-        while cursor and self.string[cursor] in DELIMS:
-            cursor -= 1
-        while cursor and self.string[cursor] not in DELIMS:
-            cursor -=1
-        return cursor
+        cursor = max(0, self._skip(self.cursor, lambda char: char in DELIMS, backward=True))
+        return max(0, self._skip(cursor, lambda char: char not in DELIMS, backward=True))
 
     def inner_word(self):
         return slice(self.find_previous_delim() + 1, self.find_next_delim())
 
     def inner_WORD(self):
-        start = self.string.rfind(' ', 0, self.cursor + 1)
-        if start == -1:
-            start = 0
-        else:
-            start +=1
-        stop = self.string.find(' ', self.cursor + 1)
-        if stop == -1:
-            stop = len(self.string)
+        start = self._skip(self.cursor, lambda char: char != ' ', backward=True) + 1
+        stop = self._skip(self.cursor + 1, lambda char: char != ' ')
         return slice(start, stop)
 
     def find_next_token(self):
@@ -770,7 +989,71 @@ class BaseFile:
             if off > cursor:
                 return off
 
+    def _skip(self, offset, test, backward=False):
+        """
+        Returns the offset of the first character from offset on (or
+        before it if backward) that does not pass test, or the offset
+        past the end of the buffer (-1 if backward) if they all do.
+        Only the lines that get crossed are read.
+
+        >>> x = BaseFile(init_text='foo  \\n  bar')
+        >>> x._skip(3, str.isspace), x._skip(5, str.isspace, backward=True)
+        (8, 2)
+        """
+        with self._lock:
+            lines = self._splited_lines
+            if not 0 <= offset < self._lenght:
+                return offset
+            lin = lines.line_at(offset)
+            start = lines.offset_of(lin)
+            line = lines[lin]
+            index = offset - start
+            if backward:
+                while True:
+                    while index >= 0 and test(line[index]):
+                        index -= 1
+                    if index >= 0 or not lin:
+                        return start + index
+                    lin -= 1
+                    line = lines[lin]
+                    start -= len(line)
+                    index = len(line) - 1
+            while True:
+                while index < len(line) and test(line[index]):
+                    index += 1
+                if index < len(line) or lin == len(lines) - 1:
+                    return start + index
+                lin += 1
+                start += len(line)
+                line = lines[lin]
+                index = 0
+
+    def _get_range(self, start, stop):
+        """
+        Returns the text between offsets start and stop, only joining the
+        lines holding it.
+        """
+        with self._lock:
+            if self._string:
+                return self._string[start:stop]
+            stop = min(stop, self._lenght)
+            if start >= stop:
+                return ''
+            offsets = self.lines_offsets
+            first = self._offset_to_lin(start)
+            last = self._offset_to_lin(stop - 1)
+            text = ''.join(self._splited_lines.iter_range(first, last + 1))
+            return text[start - offsets[first]:stop - offsets[first]]
+
     def __getitem__(self, key):
+        if isinstance(key, slice) and key.step is None \
+                and (key.start or 0) >= 0 and (key.stop is None or key.stop >= 0):
+            return self._get_range(key.start or 0,
+                                   self._lenght if key.stop is None else key.stop)
+        if isinstance(key, int) and key >= 0:
+            if key >= self._lenght:
+                raise IndexError('buffer index out of range')
+            return self._get_range(key, key + 1)
         return self.string[key]
 
     def __delitem__(self, key):
@@ -780,35 +1063,121 @@ class BaseFile:
                 stop = key + 1
             elif isinstance(key, slice):
                 start  = key.start or 0
-                stop = key.stop or len(self)
+                stop = len(self) if key.stop is None else key.stop
             else:
                 raise TypeError(f'{key = } {type(key) = } expected int or slice.')
 
-            _string = self.string
-            self.string = _string[:start] + _string[stop:]
+            self._replace_range(start, stop, '')
+            self._cursor = max(0, min(self._cursor, self._lenght - 1))
 
     def __setitem__(self, key, value):
         with self:
             if isinstance(key, slice):
                 start = key.start or 0
-                stop = key.stop or len(self)
+                stop = len(self) if key.stop is None else key.stop
             elif isinstance(key, int):
                 start = key
                 stop = start + 1
             else:
                 raise TypeError(f'{key = } {type(key) = } expected int or slice.')
-            self.string = self._string[:start] + value + self._string[stop:]
+            self._replace_range(start, stop, value)
+            self._cursor = max(0, min(self._cursor, self._lenght - 1))
 
 ########    saving mechanism     e#########################################
 
 # Saving mechanism
     def save(self):
+        """
+        Writes the buffer to its path.  The lines are streamed by a
+        background thread to a temporary file next to the target, that
+        gets synced to the disk then renamed over it, so that the file is
+        never left half-written.  The buffer is considered saved as soon
+        as this returns, save_progress tells how far the writing went,
+        and save_error holds the exception if it failed.
+        """
         assert self.path is not None
         self._repr = None
-        self.path.write_text(self.string)
-        self._states.append(self.string)
-        if self._lsp_server:
-            self._lsp_server.text_document_did_save(self._path_as_uri, self.string) 
+        target = self.path.resolve()
+        if target.is_dir():
+            raise IsADirectoryError('cannot write text onto a directory!')
+        temp = target.with_name(f'.{target.name}.vy-save')
+        if (previous := self._saving) is not None:
+            previous.join()
+        file = open(temp, 'w', errors='surrogateescape')
+        with self._lock:
+            chunks = self._splited_lines.snapshot()
+            journal = self._journal
+            if journal is not None and journal.path != target:
+                # written for another file, the next edit starts a new one
+                journal.discard()
+                journal = self._journal = None
+            mark = journal.mark() if journal is not None else 0
+            self._saved_generation = self._edit_generation
+            self._saved_lenght = self._lenght
+            self._saved_hash = None
+            self.save_progress = 0.0
+            self.save_error = None
+            # not a daemon, leaving the editor waits for the file to be written
+            self._saving = Thread(target=self._save_away, name=f'{repr(self)}._save_away()',
+                                  args=(file, temp, target, chunks, self._edit_generation,
+                                        journal, mark),
+                                  daemon=False)
+            self._saving.start()
+        if server := self._lsp_server:
+            self._flush_lsp_changes()
+            # the server allready has the text, unless it asks for it
+            server.text_document_did_save(self._path_as_uri,
+                                          self.string if server.save_includes_text else None)
+
+    def _save_away(self, file, temp, target, chunks, generation, journal=None, mark=0):
+        digest = blake2b(digest_size=16)
+        try:
+            with file:
+                for index, chunk in enumerate(chunks, start=1):
+                    text = ''.join(chunk)
+                    file.write(text)
+                    digest.update(text.encode('utf-8', 'surrogateescape'))
+                    if not index % 256:
+                        self.save_progress = index / len(chunks)
+                        redraw_needed.set()
+                file.flush()
+                fsync(file.fileno())
+            try:
+                chmod(temp, stat(target).st_mode)
+            except FileNotFoundError:
+                pass
+            replace(temp, target)
+        except OSError as exc:
+            self.save_error = exc
+            with self._lock:
+                if self._saved_generation == generation:
+                    self._saved_generation = -1
+            try:
+                unlink(temp)
+            except OSError:
+                pass
+        else:
+            self._saved_hash = digest.digest()
+            if journal is not None:
+                # the edits until mark are in the file now
+                try:
+                    journal.rebase(mark)
+                except OSError:
+                    pass
+        finally:
+            self.save_progress = None
+            redraw_needed.set()
+
+    @property
+    def save_status(self):
+        """
+        A short text telling how the last save is going.
+        """
+        if self.save_progress is not None:
+            return f'saving: {int(100 * self.save_progress)}%'
+        if self.save_error is not None:
+            return f'SAVE FAILED: {self.save_error}'
+        return ''
 
     def save_as(self, new_path, override=False):
         from pathlib import Path
@@ -829,20 +1198,19 @@ class BaseFile:
                 self.save()
             else:
                 raise FileExistsError('Add ! in interface or override=True in *kwargs ....')
-        if self._lsp_server:
-            self._lsp_server.text_document_did_save(self._path_as_uri, self.string) 
 
     @property
     def unsaved(self):
         if not self.modifiable:
             return False
-        if self.path and self.path.exists() and (last_saved := self._states[-1]):
-            return last_saved != self.string != '\n'
-        return self.string != '\n'
+        if self.path and self.path.exists():
+            return self._edit_generation != self._saved_generation
+        # a buffer of one character is empty
+        return self._lenght > 1
 
     def find_normal_l(self):
         try:
-            if self.string[self.cursor+1] != '\n':
+            if self[self.cursor+1] != '\n':
                 return self.cursor + 1
         except IndexError:
             return self.cursor
@@ -850,7 +1218,7 @@ class BaseFile:
     def find_normal_h(self):
         if self.cursor == 0:
             return 0
-        if self.string[self.cursor - 1] == '\n':
+        if self[self.cursor - 1] == '\n':
             return self.cursor
         return self.cursor - 1
 
@@ -897,10 +1265,9 @@ class BaseFile:
 
     @property
     def footer(self):
-        current_state = self._string
-        known_status = self._states
-        return ('( original state )' if current_state == known_status[0]
-                else '( saved )' if current_state == known_status[-1]
+        generation = self._edit_generation
+        return ('( original state )' if generation == self._original_generation
+                else '( saved )' if generation == self._saved_generation
                 else '( edited )') + str(self.undo_list)
 
 
@@ -909,8 +1276,8 @@ class BaseFile:
         return f'file://{self.path}' if self.path else None
 
     def _test_all_assertions(self):
-        assert (_string := self._string) or (_string := ''.join(self._splited_lines))
-        assert (_splited_lines := self._splited_lines) or (_splited_lines := _string.splitlines(True))
+        assert (_string := self._string) or (_string := self._splited_lines.getvalue())
+        assert (_splited_lines := self._splited_lines)
         assert (_number_of_lin := self._number_of_lin)
 
         assert ''.join(_splited_lines) == _string
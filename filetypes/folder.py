@@ -1,10 +1,31 @@
-from vy import keys as k
+"""
+    **************************
+    ****    The Folder    ****
+    **************************
+
+The 'vy.filetypes.folder' module defines the buffer shown when opening a
+directory: the folders leading to it, then its sub-folders and its
+files, the hidden ones last.
+
+The directory is read by a single os.scandir() pass, the type of every
+entry being given by the DirEntry itself, so that no stat() call is
+needed (but for symbolic links).  The lines are only decorated when
+get_raw_screen() asks for them, and the directory is read again, in the
+background, when its modification time changes.
+"""
+from os import getcwd, scandir, stat
 from pathlib import Path
+from threading import Thread
+from time import monotonic
+
+from vy import keys as k
 from vy.filetypes.basefile import BaseFile
+from vy.filetypes.linestore import LineStore
+
 
 def DO_open_file(editor):
     curbuf = editor.current_buffer
-    path = curbuf._values[curbuf.current_line_idx]
+    path = curbuf.entry_at(curbuf.current_line_idx)
     try:
         editor.cache[path]
     except PermissionError as exc:
@@ -26,98 +47,163 @@ def DO_open_file(editor):
 
 def DO_delete_file(editor, *args, **kwargs):
     curbuf = editor.current_buffer
-    path = curbuf._values[curbuf.current_line_idx]
+    path = curbuf.entry_at(curbuf.current_line_idx)
     path: Path
     editor.confirm(f'delete {path} ?')
     path.unlink()
-    curbuf._string = ''
-    curbuf._splited_lines.clear()
-    curbuf.string
+    curbuf.refresh()
     return 'normal'
 
+
+def list_folder(folder):
+    """
+    Returns the sorted names of the sub-folders, the hidden sub-folders,
+    the files and the hidden files of folder.
+    """
+    groups = ([], [], [], [])
+    with scandir(folder) as entries:
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            groups[2 * (not is_dir) + entry.name.startswith('.')].append(entry.name)
+    for group in groups:
+        group.sort()
+    return groups
+
+
+def _shown_as(path, cwd):
+    # relative to the working directory if inside of it, else absolute
+    if path != cwd and path.startswith(cwd) and path[len(cwd)] == '/':
+        return path[len(cwd) + 1:]
+    if cwd == '/' and path != '/':
+        return path[1:]
+    return path
+
+
 class Folder(BaseFile):
-    actions = { 
-        k.CR: DO_open_file, 
+    actions = {
+        k.CR: DO_open_file,
         ':delete_this_file': DO_delete_file,
         }
     unsaved = False
     modifiable = False
-    
-    @property
-    def string(self):
-        from pathlib import Path
-            
-        if not self._string:
-            assert self.path
-            value = []
-            browsing = self.path
-            while browsing != Path('/'):
-                value.append(browsing)
-                browsing = browsing.parent
-            else:
-                value.append(browsing)
-            
-            value.reverse()
-            
-            value.extend(sorted(x for x in self.path.iterdir() if x.is_dir()     and not x.name.startswith('.')))
-            value.extend(sorted(x for x in self.path.iterdir() if x.is_dir()     and     x.name.startswith('.')))
-            value.extend(sorted(x for x in self.path.iterdir() if not x.is_dir() and not x.name.startswith('.')))
-            value.extend(sorted(x for x in self.path.iterdir() if not x.is_dir() and     x.name.startswith('.')))
-
-            self._values = value
-            
-            cwd = self.path.cwd().resolve()
-            pretty = []
-            
-            for pth in self._values:
-                if pth.is_relative_to(cwd) and pth != cwd:
-                    ret = str(pth.relative_to(cwd))
-                else:
-                    ret = str(pth.resolve())
-                    
-                if pth.is_dir():
-                    ret += '/'
-                    
-                if ret.endswith('/') and not ret.startswith('/'):
-                    ret = '\x1b[1m' + ret + '\x1b[22m'
-                else:
-                    ret = '\x1b[3m' + ret + '\x1b[23m'
-                pretty.append(ret)
-            
-            self._string = '\n'.join(iter(pretty))
-            self._lenght = len(self._string)
-        return self._string
 
+    REFRESH_DELAY = 1.0     # seconds between two checks of the mtime
 
-    def get_raw_line(self, index):
-        retval = self.splited_lines[index].removesuffix('\n') + '\x1b[22m'
-        from vy.global_config import BG_COLOR
-        # bug on MacOs
-        BG_COLOR = ''
-        HIGHLIGHT = '\x1b[45m' 
-        HIGHLIGHT = ''
-        if index == self.current_line_idx:
-            return HIGHLIGHT + retval + BG_COLOR
-        else:
-            return retval
+    def __init__(self, path, cursor=0):
+        BaseFile.__init__(self, cursor=0, init_text='\n', path=Path(path))
+        self._ancestors = [*reversed(self.path.parents), self.path]
+        self._names = []
+        self._mtime = None
+        self._checked = monotonic()
+        self._refresher = None
+        self._install(*self._read())
+        self._cursor = min(cursor, self._lenght - 1)
+
+    def _read(self):
+        """
+        Reads the directory, returns (mtime, names, lines).
+        """
+        try:
+            mtime = stat(self.path).st_mtime_ns
+            groups = list_folder(self.path)
+        except OSError:
+            mtime, groups = None, ()
+        cwd = getcwd()
+        lines = []
+        for ancestor in self._ancestors:
+            shown = _shown_as(str(ancestor), cwd)
+            lines.append(shown + '\n' if shown.endswith('/') else shown + '/\n')
+        folder = str(self.path)
+        prefix = '' if folder == cwd else _shown_as(folder, cwd).rstrip('/') + '/'
+        names = []
+        for index, group in enumerate(groups):
+            suffix = '/\n' if index < 2 else '\n'
+            lines.extend([f'{prefix}{name}{suffix}' for name in group])
+            names.extend(group)
+        return mtime, names, lines
+
+    def _install(self, mtime, names, lines):
+        with self._lock:
+            old_number_of_lin = self._number_of_lin
+            lin = self._cursor_lin_col[0] if self._cursor_lin_col else 0
+            self._mtime = mtime
+            self._names = names
+            self.word_set.update(self._splited_lines, lines)
+            self._splited_lines = LineStore(lines)
+            self._number_of_lin = len(lines)
+            self._lenght = sum(map(len, lines))
+            self._string = ''
+            self._current_line = ''
+            self._cursor_lin_col = ()
+            self._cursor = self._splited_lines.offset_of(min(lin, len(lines) - 1))
+            # the listing was not edited, the matches are searched again
+            self.search_index.reset()
+            self._mark_dirty_lines(0, max(old_number_of_lin, len(lines)),
+                                   len(lines) - old_number_of_lin)
+
+    def refresh(self):
+        """
+        Reads the directory again, now.
+        """
+        self._install(*self._read())
+
+    def _refresh_away(self):
+        try:
+            mtime = stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            self.refresh()
+
+    def _refresh_if_needed(self):
+        now = monotonic()
+        if now - self._checked < self.REFRESH_DELAY:
+            return
+        self._checked = now
+        if self._refresher is None or not self._refresher.is_alive():
+            self._refresher = Thread(target=self._refresh_away, daemon=True,
+                                     name=f'{repr(self)}._refresh_away()')
+            self._refresher.start()
+
+    def entry_at(self, index):
+        """
+        Returns the path shown on line index.
+        """
+        with self._lock:
+            ancestors = self._ancestors
+            if index < len(ancestors):
+                return ancestors[index]
+            return self.path / self._names[index - len(ancestors)]
 
     def get_raw_screen(self, min_lin, max_lin):
-        rv = []
-        for index in range(min_lin, max_lin):
-            try:
-                line = self.get_raw_line(index) 
-            except IndexError:
-                line = None
-            finally:
-                rv.append(line)
-        else:
+        self._refresh_if_needed()
+        with self._lock:
             lin, col = self.cursor_lin_col
-            return lin, col, rv 
+            lines = list(self._splited_lines.iter_range(
+                    min_lin, min(max_lin, len(self._splited_lines))))
+        rv = []
+        for line in lines:
+            line = line.removesuffix('\n')
+            if line.endswith('/') and not line.startswith('/'):
+                rv.append('\x1b[1m' + line + '\x1b[22m')
+            else:
+                rv.append('\x1b[3m' + line + '\x1b[23m')
+        rv.extend(None for _ in range(min_lin + len(rv), max_lin))
+        return lin, col, rv
 
-    @property    
+    @property
     def footer(self):
-        return str(self.path.resolve())
+        return f'{self.path} ( {len(self._names)} entries )'
 
+    @property
+    def string(self):
+        if not self._string:
+            with self._lock:
+                self._string = ''.join(self._splited_lines)
+        return self._string
 
     @string.setter
     def string(self, value):
@@ -0,0 +1,213 @@
+"""
+    *****************************
+    ****    The Grep File    ****
+    *****************************
+
+The 'vy.filetypes.grepfile' module defines the buffer that receives the
+results of the ':grep' command.
+
+The project tree is walked by vy.project.walk_project() (so that files
+ignored by git are not searched), and the found files are handed by
+batches to a pool of processes.  Matches are appended to the buffer as
+soon as a batch is done, one line per match, so that the user can read
+and use them while the search goes on.  Nothing blocks the editor.
+
+In this buffer, <CR> opens the file at the match under the cursor, and
+<C-C> cancels the search.
+"""
+from concurrent.futures import FIRST_COMPLETED, wait
+from os import cpu_count
+from pathlib import Path
+from threading import Thread
+
+from vy import keys as k
+from vy.filetypes.basefile import BaseFile
+from vy.filetypes.searchindex import compile_needle
+from vy.project import walk_project, worker_pool
+from vy.utils import redraw_needed
+
+
+def _grep_files(needle, paths):
+    """
+    Returns a list of (path, lin, col, line) for every line of the
+    files in paths that matches needle.  Binary files are skipped.  This
+    function is run by the worker processes.
+    """
+    pattern = compile_needle(needle)
+    hits = []
+    for path in paths:
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except OSError:
+            continue
+        if b'\0' in data[:8192]:
+            continue
+        text = data.decode('utf-8', errors='replace')
+        if pattern.search(text) is None:
+            continue
+        for lin, line in enumerate(text.split('\n'), start=1):
+            if (match := pattern.search(line)) is not None:
+                hits.append((path, lin, match.start() + 1, line))
+    return hits
+
+
+def DO_jump_to_match(editor, *args, **kwargs):
+    curbuf = editor.current_buffer
+    match = curbuf.match_at(curbuf.current_line_idx)
+    if match is None:
+        editor.screen.minibar('no match on this line')
+        return 'normal'
+    path, lin, col = match
+    buffer = editor.edit(path)
+    buffer.cursor_lin_col = (lin - 1, col)
+    return 'normal'
+
+
+def DO_cancel_search(editor, *args, **kwargs):
+    editor.current_buffer.cancel()
+    editor.screen.minibar('search cancelled')
+    return 'normal'
+
+
+class GrepFile(BaseFile):
+    """
+    Buffer listing the matches of a pattern in the files of a folder.
+    """
+    actions = {
+        k.CR: DO_jump_to_match,
+        k.C_C: DO_cancel_search,
+        }
+    unsaved = False
+    modifiable = False
+    set_number = False
+    set_wrap = False
+
+    BATCH_SIZE = 32         # files per task given to the pool
+    MAX_MATCHES = 100_000   # the search stops when that many are found
+    MAX_LINE_LENGTH = 256   # longer matching lines are cut
+
+    def __init__(self, needle, root='.'):
+        self.needle = needle
+        self.root = Path(root).resolve()
+        BaseFile.__init__(self, init_text=f'grep {needle!r} in {self.root}\n')
+        self._undo_flag = False
+        self._matches = [None]
+        self._files_searched = 0
+        self._status = 'searching'
+        self._cancelled = False
+        self._searcher = Thread(target=self._search, daemon=True,
+                                name=f'{repr(self)}._search()')
+        self._searcher.start()
+
+    def cancel(self):
+        """
+        Stops the search, keeping the matches allready found.
+        """
+        if self._status == 'searching':
+            self._cancelled = True
+
+    def match_at(self, index):
+        """
+        Returns the (path, lin, col) of the match shown on line index, or
+        None.
+        """
+        with self._lock:
+            if 0 <= index < len(self._matches):
+                return self._matches[index]
+
+    def _search(self):
+        pool = worker_pool()
+        limit = 4 * (cpu_count() or 1)
+        pending = {}
+        try:
+            batch = []
+            for path in walk_project(self.root, lambda: self._cancelled):
+                batch.append(path)
+                if len(batch) < self.BATCH_SIZE:
+                    continue
+                pending[pool.submit(_grep_files, self.needle, batch)] = len(batch)
+                batch = []
+                if len(pending) >= limit:
+                    self._collect(pending, None)
+            if batch and not self._cancelled:
+                pending[pool.submit(_grep_files, self.needle, batch)] = len(batch)
+            while pending and not self._cancelled:
+                self._collect(pending, 0.1)
+        except Exception as exc:
+            self._status = f'failed: {exc}'
+        finally:
+            # the pool is shared, only this search is cancelled
+            for future in pending:
+                future.cancel()
+            if self._status == 'searching':
+                self._status = 'cancelled' if self._cancelled else 'done'
+            redraw_needed.set()
+
+    def _collect(self, pending, timeout):
+        # pending maps the submitted futures to their number of files
+        done, _ = wait(pending, timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            self._files_searched += pending.pop(future)
+            self._append_matches(future.result())
+
+    def _append_matches(self, matches):
+        if not matches:
+            return
+        root = len(str(self.root)) + 1
+        new_lines = []
+        new_matches = []
+        for path, lin, col, line in matches:
+            prefix = f'{path[root:]}:{lin}:{col}:'
+            line = line.strip().replace('\x1b', '?')[:self.MAX_LINE_LENGTH]
+            new_lines.append(f'{prefix} {line}\n')
+            new_matches.append((path, lin, col))
+        with self._lock:
+            self._replace_range(self._lenght, self._lenght, ''.join(new_lines))
+            self._matches.extend(new_matches)
+            # published on leaving 'with self:', that does not lock an
+            # unmodifiable buffer
+            for change in self._pending_display_changes:
+                self._mark_dirty_lines(*change)
+            self._pending_display_changes.clear()
+        if len(self._matches) > self.MAX_MATCHES:
+            self._status = 'too many matches'
+            self._cancelled = True
+
+    def get_raw_screen(self, min_lin, max_lin):
+        try:
+            cursor_lin, cursor_col = self._cursor_lin_col
+        except ValueError:
+            cursor_lin, cursor_col = self.cursor_lin_col
+
+        with self._lock:
+            lines = list(self._splited_lines.iter_range(
+                    min_lin, min(max_lin, len(self._splited_lines))))
+        raw_line_list = []
+        for index, line in enumerate(lines, start=min_lin):
+            line = line.removesuffix('\n')
+            if index:
+                prefix, _, text = line.partition(': ')
+                line = f'\x1b[35m{prefix}:\x1b[39m {text}'
+            else:
+                line = f'\x1b[1m{line}\x1b[22m'
+            raw_line_list.append(line)
+        raw_line_list.extend(None for _ in range(min_lin + len(raw_line_list), max_lin))
+        return cursor_lin, cursor_col, raw_line_list
+
+    @property
+    def footer(self):
+        found = len(self._matches) - 1
+        return (f'( {self._status}: {found} matches'
+                f' in {self._files_searched} files )')
+
+    @property
+    def string(self):
+        if not self._string:
+            with self._lock:
+                self._string = ''.join(self._splited_lines)
+        return self._string
+
+    @string.setter
+    def string(self, value):
+        return
@@ -0,0 +1,183 @@
+"""
+    *********************************
+    ****    The Jedi Sessions    ****
+    *********************************
+
+The 'vy.filetypes.jedisession' module keeps one Jedi session per python
+project, so that completing in insert mode does not cost a synchronous
+analysis of the whole buffer at every keystroke.
+
+A session owns the jedi.Project of its folder (looked for once, not at
+every call) and a worker thread that runs every Jedi request.  Only the
+latest completion request is kept: a request made while the worker is
+busy replaces the one waiting, so that when the user keeps typing, the
+stale positions are never analysed.  The caller waits COMPLETION_DELAY
+seconds at most, and otherwise gets None.  The late answer is not lost,
+it serves the next keystrokes.
+
+Jedi always gets the path of the buffer, so that parso's diff parser
+only parses again the lines that changed.  Better, as long as the user
+only types more of the word being completed, the previous answer gets
+filtered and Jedi is not asked at all.
+
+>>> from jedi import settings
+>>> brackets, settings.add_bracket_after_function = settings.add_bracket_after_function, False
+>>> code = 'def zzparse(): pass\\nzzpath = zzpart = 1\\nclass Zzpatch: pass\\nzzpa'
+>>> session = JediSession(Project('.'))
+>>> session.complete(code, None, 4, 4, 'zzpa', timeout=60)
+(['zzparse', 'zzpart', 'zzpath', 'Zzpatch'], 4)
+>>> session.complete(code + 't', None, 4, 5, 'zzpat', timeout=0)
+(['zzpath', 'Zzpatch'], 5)
+>>> settings.add_bracket_after_function = brackets
+"""
+from concurrent.futures import Future
+from os.path import abspath, dirname
+from re import compile as _compile
+from threading import Condition, Thread
+from time import monotonic
+
+from jedi import Project, Script, get_default_project
+
+COMPLETION_DELAY = 0.15     # seconds the editor waits for Jedi
+
+_WORD = _compile(r'\w*$')
+
+
+class JediSession:
+    """
+    The Jedi requests made for the python files of a project.
+    """
+    def __init__(self, project):
+        self.project = project
+        self._condition = Condition()
+        self._jobs = []             # (function, future) to run first
+        self._request = None        # the waiting completion request
+        self._generation = 0
+        self._asked = (0, None)     # (generation, context) of the last request
+        self._answer = None         # (generation, context, completions)
+        self._worker = None
+
+    def _post(self, code, path, lin, col, context):
+        with self._condition:
+            self._generation += 1
+            # the waiting request, if any, is stale now
+            self._request = (self._generation, code, path, lin, col, context)
+            self._asked = (self._generation, context)
+            self._wake_up()
+            return self._generation
+
+    def _wake_up(self):
+        if self._worker is None:
+            self._worker = Thread(target=self._work_away, daemon=True,
+                                  name=f'JediSession({str(self.project.path)!r})._work_away()')
+            self._worker.start()
+        self._condition.notify_all()
+
+    def _work_away(self):
+        while True:
+            with self._condition:
+                while not self._jobs and self._request is None:
+                    self._condition.wait()
+                if self._jobs:
+                    function, future = self._jobs.pop(0)
+                    request = None
+                else:
+                    request, self._request = self._request, None
+            if request is None:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(function())
+                    except BaseException as exc:
+                        future.set_exception(exc)
+                continue
+            generation, code, path, lin, col, context = request
+            try:
+                found = self.script(code, path).complete(line=lin, column=col)
+                completions = [(item.name, item.name_with_symbols) for item in found]
+            except Exception:
+                # jedi fails on some code being typed, that is not an error
+                completions = None
+            with self._condition:
+                self._answer = (generation, context, completions)
+                self._condition.notify_all()
+
+    def script(self, code, path):
+        """
+        Returns a jedi.Script of code, to be used by the worker only.
+        """
+        return Script(code=code, path=path, project=self.project)
+
+    def run(self, function):
+        """
+        Runs function() on the worker and returns what it returned, or
+        raises what it raised.
+        """
+        future = Future()
+        with self._condition:
+            self._jobs.append((function, future))
+            self._wake_up()
+        return future.result()
+
+    def warm_up(self, code, path):
+        """
+        Asks the worker to analyse code in the background, so that the
+        first completion does not have to wait for it.
+        """
+        self._post(code, path, 1, 0, None)
+
+    @staticmethod
+    def _serves(asked, context, word):
+        # the answer at the start of a word serves the rest of it
+        return asked is not None and asked[:3] == context and word.startswith(asked[3])
+
+    def _filtered(self, context, word):
+        answer = self._answer
+        if answer is None or answer[2] is None or not self._serves(answer[1], context, word):
+            return None
+        lowered = word.lower()
+        return ([with_symbols for name, with_symbols in answer[2]
+                 if name.lower().startswith(lowered)], len(word))
+
+    def complete(self, code, path, lin, col, line, timeout=COMPLETION_DELAY):
+        """
+        Returns (completions, lenght of the completed prefix) at line lin
+        (counted from 1) and column col (counted from 0) of code, line
+        being the text of that line.  Returns None if Jedi takes more
+        than timeout seconds to answer.  Code may be given as a function
+        returning it, it is only called if Jedi has to be asked.
+        """
+        before = line[:col]
+        word = _WORD.search(before).group()
+        context = (path, lin, before[:len(before) - len(word)])
+        if (found := self._filtered(context, word)) is not None:
+            return found
+        generation, asked = self._asked
+        if not self._serves(asked, context, word) or (
+                self._answer is not None and self._answer[0] >= generation):
+            # not asked yet (or jedi failed on it)
+            generation = self._post(code() if callable(code) else code,
+                                    path, lin, col, (*context, word))
+        deadline = monotonic() + timeout
+        with self._condition:
+            while (answer := self._answer) is None or answer[0] < generation:
+                if (remaining := deadline - monotonic()) <= 0:
+                    return None
+                self._condition.wait(remaining)
+        return self._filtered(context, word)
+
+
+_sessions = {}      # project folder: session
+_folders = {}       # folder of a file: session
+
+def jedi_session(path=None):
+    """
+    Returns the session of the project the file at path belongs to.
+    """
+    folder = dirname(abspath(path)) if path else None
+    if (session := _folders.get(folder)) is None:
+        project = get_default_project(folder)
+        key = str(project.path)
+        if (session := _sessions.get(key)) is None:
+            session = _sessions[key] = JediSession(project)
+        _folders[folder] = session
+    return session
@@ -0,0 +1,310 @@
+"""
+    ***************************
+    ****    The Journal    ****
+    ***************************
+
+The 'vy.filetypes.journal' module keeps, for every modified buffer that
+has a path, an append-only journal of its edits under USER_DIR/journal,
+so that the work can be recovered if the editor (or the machine) dies
+before the buffer is saved.
+
+A journal is a small header, telling what file the edits apply to and
+the size and modification time that file had, followed by one binary
+record per edit: the character offset, the number of removed
+characters, and the inserted text in utf-8.  Recording an edit only
+appends a few bytes to an in-memory buffer, the writing and the fsync
+are done by a background thread every FLUSH_DELAY seconds.
+
+When a save succeeds, the journal starts over from the new file, and it
+gets deleted when the editor is left normally.  Otherwise, the next
+'python -m vy --recover' replays it onto the file.
+
+>>> from tempfile import TemporaryDirectory
+>>> from pathlib import Path
+>>> from vy.filetypes.basefile import BaseFile
+>>> with TemporaryDirectory() as folder:
+...     path = Path(folder) / 'test.txt'
+...     _ = path.write_text('hello\\n')
+...     journal = Journal(path, folder=Path(folder))
+...     journal.record(5, 0, ' world')
+...     journal.flush()
+...     buffer = BaseFile(init_text='hello\\n')
+...     replay(journal.file, buffer)
+...     buffer.string
+1
+'hello world\\n'
+"""
+from hashlib import blake2b
+from os import fsync, replace, stat, unlink
+from struct import Struct
+from threading import Lock, Thread, Event
+from weakref import WeakSet
+
+from vy import global_config
+
+MAGIC = b'VYJ1'
+FLUSH_DELAY = 1.0   # seconds between two writes of the journals
+
+_HEADER = Struct('<qqI')    # base size, base mtime_ns, path lenght
+_RECORD = Struct('<QII')    # offset, removed lenght, inserted lenght
+
+_journals = WeakSet()
+_flusher = None
+_wake_up = Event()
+
+
+def journal_folder():
+    return global_config.USER_DIR / 'journal'
+
+
+def journal_path(path, folder=None):
+    """
+    Returns where the journal of the file at path is kept.
+    """
+    name = blake2b(str(path).encode('utf-8', 'surrogateescape'), digest_size=16).hexdigest()
+    return (folder or journal_folder()) / f'{name}.vyj'
+
+
+def _base_of(path):
+    try:
+        st = stat(path)
+    except OSError:
+        return -1, -1
+    return st.st_size, st.st_mtime_ns
+
+
+def _flush_away():
+    while True:
+        _wake_up.wait(FLUSH_DELAY)
+        _wake_up.clear()
+        for journal in list(_journals):
+            try:
+                journal.flush()
+            except OSError:
+                pass
+
+
+class Journal:
+    """
+    The journal of the edits made to the file at path since it was last
+    read or saved.
+    """
+    __slots__ = ('path', 'file', '_pending', '_lock', '_io_lock',
+                 '_stream', '_written', '__weakref__')
+
+    def __init__(self, path, folder=None):
+        global _flusher
+        self.path = path
+        self.file = journal_path(path, folder)
+        self.file.parent.mkdir(parents=True, exist_ok=True)
+        if self.file.exists():
+            # left by a crash and not recovered, do not lose it
+            replace(self.file, self.file.with_suffix('.crashed'))
+        self._pending = bytearray()
+        self._lock = Lock()
+        self._io_lock = Lock()
+        self._stream = open(self.file, 'wb')
+        self._written = 0
+        self._start(_base_of(path))
+        _journals.add(self)
+        if _flusher is None:
+            _flusher = Thread(target=_flush_away, name='journal._flush_away()', daemon=True)
+            _flusher.start()
+
+    def _start(self, base):
+        encoded = str(self.path).encode('utf-8', 'surrogateescape')
+        header = MAGIC + _HEADER.pack(*base, len(encoded)) + encoded
+        self._stream.write(header)
+        self._stream.flush()
+        fsync(self._stream.fileno())
+        self._written = len(header)
+
+    def record(self, offset, removed, inserted):
+        """
+        Records that removed characters were replaced by the text
+        inserted at offset.  This costs a few microseconds, the record
+        is written to the disk later.
+        """
+        data = inserted.encode('utf-8', 'surrogateescape')
+        with self._lock:
+            self._pending += _RECORD.pack(offset, removed, len(data))
+            self._pending += data
+
+    def mark(self):
+        """
+        Returns the position in the journal of the next edit.
+        """
+        with self._lock:
+            return self._written + len(self._pending)
+
+    def flush(self):
+        """
+        Writes the recorded edits and syncs them to the disk.
+        """
+        with self._io_lock:
+            with self._lock:
+                if not self._pending or self._stream is None:
+                    return
+                data, self._pending = self._pending, bytearray()
+                self._written += len(data)
+            self._stream.write(data)
+            self._stream.flush()
+            fsync(self._stream.fileno())
+
+    def rebase(self, mark):
+        """
+        Starts the journal over from the file just saved, keeping the
+        edits recorded since mark (made while it was being written).
+        """
+        self.flush()
+        with self._io_lock:
+            if self._stream is None:
+                return
+            with open(self.file, 'rb') as old:
+                old.seek(mark)
+                kept = old.read()
+            self._stream.close()
+            temp = self.file.with_suffix('.new')
+            self._stream = open(temp, 'wb')
+            self._start(_base_of(self.path))
+            with self._lock:
+                self._stream.write(kept)
+                self._stream.flush()
+                fsync(self._stream.fileno())
+                self._written += len(kept)
+            replace(temp, self.file)
+
+    def discard(self):
+        """
+        Deletes the journal, its edits being saved or given up.
+        """
+        _journals.discard(self)
+        with self._io_lock:
+            if self._stream is None:
+                return
+            self._stream.close()
+            self._stream = None
+            try:
+                unlink(self.file)
+            except OSError:
+                pass
+
+
+class _NoJournal:
+    """
+    Stands for the journal of a buffer when it cannot be written, so that
+    the failure does not get retried at every edit.
+    """
+    __slots__ = ('path',)
+
+    def __init__(self, path):
+        self.path = path
+
+    def record(self, offset, removed, inserted):
+        pass
+
+    def mark(self):
+        return 0
+
+    def rebase(self, mark):
+        pass
+
+    def discard(self):
+        pass
+
+
+def open_journal(path):
+    """
+    Returns a new journal for the file at path, or an object doing
+    nothing if it cannot be written.
+    """
+    try:
+        return Journal(path)
+    except OSError:
+        return _NoJournal(path)
+
+
+def flush_journals():
+    """
+    Writes every recorded edit right now, use it before a crash.
+    """
+    for journal in list(_journals):
+        try:
+            journal.flush()
+        except OSError:
+            pass
+
+
+def discard_journals():
+    """
+    Deletes every journal, when leaving the editor normally.
+    """
+    for journal in list(_journals):
+        journal.discard()
+
+
+def read_journal(file):
+    """
+    Returns (path, base, edits) as recorded in a journal file, base being
+    the (size, mtime_ns) the edited file had.  A record cut by a crash
+    is ignored.
+    """
+    data = file.read_bytes()
+    if not data.startswith(MAGIC):
+        raise ValueError(f'{file} is not a journal')
+    position = len(MAGIC)
+    size, mtime, lenght = _HEADER.unpack_from(data, position)
+    position += _HEADER.size
+    path = data[position:position + lenght].decode('utf-8', 'surrogateescape')
+    position += lenght
+    edits = []
+    while position + _RECORD.size <= len(data):
+        offset, removed, lenght = _RECORD.unpack_from(data, position)
+        position += _RECORD.size
+        if position + lenght > len(data):
+            break
+        edits.append((offset, removed,
+                      data[position:position + lenght].decode('utf-8', 'surrogateescape')))
+        position += lenght
+    return path, (size, mtime), edits
+
+
+def find_journals(folder=None):
+    """
+    Returns a dict {path: journal file} of the journals left by the
+    previous sessions.  A crashed journal is only given if there is no
+    newer one for the same path.
+    """
+    folder = folder or journal_folder()
+    found = {}
+    for pattern in ('*.crashed', '*.vyj'):
+        for file in sorted(folder.glob(pattern)):
+            if any(journal.file == file for journal in _journals):
+                continue
+            try:
+                path, _, _ = read_journal(file)
+            except (OSError, ValueError, UnicodeError):
+                continue
+            found[path] = file
+    return found
+
+
+def replay(file, buffer):
+    """
+    Applies the edits of the journal file onto buffer, that must hold the
+    content of the file it was made for.  Returns the number of replayed
+    edits, or raises ValueError if the file changed since.
+    """
+    path, base, edits = read_journal(file)
+    if base != _base_of(path):
+        raise ValueError(f'{path} was modified since its journal was written')
+    with buffer:
+        for offset, removed, inserted in edits:
+            buffer._replace_range(offset, offset + removed, inserted)
+        buffer.set_undo_point()
+    # the edits now belong to the journal of buffer
+    try:
+        unlink(file.with_suffix('.crashed'))
+    except OSError:
+        pass
+    return len(edits)
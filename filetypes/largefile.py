@@ -0,0 +1,89 @@
+"""
+    ******************************
+    ****    The Large File    ****
+    ******************************
+
+The 'vy.filetypes.largefile' module defines the buffer used by Open_path
+for files bigger than global_config.LARGE_FILE_SIZE.
+
+Such a file is never read as a whole.  It is memory-mapped and handed to
+a MappedLineStore whose newline index is built by a background thread,
+so the first screen only needs the first block of the file to be
+indexed.  Only the lines the screen asks for get decoded, and modified
+lines are kept as an overlay on top of the mapped bytes until the buffer
+gets saved.
+
+There is no syntax highlighting, nor language server, for large files.
+"""
+from mmap import mmap, ACCESS_READ
+from threading import Thread
+
+from vy.filetypes.basefile import BaseFile
+from vy.filetypes.linestore import MappedLineStore
+
+
+class LargeFile(BaseFile):
+    """
+    Buffer for files too big to be loaded in memory.
+    """
+    modifiable = True
+    set_number = False
+
+    def __init__(self, path, cursor=0):
+        BaseFile.__init__(self, cursor=0, init_text='\n', path=path)
+        with open(path, 'rb') as file:
+            self._mapping = mmap(file.fileno(), 0, access=ACCESS_READ)
+
+        store = MappedLineStore(self._mapping)
+        store.index_blocks(1)
+
+        self._string = ''
+        self._splited_lines = store
+        self._number_of_lin = len(store)
+        self._lenght = store.size
+        self._cursor_lin_col = ()
+        self._cursor = min(cursor, self._lenght - 1)
+        self.cursor_lin_col
+        self._indexer = Thread(target=self._index_away, args=(store,),
+                               name=f'{repr(self)}._index_away()', daemon=True)
+        self._indexer.start()
+
+    def _index_away(self, store):
+        more = True
+        while more:
+            with self._lock:
+                if self._splited_lines is not store:
+                    # the whole content has been replaced
+                    return
+                known_lines = len(store)
+                more = store.index_blocks(256)
+                self._string = ''
+                self._number_of_lin = len(store)
+                self._lenght = store.size
+                self._mark_dirty_lines(known_lines - 1, self._number_of_lin,
+                                       self._number_of_lin - known_lines)
+
+    def get_raw_screen(self, min_lin, max_lin):
+        try:
+            cursor_lin, cursor_col = self._cursor_lin_col
+        except ValueError:
+            cursor_lin = cursor_col = -1
+
+        local_split = self._splited_lines
+        if not local_split:
+            raise RuntimeError('_splited_lines is empty')
+
+        raw_line_list = [line.replace('\n', ' ') for line in
+                         local_split.iter_range(min_lin, min(max_lin, len(local_split)))]
+        raw_line_list.extend(None for _ in range(min_lin + len(raw_line_list), max_lin))
+        return cursor_lin, cursor_col, raw_line_list
+
+    @property
+    def footer(self):
+        store = self._splited_lines
+        progress = (f'( indexing {store.indexed_ratio:.0%} )'
+                    if isinstance(store, MappedLineStore) and store.indexed_ratio < 1
+                    else '')
+        edited = self._edit_generation != self._saved_generation
+        return (progress + ('( edited )' if edited else '( saved )')
+                + str(self.undo_list))
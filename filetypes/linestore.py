@@ -0,0 +1,569 @@
+r"""
+    ********************************
+    ****    The Line Storage    ****
+    ********************************
+
+The 'vy.filetypes.linestore' module contains the data structure holding
+the text of a buffer.
+
+A LineStore behaves like the list of the lines of a buffer (each of them
+ending with a newline), but keeps them in small chunks of a few hundreds
+lines.  Replacing, inserting or deleting lines, even in a huge buffer,
+only touches the chunks holding them, and a flat string of the whole
+buffer is only built when getvalue() is explicitly called.
+
+It also indexes the lines by their offsets: the number of lines and of
+characters of every chunk are kept in two Fenwick trees, and the offsets
+of the lines of a chunk are only summed when needed and cached until the
+chunk gets modified.  Finding the offset of a line, or the line holding
+an offset, costs O(log n) plus a bisection inside a single chunk.
+
+>>> store = LineStore.from_string('foo\nbar\nbaz\n')
+>>> store[1]
+'bar\n'
+>>> store[1:3] = ['BAR\n', 'BAZ\n', 'QUX\n']
+>>> len(store)
+4
+>>> store.getvalue()
+'foo\nBAR\nBAZ\nQUX\n'
+>>> store.offset_of(2)
+8
+>>> store.line_at(9)
+2
+"""
+from _thread import allocate_lock
+from bisect import bisect_right
+from itertools import accumulate, chain, islice
+
+
+class Fenwick:
+    """
+    A Fenwick tree (binary indexed tree) of integers.
+
+    It behaves like a list of integers that can only be modified by
+    adding to one of its values, and answers prefix sums queries.
+    Updating a value or summing a prefix both cost O(log n).
+
+    >>> tree = Fenwick([3, 1, 4, 1, 5])
+    >>> tree.prefix(3)
+    8
+    >>> tree.add(1, 10)
+    >>> tree.prefix(3)
+    18
+    >>> tree.find(17)
+    (2, 14)
+    """
+    __slots__ = ('_tree', '_values')
+
+    def __init__(self, values=()):
+        values = list(values)
+        tree = [0]
+        tree.extend(values)
+        size = len(tree)
+        for index in range(1, size):
+            parent = index + (index & -index)
+            if parent < size:
+                tree[parent] += tree[index]
+        self._tree = tree
+        self._values = values
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getitem__(self, index):
+        return self._values[index]
+
+    def add(self, index, delta):
+        """
+        Adds delta to the value at index.
+        """
+        self._values[index] += delta
+        tree = self._tree
+        size = len(tree)
+        index += 1
+        while index < size:
+            tree[index] += delta
+            index += index & -index
+
+    def prefix(self, index):
+        """
+        Returns the sum of the index first values.
+        """
+        tree = self._tree
+        total = 0
+        while index > 0:
+            total += tree[index]
+            index -= index & -index
+        return total
+
+    def find(self, target):
+        """
+        Returns a tuple (index, prefix(index)) where index is the position
+        of the value that «contains» target, this means the last index
+        for which prefix(index) <= target.  Values must not be negative.
+        """
+        tree = self._tree
+        size = len(tree)
+        position = 0
+        remaining = target
+        step = 1 << (size.bit_length() - 1)
+        while step:
+            forward = position + step
+            if forward < size and tree[forward] <= remaining:
+                position = forward
+                remaining -= tree[forward]
+            step >>= 1
+        return position, target - remaining
+
+
+class LineStore:
+    """
+    A mutable sequence of lines stored as a list of chunks.
+
+    It supports most of the list api (indexing, slicing, slice assignment,
+    insert(), pop(), clear(), copy()...) so that it can be used in place
+    of the list returned by str.splitlines(True).  Slices must be
+    contiguous (no step).
+    """
+    __slots__ = ('_chunks', '_counts', '_sizes', '_local', '_number_of_lin', '_shared')
+
+    CHUNK_SIZE = 512
+
+    def __init__(self, lines=()):
+        if not isinstance(lines, list):
+            lines = list(lines)
+        self._chunks = self._make_chunks(lines)
+        self._shared = set()
+        self._reindex()
+
+    @classmethod
+    def from_string(cls, string):
+        return cls(string.splitlines(True))
+
+    def _make_chunks(self, lines):
+        size = self.CHUNK_SIZE
+        if len(lines) <= size:
+            return [lines] if lines else []
+        return [lines[idx:idx + size] for idx in range(0, len(lines), size)]
+
+    def _reindex(self, sizes=None):
+        """
+        Rebuilds the indexes from the chunks.  Sizes is the list of the
+        number of characters of each chunk, if allready known.
+        """
+        chunks = self._chunks
+        if sizes is None:
+            sizes = [sum(map(len, chunk)) for chunk in chunks]
+        counts = Fenwick(map(len, chunks))
+        self._local = [None] * len(chunks)
+        self._counts, self._sizes = counts, Fenwick(sizes)
+        self._number_of_lin = counts.prefix(len(chunks))
+
+    def _writable(self, chunk_idx):
+        """
+        Returns the chunk at chunk_idx, ready to be modified in place.
+        """
+        chunk = self._chunks[chunk_idx]
+        if id(chunk) in self._shared:
+            # a snapshot still holds it
+            self._shared.discard(id(chunk))
+            chunk = self._chunks[chunk_idx] = list(chunk)
+        return chunk
+
+    def _too_small(self, chunk):
+        """
+        Tells if a chunk should be merged with one of its neighbours.
+        """
+        return len(chunk) < self.CHUNK_SIZE // 4
+
+    def _local_offsets(self, chunk_idx):
+        """
+        Returns the offsets of the lines of a chunk, relative to the
+        beginning of this chunk.
+        """
+        local = self._local[chunk_idx]
+        if local is None:
+            local = self._local[chunk_idx] = list(accumulate(map(len, self._chunks[chunk_idx]), initial=0))
+        return local
+
+    def _locate(self, index):
+        """
+        Returns (chunk_idx, local_idx) of the line at index.  Index must be
+        a valid (positive) line number.
+        """
+        chunk_idx, before = self._counts.find(index)
+        return chunk_idx, index - before
+
+    def _locate_end(self, index):
+        """
+        Returns (chunk_idx, local_idx) such that the chunk at chunk_idx
+        ends its slice just before line number index.
+        """
+        if index == 0:
+            return 0, 0
+        chunk_idx, local_idx = self._locate(index - 1)
+        return chunk_idx, local_idx + 1
+
+    def _normalize(self, index):
+        if index < 0:
+            index += self._number_of_lin
+        if not 0 <= index < self._number_of_lin:
+            raise IndexError('LineStore index out of range')
+        return index
+
+    def _slice_bounds(self, key):
+        start, stop, step = key.indices(self._number_of_lin)
+        if step != 1:
+            raise ValueError('LineStore only supports contiguous slices')
+        return start, max(start, stop)
+
+    def __len__(self):
+        return self._number_of_lin
+
+    @property
+    def size(self):
+        """
+        Total number of characters.
+        """
+        return self._sizes.prefix(len(self._chunks))
+
+    @property
+    def offsets(self):
+        """
+        A read-only sequence of the offsets of the beginning of lines.
+        """
+        return LineOffsets(self)
+
+    def offset_of(self, index):
+        """
+        Returns the offset of the beginning of the line at index.
+        """
+        chunk_idx, local_idx = self._locate(self._normalize(index))
+        return self._sizes.prefix(chunk_idx) + self._local_offsets(chunk_idx)[local_idx]
+
+    def line_at(self, offset):
+        """
+        Returns the index of the line holding the character at offset.
+        Offsets past the end are considered to be on the last line.
+        """
+        if not self._number_of_lin:
+            raise IndexError('LineStore is empty')
+        chunk_idx, before = self._sizes.find(max(0, offset))
+        if chunk_idx == len(self._chunks):
+            return self._number_of_lin - 1
+        local_idx = bisect_right(self._local_offsets(chunk_idx), offset - before) - 1
+        return self._counts.prefix(chunk_idx) + local_idx
+
+    def __bool__(self):
+        return self._number_of_lin != 0
+
+    def __iter__(self):
+        return chain.from_iterable(self._chunks)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self._number_of_lin} lines in {len(self._chunks)} chunks)'
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop = self._slice_bounds(key)
+            return list(self.iter_range(start, stop))
+        chunk_idx, local_idx = self._locate(self._normalize(key))
+        return self._chunks[chunk_idx][local_idx]
+
+    def __setitem__(self, key, value):
+        if isinstance(key, slice):
+            start, stop = self._slice_bounds(key)
+            self.replace(start, stop, value)
+        else:
+            chunk_idx, local_idx = self._locate(self._normalize(key))
+            chunk = self._writable(chunk_idx)
+            self._sizes.add(chunk_idx, len(value) - len(chunk[local_idx]))
+            self._local[chunk_idx] = None
+            chunk[local_idx] = value
+
+    def __delitem__(self, key):
+        if isinstance(key, slice):
+            start, stop = self._slice_bounds(key)
+        else:
+            start = self._normalize(key)
+            stop = start + 1
+        self.replace(start, stop, ())
+
+    def iter_range(self, start, stop):
+        """
+        Iterates over the lines[start:stop] without copying the whole
+        buffer.
+        """
+        if start >= stop:
+            return iter(())
+        chunk_idx, local_idx = self._locate(start)
+        lines = chain.from_iterable(islice(self._chunks, chunk_idx, None))
+        return islice(lines, local_idx, local_idx + stop - start)
+
+    def replace(self, start, stop, lines):
+        """
+        Replaces lines[start:stop] by the given lines.  Only the chunks
+        that hold the replaced lines get modified.
+        """
+        if not isinstance(lines, list):
+            lines = list(lines)
+        chunks = self._chunks
+        if not chunks:
+            self.__init__(lines)
+            return
+
+        first, first_local = self._locate(start) if start < self._number_of_lin \
+                             else (len(chunks) - 1, len(chunks[-1]))
+        last, last_local = self._locate_end(stop) if stop > start else (first, first_local)
+
+        if first == last:
+            chunk = self._writable(first)
+            size_delta = sum(map(len, lines)) - sum(map(len, chunk[first_local:last_local]))
+            chunk[first_local:last_local] = lines
+            if not chunk or len(chunk) > 2 * self.CHUNK_SIZE or \
+                    (len(chunks) > 1 and self._too_small(chunk)):
+                sizes = self._sizes._values.copy()
+                sizes[first] += size_delta
+                self._rechunk(first, first + 1, chunk, sizes)
+            else:
+                delta = len(lines) - (last_local - first_local)
+                self._counts.add(first, delta)
+                self._sizes.add(first, size_delta)
+                self._local[first] = None
+                self._number_of_lin += delta
+        else:
+            merged = chunks[first][:first_local]
+            merged.extend(lines)
+            merged.extend(chunks[last][last_local:])
+            self._rechunk(first, last + 1, merged, self._sizes._values.copy())
+
+    def _rechunk(self, start, stop, lines, sizes):
+        """
+        Replaces the chunks[start:stop] by new chunks holding lines, then
+        merges the last of them with its neighbour if it got too small,
+        so that deletions do not fragment the store.  Sizes is the list of
+        the sizes of the chunks, only the replaced ones get recomputed.
+        """
+        chunks = self._chunks
+        new_chunks = self._make_chunks(lines)
+        chunks[start:stop] = new_chunks
+        sizes[start:stop] = [sum(map(len, chunk)) for chunk in new_chunks]
+        last = start + len(new_chunks) - 1
+        if new_chunks and len(chunks) > 1 and self._too_small(chunks[last]):
+            if last + 1 == len(chunks):
+                last -= 1
+            merged = chunks[last] + chunks[last + 1]
+            new_chunks = self._make_chunks(merged)
+            chunks[last:last + 2] = new_chunks
+            sizes[last:last + 2] = [sum(map(len, chunk)) for chunk in new_chunks]
+        self._reindex(sizes)
+
+    def insert(self, index, line):
+        index = min(max(0, index + self._number_of_lin if index < 0 else index), self._number_of_lin)
+        self.replace(index, index, (line,))
+
+    def append(self, line):
+        self.replace(self._number_of_lin, self._number_of_lin, (line,))
+
+    def extend(self, lines):
+        self.replace(self._number_of_lin, self._number_of_lin, lines)
+
+    def pop(self, index=-1):
+        index = self._normalize(index)
+        value = self[index]
+        self.replace(index, index + 1, ())
+        return value
+
+    def clear(self):
+        self._chunks = []
+        self._reindex([])
+
+    def copy(self):
+        return list(self)
+
+    def snapshot(self):
+        """
+        Returns a list of chunks of lines holding the current content,
+        that later modifications of the store leave untouched.  Only the
+        list of the chunks is copied, a chunk being copied later if it
+        gets modified.
+        """
+        self._shared = set(map(id, self._chunks))
+        return list(self._chunks)
+
+    def getvalue(self):
+        """
+        Returns the whole content as a single string.
+        """
+        return ''.join(chain.from_iterable(self._chunks))
+
+
+class LineOffsets:
+    """
+    A read-only view over the offsets of the lines of a LineStore.
+
+    It behaves like the list of the offsets of the beginning of the lines
+    (first line starts at 0) without ever being built.
+    """
+    __slots__ = ('_store',)
+
+    def __init__(self, store):
+        self._store = store
+
+    def __len__(self):
+        return len(self._store)
+
+    def __bool__(self):
+        return bool(self._store)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._store.offset_of(idx) for idx in range(*index.indices(len(self._store)))]
+        return self._store.offset_of(index)
+
+    def __iter__(self):
+        offset = 0
+        for line in self._store:
+            yield offset
+            offset += len(line)
+
+
+class _MappedChunk:
+    """
+    A chunk of lines that has not been modified yet, and that is decoded
+    from the mapped file every time it is needed.  It is read-only.
+    """
+    __slots__ = ('_store', 'start', 'stop', '_number_of_lin')
+
+    def __init__(self, store, start, stop, number_of_lin):
+        self._store = store
+        self.start = start
+        self.stop = stop
+        self._number_of_lin = number_of_lin
+
+    def lines(self):
+        return self._store._decode(self)
+
+    def __len__(self):
+        return self._number_of_lin
+
+    def __getitem__(self, key):
+        return self.lines()[key]
+
+    def __iter__(self):
+        return iter(self.lines())
+
+    def __add__(self, other):
+        return self.lines() + list(other)
+
+    def __radd__(self, other):
+        return list(other) + self.lines()
+
+
+class MappedLineStore(LineStore):
+    """
+    A LineStore whose lines are read from a memory-mapped file.
+
+    The mapped bytes are indexed by blocks of BLOCK_SIZE bytes (cut on a
+    newline) by calling index_blocks() until it returns False.  Each
+    block becomes a chunk that is only decoded when one of its lines is
+    read, and only the last decoded chunks are kept in memory.  Modified
+    chunks are decoded once and for all and become regular chunks, so
+    that edits are an overlay on top of the mapped file.
+    """
+    __slots__ = ('_data', '_encoding', '_indexed', '_decoded', '_decoded_lock')
+
+    BLOCK_SIZE = 64 * 1024
+    DECODED_CHUNKS = 64
+
+    def __init__(self, data, encoding='utf-8'):
+        self._data = data
+        self._encoding = encoding
+        self._indexed = 0
+        self._decoded = {}
+        self._decoded_lock = allocate_lock()
+        LineStore.__init__(self)
+
+    @property
+    def indexed_ratio(self):
+        """
+        Proportion of the mapped file allready indexed.
+        """
+        return self._indexed / len(self._data) if len(self._data) else 1.0
+
+    def _decode_bytes(self, start, stop):
+        text = str(self._data[start:stop], self._encoding, 'surrogateescape')
+        lines = text.split('\n')
+        last = lines.pop()
+        lines = [line + '\n' for line in lines]
+        if last:
+            lines.append(last)
+        return lines
+
+    def _decode(self, chunk):
+        with self._decoded_lock:
+            lines = self._decoded.pop(chunk, None)
+            if lines is not None:
+                self._decoded[chunk] = lines
+                return lines
+        lines = self._decode_bytes(chunk.start, chunk.stop)
+        with self._decoded_lock:
+            self._decoded[chunk] = lines
+            while len(self._decoded) > self.DECODED_CHUNKS:
+                del self._decoded[next(iter(self._decoded))]
+        return lines
+
+    def index_blocks(self, max_blocks):
+        """
+        Indexes at most max_blocks more blocks of the mapped file, and
+        appends them to the store.  Returns False once the whole file has
+        been indexed.
+        """
+        data = self._data
+        size = len(data)
+        start = self._indexed
+        chunks = []
+        sizes = []
+        while start < size and len(chunks) < max_blocks:
+            stop = data.find(b'\n', start + self.BLOCK_SIZE) + 1 or size
+            block = data[start:stop]
+            number_of_lin = block.count(b'\n')
+            if not block.endswith(b'\n'):
+                number_of_lin += 1
+            chunks.append(_MappedChunk(self, start, stop, number_of_lin))
+            sizes.append(len(str(block, self._encoding, 'surrogateescape')))
+            start = stop
+        if chunks:
+            self._chunks = self._chunks + chunks
+            self._reindex(self._sizes._values + sizes)
+        self._indexed = start
+        return start < size
+
+    def _writable(self, chunk_idx):
+        chunk = self._chunks[chunk_idx]
+        if isinstance(chunk, _MappedChunk):
+            mapped, chunk = chunk, list(chunk.lines())
+            self._chunks[chunk_idx] = chunk
+            with self._decoded_lock:
+                self._decoded.pop(mapped, None)
+            return chunk
+        return LineStore._writable(self, chunk_idx)
+
+    def snapshot(self):
+        """
+        Same as LineStore.snapshot(), the part of the file not indexed
+        yet being cut into chunks that are not added to the store.
+        """
+        chunks = LineStore.snapshot(self)
+        data = self._data
+        start = self._indexed
+        while start < len(data):
+            stop = data.find(b'\n', start + self.BLOCK_SIZE) + 1 or len(data)
+            chunks.append(_MappedChunk(self, start, stop, 0))
+            start = stop
+        return chunks
+
+    def _too_small(self, chunk):
+        # chunks are as big as the blocks of the mapped file, merging them
+        # would decode all the file after a few edits.
+        return not chunk
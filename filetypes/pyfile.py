@@ -1,11 +1,48 @@
 from vy.filetypes.textfile import TextFile
 from vy.filetypes import _register_extension
-from functools import lru_cache
+from vy.filetypes.syntaxcheck import SyntaxChecker
+from vy.symbols import identifier_at, symbol_index, update_symbols
+from vy.utils import redraw_needed
+from itertools import chain
+from threading import Thread
+from time import sleep
+
+def _symbol_definitions(curbuf):
+    lin, col = curbuf.cursor_lin_col
+    line = curbuf.current_line
+    name, start = identifier_at(line, col - 1)
+    if not name:
+        return name, []
+    attribute = line[:start].rstrip().endswith('.')
+    return name, symbol_index().lookup(name, curbuf.path, attribute)
+
+def _jump_to_definition(editor, definition):
+    path, qualname, kind, lin, col = definition
+    buffer = editor.edit(path)
+    buffer.cursor_lin_col = lin - 1, col + 1
+    editor.actions.normal('zz')
+
+def DO_goto_symbol_definition(editor, *args, **kwargs):
+    curbuf: SimplePyFile = editor.current_buffer
+    name, found = _symbol_definitions(curbuf)
+    if not name:
+        editor.screen.minibar('no symbol under cursor.')
+    elif not found:
+        index = symbol_index()
+        status = '' if index.ready else ' ( the project is still being indexed )'
+        editor.screen.minibar(f'no definition of {name} found!{status}')
+    else:
+        _jump_to_definition(editor, found[0])
+        if len(found) > 1:
+            editor.screen.minibar(f'{len(found)} definitions of {name}, use :tag {name} <TAB> to choose.')
 
 @_register_extension('.py')
 class SimplePyFile(TextFile):
-    actions = {}
-    # new empty dict to avoid poluting the inherited
+    actions = {
+        ':goto_declaration': DO_goto_symbol_definition,
+        'gd': DO_goto_symbol_definition,
+        }
+    # new dict to avoid poluting the inherited
     # one from TextFile base class.
     
     set_wrap = False
@@ -17,6 +54,17 @@ class SimplePyFile(TextFile):
     _lsp_server = ['pylsp']
     _lsp_lang_id = 'python'
 
+    def save(self):
+        super().save()
+        # the symbols index reads the file once it is written
+        Thread(target=self._update_symbols_away, args=(self._saving,),
+               name=f'{repr(self)}._update_symbols_away()', daemon=True).start()
+
+    def _update_symbols_away(self, saving):
+        saving.join()
+        if self.save_error is None:
+            update_symbols(self.path)
+
     def lexer(self, code):
         KEYWORDS = {
             "False","None","True","and","as","assert","async","await","break","class","continue",
@@ -214,36 +262,46 @@ class SimplePyFile(TextFile):
         yield (n, "", "")
         #eof
 
-try:
-    import parso
-except ImportError:
-    @_register_extension('.py')
-    class PyFile(SimplePyFile):
-        pass
-else:
-    @_register_extension('.py')
-    class PyFile(SimplePyFile):
-        def _has_syntax_errors(self):
-            if self._async_tasks.must_stop:
-                return '( not parsed, no async )'
-            if string := self._string:
-                return self._cached_has_syntax_errors(string)
-            return '( not parsed, no value )'
-
-        @lru_cache(127)
-        def _cached_has_syntax_errors(self, string):
-            grammar = parso.load_grammar()
-            try:
-                parsed = grammar.parse(string, error_recovery=False)
-                for err in grammar.iter_errors(parsed):
-                    return f'( lexical error! line {err.start_pos[0] - 1}: {err.message} )'
-            except parso.ParserSyntaxError as err:
-                return f'( parsing error! line {err.error_leaf.start_pos[0] - 1}: {err.message} )'
-            return '( no syntax error )'
+@_register_extension('.py')
+class PyFile(SimplePyFile):
+    CHECK_DELAY = 0.3   # seconds without edits before checking the syntax
+
+    _diagnostics = (None, '( not parsed yet )')     # (generation, message)
+    _checker = None
+    _checking = None
+
+    def _check_if_needed(self):
+        if self._diagnostics[0] != self._edit_generation and (
+                self._checking is None or not self._checking.is_alive()):
+            self._checking = Thread(target=self._check_away, daemon=True,
+                                    name=f'{repr(self)}._check_away()')
+            self._checking.start()
+
+    def _check_away(self):
+        if self._checker is None:
+            self._checker = SyntaxChecker()
+        while True:
+            generation = self._edit_generation
+            sleep(self.CHECK_DELAY)
+            if generation != self._edit_generation:
+                continue    # still being edited
+            with self._lock:
+                generation = self._edit_generation
+                chunks = self._splited_lines.snapshot()
+            error = self._checker.check(list(chain.from_iterable(chunks)))
+            if error is None:
+                self._diagnostics = (generation, '( no syntax error )')
+            else:
+                self._diagnostics = (generation, f'( syntax error! line {error[0]}: {error[1]} )')
+            redraw_needed.set()
+            if generation == self._edit_generation:
+                return
 
-        @property
-        def footer(self):
-            return self._has_syntax_errors() + super().footer
+    @property
+    def footer(self):
+        # the syntax is checked in the background, never while printing
+        self._check_if_needed()
+        return self._diagnostics[1] + super().footer
 
 
 try:
@@ -256,6 +314,7 @@ try:
     from jedi import Interpreter
     from jedi.api.exceptions import RefactoringError
     from jedi import settings
+    from vy.filetypes.jedisession import jedi_session
     
     settings.add_bracket_after_function = True
     settings.case_insensitive_completion = True
@@ -264,18 +323,33 @@ try:
 except ImportError:
     pass
 else:
+    # The Jedi objects are not to be used out of the worker of the
+    # session, so every action gives it a function doing the whole job
+    # and only gets back paths, positions and strings.
+
+    def _changed_files(refactoring):
+        return {path: new_version.get_new_code()
+                for path, new_version in refactoring.get_changed_files().items()}
+
     def DO_goto_declaration_under_cursor(editor, *args, **kwargs):
         curbuf: PyFile = editor.current_buffer
+        name, found = _symbol_definitions(curbuf)
+        if len([kind for _, _, kind, _, _ in found if kind != 'import']) == 1:
+            # defined once in the project, no need to ask jedi
+            return _jump_to_definition(editor, found[0])
         lin, col = curbuf.cursor_lin_col
-        engine: Script = curbuf.jedi()
-        result = engine.goto(line=lin + 1, column=col)
-        if not result:
+        result = curbuf.run_jedi(lambda script: [
+                (res.module_path, res.get_definition_start_position())
+                for res in script.goto(line=lin + 1, column=col)])
+        if not result and found:
+            _jump_to_definition(editor, found[0])
+        elif not result:
             editor.screen.minibar('no match found!')
         elif len(result) == 1:
-            res = result[0]
-            if res.module_path != curbuf.path:
-                editor.edit(res.module_path)
-            if position := res.get_definition_start_position():
+            module_path, position = result[0]
+            if module_path != curbuf.path:
+                curbuf = editor.edit(module_path)
+            if position:
                 new_lin, new_col = position
                 curbuf.cursor_lin_col = new_lin - 1, new_col + 1
                 editor.actions.normal('zz')
@@ -285,12 +359,12 @@ else:
     def DO_get_object_and_class(editor, *args, **kwargs):
         curbuf: PyFile = editor.current_buffer
         lin, col = curbuf.cursor_lin_col
-        engine: Script = curbuf.jedi()
-        results = engine.help(line=lin + 1, column=col)
+        results = curbuf.run_jedi(lambda script: [
+                repr(result) for result in script.help(line=lin + 1, column=col)])
         if not results:
             editor.screen.minibar('no help found!')
         elif len(results) == 1:
-            editor.warning(repr(results[0]))
+            editor.warning(results[0])
         else:
             editor.screen.minibar('ambiguous symbol or multiple results')
 
@@ -300,45 +374,42 @@ else:
         
         curbuf: PyFile = editor.current_buffer
         lin, col = curbuf.cursor_lin_col
-        engine: Script = curbuf.jedi()
         
         try:
-            result = engine.extract_variable(line=lin + 1, column=col, new_name=arg)
+            changes = curbuf.run_jedi(lambda script: _changed_files(
+                    script.extract_variable(line=lin + 1, column=col, new_name=arg)))
         except RefactoringError as err:
             raise editor.MustGiveUp(str(err))
         
-        changes = result.get_changed_files()
-        for path, new_version in changes.items():
-            editor.cache[path].string = new_version.get_new_code()
+        for path, new_code in changes.items():
+            editor.cache[path].string = new_code
         editor.screen.minibar(f'{len(changes)} files modified')
 
     def DO_inline_current_expression(editor, arg=None, **kwargs):
         curbuf: PyFile = editor.current_buffer
         lin, col = curbuf.cursor_lin_col
-        engine: Script = curbuf.jedi()
         try:
-            result = engine.inline(line=lin + 1, column=col)
+            changes = curbuf.run_jedi(lambda script: _changed_files(
+                    script.inline(line=lin + 1, column=col)))
         except RefactoringError as err:
             raise editor.MustGiveUp(str(err))
         
-        changes = result.get_changed_files()
-        for path, new_version in changes.items():
-            editor.cache[path].string = new_version.get_new_code()
+        for path, new_code in changes.items():
+            editor.cache[path].string = new_code
         editor.screen.minibar(f'{len(changes)} files modified')
 
     def DO_extract_as_new_function(editor, arg=None, **kwargs):
         if arg:
             curbuf: PyFile = editor.current_buffer
             lin, col = curbuf.cursor_lin_col
-            engine: Script = curbuf.jedi()
             try:
-                result = engine.extract_function(line=lin + 1, column=col, new_name=arg)
+                changes = curbuf.run_jedi(lambda script: _changed_files(
+                        script.extract_function(line=lin + 1, column=col, new_name=arg)))
             except RefactoringError as err:
                 editor.warning(str(err))
             else:
-                changes = result.get_changed_files()
-                for path, new_version in changes.items():
-                    editor.cache[path].string = new_version.get_new_code()
+                for path, new_code in changes.items():
+                    editor.cache[path].string = new_code
         else:
             editor.warning('(bad syntax, no name provided)    :command {name}')
 
@@ -346,15 +417,14 @@ else:
         if arg:
             curbuf: PyFile = editor.current_buffer
             lin, col = curbuf.cursor_lin_col
-            engine: Script = curbuf.jedi()
             try:
-                result = engine.rename(line=lin + 1, column=col, new_name=arg)
+                changes = curbuf.run_jedi(lambda script: _changed_files(
+                        script.rename(line=lin + 1, column=col, new_name=arg)))
             except RefactoringError as err:
                 editor.warning(str(err))
             else:
-                changes = result.get_changed_files()
-                for path, new_version in changes.items():
-                    editor.cache[path].string = new_version.get_new_code()
+                for path, new_code in changes.items():
+                    editor.cache[path].string = new_code
                 editor.screen.minibar(f'{len(changes)} file(s) modified.')
         else:
             editor.warning('(bad syntax, no name provided)    :command {name}')
@@ -362,14 +432,15 @@ else:
     def DO_get_help(editor, arg=None, **kwargs):
         curbuf: PyFile = editor.current_buffer
         lin, col = curbuf.cursor_lin_col
-        engine: Script = curbuf.jedi()
-        result = engine.infer(line=lin + 1, column=col)
-        if result:
-            doc = result[0].docstring(fast=False)
-            if doc:
-                editor.screen.minibar(*doc.splitlines())
-            else:
-                editor.screen.minibar(str(result[0]))
+
+        def get_help(script):
+            result = script.infer(line=lin + 1, column=col)
+            if result:
+                return result[0].docstring(fast=False) or str(result[0])
+
+        doc = curbuf.run_jedi(get_help)
+        if doc:
+            editor.screen.minibar(*doc.splitlines())
         else:
             editor.warning(' (no help available)')
 
@@ -385,33 +456,38 @@ else:
         PyFile.actions[':get_help'] = DO_get_help
         PyFile.actions['K'] = DO_get_help
 
-        def jedi(self) -> Script:
-            return Script(code=self.string, path=self.path)
-            return Interpreter(code=self.string, path=self.path)
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            if self.path is not None:
+                jedi_session(self.path).warm_up(self.string, self.path)
+
+        def run_jedi(self, task):
+            """
+            Runs task(script) on the worker of the Jedi session, script
+            being a jedi.Script of the buffer, and returns what task
+            returned or raises what it raised.
+            """
+            session = jedi_session(self.path)
+            code, path = self.string, self.path
+            return session.run(lambda: task(session.script(code, path)))
 
         def _token_chain(self):
-            engine: Script = self.jedi()
             lin, col = self.cursor_lin_col
             if self.current_line[col] != '\n':
-                result = engine.infer(line=lin + 1, column=col)
+                result = self.run_jedi(lambda script: [
+                        token.full_name for token in script.infer(line=lin + 1, column=col)])
                 if result:
                     assert len(result) == 1
-                    token = result[0]
-                    return token
+                    return result[0]
             return False
 
         def auto_complete(self):
-            engine: Script = self.jedi()
-            try:
-                lin, col = self.cursor_lin_col
-                results = engine.complete(line=lin + 1, column=col - 1)
-            except:
-                return super().auto_complete()
-                
-            if results:
-                lengh = results[0].get_completion_prefix_length()
-                rv = [item.name_with_symbols for item in results]
-                return rv, lengh
+            lin, col = self.cursor_lin_col
+            # the buffer is only joined if jedi has to be asked
+            found = jedi_session(self.path).complete(lambda: self.string, self.path,
+                                                     lin + 1, col - 1, self.current_line)
+            if found and found[0]:
+                return found
             return super().auto_complete()
 
 
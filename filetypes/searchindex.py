@@ -0,0 +1,281 @@
+"""
+    ********************************
+    ****    The Search Index    ****
+    ********************************
+
+The 'vy.filetypes.searchindex' module implements the search of a regular
+expression inside of a buffer.
+
+Every buffer has a SearchIndex, that compiles the searched pattern once,
+and builds in the background the sorted list of the offsets where it
+matches.  Moving to the next or previous match is then a matter of
+bisecting that list.  Edits do not invalidate the whole list, the
+matches found after a modification are shifted and the modified lines
+are only searched again when the index is used.  Until the index is
+built, the lines are searched by blocks, starting from the cursor.
+While the needle is being typed, SearchIndex.peek() only searches the
+lines around the cursor, and the index gets built once it is validated.
+
+If the needle is not a valid regular expression, it is searched
+literally.
+
+>>> from vy.filetypes.basefile import BaseFile
+>>> buffer = BaseFile(init_text='foo bar\\nbar foo\\n')
+>>> index = buffer.search_index
+>>> index.set_needle('ba.')
+>>> index.wait()
+>>> index.next_match(0)
+(4, False)
+>>> index.next_match(8)
+(4, True)
+>>> buffer[0:0] = 'bar '
+>>> index.previous_match(5)
+(0, False)
+"""
+from bisect import bisect_left, bisect_right
+from re import compile as _compile, escape as _escape, error as _regex_error
+from threading import Thread
+
+
+def compile_needle(needle, flags=0):
+    """
+    Compiles the needle as a regular expression, or as a literal string
+    if it is not a valid one.
+    """
+    try:
+        return _compile(needle, flags)
+    except _regex_error:
+        return _compile(_escape(needle), flags)
+
+
+def find_matches(pattern, text, start=0):
+    """
+    Returns the offsets (shifted by start) of the non-empty matches of
+    pattern in text.
+    """
+    return [start + match.start() for match in pattern.finditer(text)
+            if match.end() > match.start()]
+
+
+class SearchIndex:
+    """
+    The sorted offsets of the matches of the searched pattern.
+    """
+    __slots__ = ('_buffer', 'needle', 'pattern', 'highlight',
+                 '_offsets', '_dirty', '_building', '_replay')
+
+    SCAN_BLOCK = 256    # lines searched at once while building
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        self.needle = None
+        self.pattern = None
+        self.highlight = None
+        self._offsets = []
+        self._dirty = None
+        self._building = None
+        self._replay = []
+
+    def set_needle(self, needle):
+        """
+        Starts searching needle, unless it is allready the searched one.
+        """
+        if needle == self.needle:
+            return
+        pattern = compile_needle(needle)
+        with self._buffer._lock:
+            chunks = self._buffer._splited_lines.snapshot()
+            self.needle = needle
+            self.pattern = pattern
+            self._offsets = []
+            self._dirty = None
+            self._replay = []
+            self._building = Thread(target=self._build, args=(pattern, chunks),
+                                    name='SearchIndex._build()', daemon=True)
+            self._building.start()
+
+    def reset(self):
+        """
+        Searches the needle again from scratch, after the content of the
+        buffer got replaced without going through its edits.
+        """
+        if (needle := self.needle) is not None:
+            self.needle = None
+            self.set_needle(needle)
+
+    def _build(self, pattern, chunks):
+        # Every chunk of lines is searched along with the last line of the
+        # previous one, for the matches across two chunks.
+        offsets = []
+        start = 0
+        tail = ''
+        for chunk in chunks:
+            if self.pattern is not pattern:
+                return # another needle is searched
+            text = ''.join(chunk)
+            shift = start - len(tail)
+            for match in pattern.finditer(tail + text):
+                found = shift + match.start()
+                if (match.end() > max(match.start(), len(tail))
+                        and (not offsets or found > offsets[-1])):
+                    offsets.append(found)
+            start += len(text)
+            tail = text[text.rfind('\n', 0, -1) + 1:]
+        with self._buffer._lock:
+            if self.pattern is not pattern:
+                return
+            self._offsets = offsets
+            self._building = None
+            replay, self._replay = self._replay, []
+            for edit in replay:
+                self.record_edit(*edit)
+
+    def wait(self):
+        """
+        Waits for the background search to be done.
+        """
+        building = self._building
+        if building is not None:
+            building.join()
+
+    def record_edit(self, offset, removed, inserted):
+        """
+        Takes into account that removed characters found at offset got
+        replaced by inserted ones.
+        """
+        if self.pattern is None:
+            return
+        if self._building is not None:
+            self._replay.append((offset, removed, inserted))
+            return
+        offsets = self._offsets
+        delta = inserted - removed
+        start = bisect_left(offsets, offset)
+        stop = bisect_left(offsets, offset + removed, start)
+        if delta:
+            offsets[start:] = [match + delta for match in offsets[stop:]]
+        else:
+            del offsets[start:stop]
+
+        def moved(position):
+            if position <= offset:
+                return position
+            if position >= offset + removed:
+                return position + delta
+            return offset + inserted
+
+        if self._dirty is None:
+            self._dirty = (offset, offset + inserted)
+        else:
+            low, high = self._dirty
+            self._dirty = (min(moved(low), offset), max(moved(high), offset + inserted))
+
+    def _refresh(self):
+        # searches again the lines modified since last use
+        if self._dirty is None:
+            return
+        low, high = self._dirty
+        self._dirty = None
+        lines = self._buffer._splited_lines
+        if not lines:
+            return
+        first = lines.line_at(low)
+        last = lines.line_at(max(low, high - 1))
+        start = lines.offset_of(first)
+        stop = lines.offset_of(last) + len(lines[last])
+        found = find_matches(self.pattern, ''.join(lines.iter_range(first, last + 1)), start)
+        offsets = self._offsets
+        offsets[bisect_left(offsets, start):bisect_left(offsets, stop)] = found
+
+    def _scan(self, pattern, offset, backward, limit):
+        # While the index is being built, the lines are searched from the
+        # one holding offset, by blocks, until a match is found.
+        lines = self._buffer._splited_lines
+        if not lines:
+            return None
+        nb_of_lines = len(lines)
+        lin = lines.line_at(offset)
+        if limit is None:
+            limit = nb_of_lines
+        if backward:
+            low = max(0, lin - limit)
+            found = self._search_lines(pattern, low, lin + 1, backward, lambda found: found < offset)
+            if found is None and limit >= nb_of_lines:
+                found = self._search_lines(pattern, lin, nb_of_lines, backward)
+                return None if found is None else (found, True)
+        else:
+            high = min(nb_of_lines, lin + limit + 1)
+            found = self._search_lines(pattern, lin, high, backward, lambda found: found > offset)
+            if found is None and limit >= nb_of_lines:
+                found = self._search_lines(pattern, 0, lin + 1, backward)
+                return None if found is None else (found, True)
+        return None if found is None else (found, False)
+
+    def _search_lines(self, pattern, first, stop, backward, accept=lambda found: True):
+        # returns the first (or last) accepted match in lines[first:stop]
+        lines = self._buffer._splited_lines
+        size = self.SCAN_BLOCK
+        blocks = range(first, stop, size)
+        for start in (reversed(blocks) if backward else blocks):
+            end = min(start + size, stop)
+            found = [match for match in find_matches(pattern,
+                                                ''.join(lines.iter_range(start, end)),
+                                                lines.offset_of(start))
+                     if accept(match)]
+            if found:
+                return found[-1] if backward else found[0]
+        return None
+
+    def next_match(self, offset, limit=None):
+        """
+        Returns a tuple (match_offset, wrapped) for the first match after
+        offset, wrapped being True if it was found from the beginning of
+        the buffer, or None if there is no match.  While the index is
+        being built, the search only goes limit lines away from offset
+        (and then does not wrap), if limit is not None.
+        """
+        with self._buffer._lock:
+            if self._building is not None:
+                return self._scan(self.pattern, offset, False, limit)
+            self._refresh()
+            offsets = self._offsets
+            if not offsets:
+                return None
+            index = bisect_right(offsets, offset)
+            if index == len(offsets):
+                return offsets[0], True
+            return offsets[index], False
+
+    def previous_match(self, offset, limit=None):
+        """
+        Returns a tuple (match_offset, wrapped) for the last match before
+        offset, wrapped being True if it was found from the end of the
+        buffer, or None if there is no match.  Limit is used as for
+        next_match().
+        """
+        with self._buffer._lock:
+            if self._building is not None:
+                return self._scan(self.pattern, offset, True, limit)
+            self._refresh()
+            offsets = self._offsets
+            if not offsets:
+                return None
+            index = bisect_left(offsets, offset)
+            if index == 0:
+                return offsets[-1], True
+            return offsets[index - 1], False
+
+    def peek(self, pattern, offset, backward=False, limit=None):
+        """
+        Returns what next_match() (or previous_match() if backward) would
+        for pattern, searching only limit lines away from offset, without
+        changing the searched needle nor building the index.
+        """
+        with self._buffer._lock:
+            return self._scan(pattern, offset, backward, limit)
+
+    def __len__(self):
+        self.wait()
+        with self._buffer._lock:
+            self._refresh()
+            return len(self._offsets)
@@ -0,0 +1,215 @@
+"""
+    ******************************
+    ****    The Substitute    ****
+    ******************************
+
+The 'vy.filetypes.substitute' module implements the ':substitute'
+command, following the vim syntax:
+
+    :[range]s[ubstitute]/{pattern}/{string}/[flags]
+
+{pattern} is a python regular expression (or a literal string if it is
+not a valid one), and {string} may refer to the whole match with & or
+\\0, and to the captured groups with \\1 to \\9.  Any character that is
+not a letter, a digit, a space, a quote or a backslash may replace the
+slash.
+
+Every replacement is computed before the buffer gets modified, and the
+modified lines are replaced at once, so that a substitution is a single
+edit for the undo list and for the language server, whatever the number
+of matches.
+
+>>> from vy.filetypes.basefile import BaseFile
+>>> buffer = BaseFile(init_text='foo = 1\\nbar = 2\\nfoo = 3\\n')
+>>> parse_substitute('/(fo+) = (.*)/\\\\2 = \\\\1/g')
+('(fo+) = (.*)', '\\\\2 = \\\\1', 'g')
+>>> pattern = compile_needle('(fo+) = (.*)')
+>>> substitute(buffer, 0, 2, pattern, vim_template('\\\\2 = \\\\1'), every=True)
+(2, 2)
+>>> buffer.string
+'1 = foo\\nbar = 2\\n3 = foo\\n'
+>>> parse_range('%', current=1, last=2)
+(0, 2)
+>>> parse_range('.,.+1', current=1, last=2)
+(1, 2)
+"""
+from re import compile as _compile
+
+from vy.filetypes.searchindex import compile_needle
+
+FLAGS = frozenset('&cegiIn')
+
+_ADDRESS = _compile(r"\s*(\d+|\.|\$|'<|'>)?((?:\s*[+-]\d*)*)")
+
+
+def parse_substitute(arg):
+    """
+    Splits '/{pattern}/{string}/[flags]' into a tuple (pattern, string,
+    flags).  The delimiter is the first character, and may be escaped
+    with a backslash inside of the pattern and of the string.
+    """
+    delimiter = arg[:1]
+    if not delimiter or delimiter.isalnum() or delimiter in ' \t\\"|\'':
+        raise ValueError(f'not a valid delimiter: {delimiter!r}')
+    parts = ['']
+    escaped = False
+    for char in arg[1:]:
+        if escaped:
+            if char != delimiter:
+                parts[-1] += '\\'
+            parts[-1] += char
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char == delimiter and len(parts) < 3:
+            parts.append('')
+        else:
+            parts[-1] += char
+    if escaped:
+        parts[-1] += '\\'
+    needle, string, flags = parts + [''] * (3 - len(parts))
+    flags = flags.strip()
+    if not FLAGS.issuperset(flags):
+        raise ValueError(f'unknown flags: {flags!r}')
+    return needle, string, flags
+
+
+def vim_template(string):
+    """
+    Translates a vim replacement string into a template for re.sub().
+    """
+    template = ''
+    escaped = False
+    for char in string:
+        if escaped:
+            escaped = False
+            if char.isdigit():
+                template += f'\\g<{char}>'
+            elif char in 'nr':
+                template += '\n'
+            elif char == 't':
+                template += '\t'
+            elif char == '\\':
+                template += '\\\\'
+            else:
+                template += char
+        elif char == '\\':
+            escaped = True
+        elif char == '&':
+            template += '\\g<0>'
+        else:
+            template += char
+    if escaped:
+        template += '\\\\'
+    return template
+
+
+def parse_range(text, current, last, selection=None):
+    """
+    Returns the (first, last) lines, counted from zero, of a vim range
+    like '%', '.,$', '12', "'<,'>" or '.,+3'.  current and last are the
+    indexes of the current and of the last line.  selection is the
+    range of the selected lines if any.
+    """
+    text = text.strip()
+    if text == '%':
+        return 0, last
+    if not text:
+        return current, current
+
+    def address(part):
+        match = _ADDRESS.fullmatch(part)
+        if match is None:
+            raise ValueError(f'invalid range: {text!r}')
+        base, offsets = match.groups()
+        if base is None or base == '.':
+            line = current
+        elif base == '$':
+            line = last
+        elif base in ("'<", "'>"):
+            if not selection:
+                raise ValueError('no selection')
+            line = selection.start if base == "'<" else selection.stop - 1
+        else:
+            line = int(base) - 1
+        for offset in offsets.replace(' ', '').replace('+', ' +').replace('-', ' -').split():
+            line += int(offset + '1' if offset in '+-' else offset)
+        return line
+
+    first, _, second = text.partition(',')
+    start = address(first)
+    stop = address(second) if second else start
+    if start > stop:
+        start, stop = stop, start
+    if start < 0 or stop > last:
+        raise ValueError(f'range out of buffer: {text!r}')
+    return start, stop
+
+
+def substitute(buffer, first, last, pattern, template, every=False, accept=None):
+    """
+    Replaces the matches of pattern on the lines first to last of the
+    buffer (every match if every is True, else the first one of each
+    line) by the expansion of template.
+
+    If accept is given, it gets called as accept(line_index, match)
+    before each replacement, and returns True to replace, False to
+    skip, or None to stop there.
+
+    Returns a tuple (number of replacements, index of the last modified
+    line) or (0, None).
+    """
+    lines = buffer.splited_lines
+    count = 0
+    changed = {}
+    stopped = False
+
+    def filtered(match):
+        nonlocal count, stopped
+        if not stopped:
+            answer = accept(index, match)
+            if answer is None:
+                stopped = True
+            elif answer:
+                count += 1
+                return match.expand(template)
+        return match.group(0)
+
+    replacement = template if accept is None else filtered
+    subn = pattern.subn
+    limit = 0 if every else 1
+    for index, line in enumerate(lines.iter_range(first, last + 1), start=first):
+        if line[-1:] == '\n':
+            new_line, found = subn(replacement, line[:-1], limit)
+            new_line += '\n'
+        else:
+            new_line, found = subn(replacement, line, limit)
+        if found and new_line != line:
+            changed[index] = new_line
+            if accept is None:
+                count += found
+        if stopped:
+            break
+    if not changed:
+        return 0, None
+
+    start, stop = min(changed), max(changed)
+    new_text = ''.join(changed.get(index, line) for index, line in
+                       enumerate(lines.iter_range(start, stop + 1), start=start))
+    offsets = buffer.lines_offsets
+    with buffer:
+        buffer[offsets[start]:offsets[stop] + len(lines[stop])] = new_text
+    return count, stop
+
+
+def count_matches(buffer, first, last, pattern, every=False):
+    """
+    Returns the number of matches substitute() would replace.
+    """
+    total = 0
+    for line in buffer.splited_lines.iter_range(first, last + 1):
+        if every:
+            total += sum(1 for match in pattern.finditer(line.removesuffix('\n')))
+        elif pattern.search(line.removesuffix('\n')) is not None:
+            total += 1
+    return total
@@ -0,0 +1,112 @@
+"""
+    **********************************
+    ****    The Syntax Checker    ****
+    **********************************
+
+The 'vy.filetypes.syntaxcheck' module finds the syntax errors of python
+code without compiling all of it after every edit.
+
+The code is cut into its top-level blocks (a class, a function and its
+decorators, a statement...) and only the blocks that changed since the
+previous check get compiled, the others being found in a dict keyed by
+their text.  The dict only keeps the blocks of the last check, so that
+it never holds more than one copy of the code.
+
+Cutting at every line that starts on the first column may be wrong (a
+multi-line string, a bracket closed on the first column...), but such a
+cut leaves an unfinished block, that does not compile.  So an error is
+only reported once confirmed by compiling the whole code.
+
+>>> checker = SyntaxChecker()
+>>> checker.check(['import os\\n', '\\n', 'def f(x):\\n', '    return x +\\n'])
+(3, 'invalid syntax')
+>>> checker.check(['import os\\n', '\\n', 'def f(x):\\n', '    return x\\n'])
+>>> checker.compiled
+1
+>>> checker.check(["s = '''\\n", 'not a block\\n', "'''\\n"])
+>>> list(split_blocks(['@decorator\\n', 'def f(x):\\n', '    pass\\n', 'else_ = 1\\n']))
+[(0, '@decorator\\ndef f(x):\\n    pass\\n'), (3, 'else_ = 1\\n')]
+"""
+from re import compile as _compile
+from warnings import catch_warnings, simplefilter
+
+# a line that does not start a new top-level block
+_CONTINUED = _compile(r'[\s#)\]}]|(?:else|elif|except|finally)\b|from\s+__future__\b')
+
+_MISSING = object()
+
+
+def split_blocks(lines):
+    """
+    Yields (index of the first line, text) for every top-level block of
+    lines, the comments and blank lines going with the block above.
+    """
+    start = 0
+    block = []
+    for index, line in enumerate(lines):
+        if (block and not _CONTINUED.match(line)
+                and not block[-1].endswith('\\\n')
+                and not _last_code_line(block).startswith('@')):
+            yield start, ''.join(block)
+            start, block = index, []
+        block.append(line)
+    if block:
+        yield start, ''.join(block)
+
+
+def _last_code_line(block):
+    for line in reversed(block):
+        if line.strip() and not line.startswith('#'):
+            return line
+    return ''
+
+
+def compile_error(code):
+    """
+    Returns (line index, message) of the first syntax error of code, or
+    None.
+    """
+    try:
+        # a warning would be printed over the screen
+        with catch_warnings():
+            simplefilter('ignore')
+            compile(code, '<buffer>', 'exec', dont_inherit=True)
+    except SyntaxError as err:
+        return (err.lineno or 1) - 1, err.msg
+    except ValueError as err:
+        return 0, str(err)
+    return None
+
+
+class SyntaxChecker:
+    """
+    Checks again and again the syntax of a changing code, compiling only
+    the blocks that changed.
+    """
+    __slots__ = ('_blocks', 'compiled')
+
+    def __init__(self):
+        self._blocks = {}       # text: error of the block, or None
+        self.compiled = 0       # number of blocks compiled by last check
+
+    def check(self, lines):
+        """
+        Returns (line index, message) of the first syntax error of the
+        code made of lines, or None.
+        """
+        blocks = {}
+        compiled = 0
+        error = None
+        for _, text in split_blocks(lines):
+            if (found := self._blocks.get(text, _MISSING)) is _MISSING:
+                found = compile_error(text)
+                compiled += 1
+            blocks[text] = found
+            if found is not None and error is None:
+                error = found
+        self._blocks = blocks
+        self.compiled = compiled
+        if error is not None:
+            # the blocks may be badly cut, the whole code tells
+            error = compile_error(''.join(lines))
+        return error
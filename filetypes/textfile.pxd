@@ -13,6 +13,10 @@ cdef class TextFile(BaseFile):
         public list _lexed_lines
         public dict _lexed_cache
         public list _token_list
+        public list _lex_states
+        public dict _lex_preview
+        public tuple _lex_viewport
+        int _lex_generation
         
     cpdef void _lex_away(self) noexcept
     cpdef tuple get_raw_screen(self, int min_lin, int max_lin)
@@ -1,22 +1,19 @@
+from concurrent.futures import CancelledError
 from threading import Thread
 from time import sleep
 
 from vy.filetypes.basefile import BaseFile
 from vy.filetypes.lexer import guess_lexer, get_prefix 
+from vy.lsp_client import code_units
 
-DELIMS = '+=#/?*<> ,;:/!%.{}()[]():\n\t\"\''
+_CLEAN_STATES = frozenset(('', 'Token', 'Token.Text', 'Token.Text.Whitespace'))
 
-def make_word_set(string):
-    accu = set()
-    entry = ''
-    for letter in string:
-        if letter not in DELIMS:
-            entry += letter
-        else:
-            if entry:
-                accu.add(entry)
-                entry = ''
-    return accu
+def _is_clean(state):
+    """
+    Tells if the lexer may be restarted at the beginning of a line,
+    given the type of the token holding the previous newline.
+    """
+    return state is not None and str(state) in _CLEAN_STATES
 
 class TextFile(BaseFile):
     """
@@ -26,18 +23,56 @@ class TextFile(BaseFile):
     """
     modifiable = True
 
+    LEX_WINDOW = 64
+
     def __init__(self, *args, **kwargs):
         BaseFile.__init__(self, *args, **kwargs)
         self._lexed_cache = {}
-        self._lexed_lines = []
+        self._lexed_lines = [None] * len(self._splited_lines)
+        self._lex_states = [None] * len(self._splited_lines)
+        self._lex_preview = {}
+        self._lex_generation = 0
+        cursor_lin = self._cursor_lin_col[0] if self._cursor_lin_col else 0
+        self._lex_viewport = (cursor_lin, cursor_lin + self.LEX_WINDOW)
         self._t = Thread(target=self._lex_away, args=(), name=f'{repr(self)}._lex_away()', daemon=True)
         self._t.start()
 
+    def _record_edit(self, offset, removed, inserted):
+        BaseFile._record_edit(self, offset, removed, inserted)
+        # The modified lines are marked as dirty (None) for the lexer.
+        # The state at the start of the first one does not depend on
+        # the edit, so it is kept as a restarting point.
+        lines = self._splited_lines
+        lin = lines.line_at(offset) if lines else 0
+        stop = lin + removed.count('\n') + 1
+        count = inserted.count('\n') + (offset + len(removed) < self._lenght)
+        self._lexed_lines[lin:stop] = [None] * count
+        self._lex_states[lin + (count > 0):stop] = [None] * max(count - 1, 0)
+        self._lex_preview = {}
+        self._lex_generation += 1
+
+    def _lock_unless_cancelled(self, cancel_request):
+        while not self._lock.acquire(blocking=False):
+            if cancel_request():
+                return False
+            sleep(0)
+        return True
+
     def _lex_away(self):
+        """
+        Background task keeping _lexed_lines up to date.
+
+        For every line, _lexed_lines holds its highlighted version, or
+        None if the line has been modified since last lexed, and
+        _lex_states holds the lexer state at its beginning (the type of
+        the token holding the previous newline).  After an edit, lexing
+        restarts from the nearest line before the first dirty one that
+        begins in a clean state, and stops as soon as a line past the
+        dirty ones begins in the same state as during the previous pass.
+        If the first dirty line is far above the visible lines, these
+        get a preview first.
+        """
         lexer = guess_lexer(self.path, self.string) or self.lexer
-                       
-        local_dict = self._lexed_cache
-        local_lexed = self._lexed_lines
         cancel_handler = self._async_tasks
         cancel_request = lambda: self._async_tasks.must_stop
 
@@ -48,53 +83,169 @@ class TextFile(BaseFile):
 
             cancel_handler.notify_working()
             self.cursor_lin_col            
-            string = self._string or ''.join(self._splited_lines)
             self._lock.release()
 
-            line = ''
+            previewed = False
+            while not cancel_request():
+                if not self._lock_unless_cancelled(cancel_request):
+                    break
+                lexed, states = self._lexed_lines, self._lex_states
+                nb_of_lines = len(self._splited_lines)
+                if len(lexed) != nb_of_lines:
+                    lexed[:] = [None] * nb_of_lines
+                    states[:] = [None] * nb_of_lines
+                try:
+                    first = lexed.index(None)
+                except ValueError:
+                    self._lock.release()
+                    break
+                min_lin, max_lin = self._lex_viewport
+                if (not previewed and first + self.LEX_WINDOW < min_lin
+                        and None in lexed[min_lin:max_lin]):
+                    previewed = True
+                    self._lock.release()
+                    self._preview_lines(lexer, min_lin, max_lin, cancel_request)
+                    continue
+                start = first
+                while start and not _is_clean(states[start]):
+                    start -= 1
+                generation = self._lex_generation
+                self._lock.release()
+                self._lex_from(lexer, start, first, generation, cancel_request)
 
-            if cancel_request():
-                cancel_handler.notify_stopped()
-                continue
+            cancel_handler.notify_stopped()
 
-            for off, tok, val in lexer(string):
-                if cancel_request():
-                    break
-                tok = get_prefix(tok)
-                if '\n' in val:
-                    for token_line in val.splitlines(True):
-                        if token_line.endswith('\n'):
-                            line += tok + token_line[:-1] + ' \x1b[97;22;24m'
-                            local_lexed.append(line)
-                            line = ''                            
-                        else:
-                            line += tok + token_line + '\x1b[97;22;24m'
-                else:
-                    line += tok + val + '\x1b[97;22;24m'
-            else:
-                if line and line != tok: #No eof
-                    local_lexed.append(line)
+    def _lex_from(self, lexer, lin, first, generation, cancel_request):
+        """
+        Lexes from line lin, by windows of growing size, until the state
+        at the beginning of a line after first matches the previous pass.
+        A pass interrupted after a window leaves the line following it
+        dirty, so that the next one resumes there.
+
+        >>> from pygments.lexers import PythonLexer
+        >>> lexer = PythonLexer().get_tokens_unprocessed
+        >>> buffer = TextFile(init_text=("'''\\n" + 'x = 1\\n' * 4) * 40)
+        >>> with buffer:
+        ...     lexed = buffer._lex_lines(lexer, buffer.splited_lines, lambda: False)
+        ...     buffer._lexed_lines[:] = [line for line, _ in lexed]
+        ...     buffer._lex_states[1:] = [state for _, state in lexed[:-1]]
+        ...     buffer.insert("'''\\n")
+        ...     buffer._lex_from(lexer, 0, 0, buffer._lex_generation,
+        ...                      lambda: buffer._lexed_lines[0] is not None)
+        ...     resume = buffer._lexed_lines.index(None)
+        ...     buffer._lex_from(lexer, resume, resume, buffer._lex_generation, lambda: False)
+        ...     relexed = buffer._lex_lines(lexer, buffer.splited_lines, lambda: False)
+        >>> resume
+        63
+        >>> buffer._lexed_lines == [line for line, _ in relexed]
+        True
+        """
+        size = self.LEX_WINDOW
+        while not cancel_request():
+            if not self._lock_unless_cancelled(cancel_request):
+                return
+            if generation != self._lex_generation:
+                self._lock.release()
+                return
+            lines = self._splited_lines
+            nb_of_lines = len(lines)
+            stop = min(lin + size, nb_of_lines)
+            raw_lines = list(lines.iter_range(lin, stop))
+            self._lock.release()
 
-                for raw, lexed in zip(string.splitlines(True), local_lexed):
-                    if cancel_request():
+            result = self._lex_lines(lexer, raw_lines, cancel_request)
+            if result is None:
+                return
+            if stop == nb_of_lines:
+                keep = len(result)
+            else:
+                # the next window must start in a clean state, and the
+                # end of the text may have fooled the lexer on last line
+                for keep in range(len(result) - 1, 0, -1):
+                    if _is_clean(result[keep - 1][1]):
                         break
-                    local_dict[raw] = lexed
                 else:
-                    for line in self._splited_lines:
-                        if cancel_request():
+                    size *= 2
+                    continue
+
+            if not self._lock_unless_cancelled(cancel_request):
+                return
+            try:
+                if generation != self._lex_generation:
+                    return
+                converged = False
+                lexed, states, cache = self._lexed_lines, self._lex_states, self._lexed_cache
+                for index in range(keep):
+                    on_lin = lin + index
+                    lexed_line, state = result[index]
+                    lexed[on_lin] = lexed_line
+                    cache[raw_lines[index]] = lexed_line
+                    if on_lin + 1 < nb_of_lines:
+                        old_state = states[on_lin + 1]
+                        states[on_lin + 1] = state
+                        if (on_lin >= first and old_state is not None and old_state == state
+                                and lexed[on_lin + 1] is not None):
+                            converged = True # with previous pass
                             break
-                        for w in make_word_set(line):
-                            if w not in self.word_set:
-                                self.ANY_BUFFER_WORD_SET.add(w)
-                                self.word_set.add(w)
-                    else:
-                        for word in self.word_set.copy():
-                            if cancel_request():
-                                break
-                            if word not in string:
-                                self.word_set.remove(word)
-            cancel_handler.notify_stopped()
-            self._lexed_lines.clear()
+                if not converged and stop != nb_of_lines:
+                    # The next lines were lexed from another state.  If the
+                    # pass gets interrupted, the next one must resume here.
+                    lexed[lin + keep] = None
+                self._mark_dirty_lines(lin, on_lin + 1)
+            finally:
+                self._lock.release()
+            if converged or stop == nb_of_lines:
+                return
+            lin += keep
+            size *= 2
+
+    def _preview_lines(self, lexer, min_lin, max_lin, cancel_request):
+        if not self._lock_unless_cancelled(cancel_request):
+            return
+        states = self._lex_states
+        lines = self._splited_lines
+        start = min(min_lin, len(lines))
+        limit = max(0, start - self.LEX_WINDOW)
+        while start > limit and not _is_clean(states[start]):
+            start -= 1
+        raw_lines = list(lines.iter_range(start, min(max_lin, len(lines))))
+        generation = self._lex_generation
+        self._lock.release()
+
+        result = self._lex_lines(lexer, raw_lines, cancel_request)
+        if result is None or not self._lock_unless_cancelled(cancel_request):
+            return
+        if generation == self._lex_generation:
+            self._lex_preview = {start + index: lexed_line
+                                 for index, (lexed_line, _) in enumerate(result)}
+            self._mark_dirty_lines(start, start + len(result))
+        self._lock.release()
+
+    @staticmethod
+    def _lex_lines(lexer, raw_lines, cancel_request):
+        """
+        Returns a list of (lexed_line, state) for raw_lines, state being
+        the lexer state at the beginning of the next line, or None if
+        cancelled.
+        """
+        result = []
+        line = ''
+        for off, tok, val in lexer(''.join(raw_lines)):
+            if cancel_request():
+                return None
+            if not val:
+                continue
+            prefix = get_prefix(tok)
+            *token_lines, val = val.split('\n')
+            for token_line in token_lines:
+                result.append((f'{line}{prefix}{token_line} \x1b[97;22;24m', tok))
+                line = ''
+            if val:
+                line += prefix + val + '\x1b[97;22;24m'
+        # a lexer missing some newlines cannot be trusted for the rest
+        del result[len(raw_lines):]
+        result.extend((raw.replace('\n', ' '), None) for raw in raw_lines[len(result):])
+        return result
 
     def get_raw_screen(self, min_lin, max_lin):
         # This method does not take the internal lock allowing
@@ -103,7 +254,7 @@ class TextFile(BaseFile):
         # Any case of failure will be turned into a RuntimeError
         # to signal the screen to give up and retry later.
         raw_line_list = list()
-        cancel_request = lambda: self._async_tasks.must_stop
+        self._lex_viewport = (min_lin, max_lin)
 
         try:
             cursor_lin, cursor_col = self._cursor_lin_col
@@ -115,18 +266,21 @@ class TextFile(BaseFile):
             raise RuntimeError('_splited_lines is empty') # (is empty) buffer in inconsistant state
 
         local_split = self._splited_lines
+        local_lexed = self._lexed_lines
+        preview = self._lex_preview
         try:
             for on_lin in range(min_lin, max_lin):
-#                if cancel_request():
-#                    raise RuntimeError('cancelled')
+                cur_lin = local_split[on_lin]
                 try:
-                    cur_lex = self._lexed_lines[on_lin] # Best case scenario
-                except IndexError: 
-                    cur_lin = local_split[on_lin]
-                    # If on_lin is a valid line number, use the un-lexed line
-                    cur_lex = self._lexed_cache.get(cur_lin, cur_lin.replace('\n',' '))
-                    # if the line got lexed by a previous lexer pass, use the cached
+                    cur_lex = local_lexed[on_lin] # Best case scenario
+                except IndexError:
+                    cur_lex = None
+                if cur_lex is None:
+                    cur_lex = preview.get(on_lin)
+                if cur_lex is None:
+                    # If the line got lexed by a previous lexer pass, use the cached
                     # lexed version. Otherwise, just remove the newline character
+                    cur_lex = self._lexed_cache.get(cur_lin, cur_lin.replace('\n',' '))
 
                 raw_line_list.append(cur_lex)
 
@@ -146,9 +300,11 @@ class TextFile(BaseFile):
         
     def auto_complete(self):
             if self._lsp_server:
+                self._flush_lsp_changes()
                 lin, col = self.cursor_lin_col
+                character = code_units(self.current_line[:col - 1], self._lsp_server.position_encoding)
                 try:
-                    return self._lsp_server.text_document_completion(f'file://{self.path}', self.string, lin, col - 1,)
-                except TimeoutError:
+                    return self._lsp_server.text_document_completion(f'file://{self.path}', self.string, lin, character)
+                except (TimeoutError, CancelledError, ConnectionError):
                     pass
             return super().auto_complete()
@@ -0,0 +1,203 @@
+"""
+    ******************************
+    ****    The Word Index    ****
+    ******************************
+
+The 'vy.filetypes.wordindex' module keeps track of the words used in the
+buffers, for completion purposes.
+
+A WordIndex counts, for every word, the number of lines where it is
+found.  Buffers update their own index with the lines an edit removed
+and the lines it inserted, so that it never needs to rescan the whole
+text.  Every buffer index also reports to a shared index (the class
+attribute BaseFile.ANY_BUFFER_WORD_SET) the words it starts or stops
+using, so that the shared index forgets the words of a closed buffer.
+
+The words are also kept sorted, so that complete() only visits the words
+starting with the given prefix.  Candidates are ranked by recency (words
+found on recently edited lines first) then by frequency.
+
+>>> shared = WordIndex()
+>>> local = WordIndex(shared)
+>>> local.add_lines(['foo = bar\\n', 'bar(baz)\\n'])
+>>> sorted(local)
+['bar', 'baz', 'foo']
+>>> local.remove_lines(['foo = bar\\n'])
+>>> sorted(shared)
+['bar', 'baz']
+>>> local.update([], ['bazar bazooka\\n'])
+>>> local.complete('ba')
+['bazar', 'bazooka', 'bar', 'baz']
+>>> local.complete('baz')
+['bazar', 'bazooka']
+>>> local.clear()
+>>> len(shared)
+0
+"""
+from bisect import bisect_left
+from collections import Counter
+from itertools import chain, count as _count, islice
+from re import compile as _compile, escape as _escape
+
+DELIMS = '+=#/?*<> ,;:/!%.{}()[]():\n\t\"\''
+
+split_words = _compile(f'[^{_escape(DELIMS)}]+').findall
+last_word = _compile(f'[^{_escape(DELIMS)}]*$').search
+first_word = _compile(f'[^{_escape(DELIMS)}]*').match
+
+_ticks = _count(1)
+
+
+class WordIndex:
+    """
+    A reference-counted set of words.
+    """
+    __slots__ = ('_counts', '_parent', '_recent', '_sorted', '_pending', '_stale')
+
+    MAX_SCANNED = 2048
+
+    def __init__(self, parent=None):
+        self._counts = dict()
+        self._parent = parent
+        self._recent = dict()
+        self._sorted = list()
+        self._pending = set()
+        self._stale = 0
+
+    def add_words(self, words, recent=False):
+        """
+        Adds the words of a mapping {word: number of lines}.
+        """
+        counts = self._counts
+        # the loop only visits the allready known words, the new ones
+        # are added at once: a big paste brings a lot of them
+        known = {word: counts[word] + words[word] for word in counts.keys() & words.keys()}
+        new_words = words.keys() - known.keys()
+        counts.update(words)
+        counts.update(known)
+        if recent:
+            self._recent.update(dict.fromkeys(words, next(_ticks)))
+        if new_words:
+            self._pending.update(new_words)
+            if self._parent is not None:
+                self._parent.add_words(dict.fromkeys(new_words, 1), recent)
+        if recent and known and self._parent is not None:
+            self._parent.touch(known)
+
+    def touch(self, words):
+        """
+        Marks the words as recently used.
+        """
+        self._recent.update(dict.fromkeys(self._counts.keys() & words, next(_ticks)))
+
+    def remove_words(self, words):
+        """
+        Removes the words of a mapping {word: number of lines}.
+        """
+        counts = self._counts
+        lost_words = {}
+        for word, number in words.items():
+            count = counts.get(word)
+            if count is None:
+                continue
+            if count <= number:
+                del counts[word]
+                self._recent.pop(word, None)
+                lost_words[word] = 1
+            else:
+                counts[word] = count - number
+        if lost_words:
+            self._stale += len(lost_words)
+            if self._parent is not None:
+                self._parent.remove_words(lost_words)
+
+    @staticmethod
+    def _count_lines(lines):
+        # a word found twice on a line is only counted once
+        return Counter(chain.from_iterable(map(set, map(split_words, lines))))
+
+    def add_lines(self, lines, recent=False):
+        """
+        Counts the words of the given lines.
+        """
+        self.add_words(self._count_lines(lines), recent)
+
+    def remove_lines(self, lines):
+        """
+        Forgets the words of the given lines.
+        """
+        self.remove_words(self._count_lines(lines))
+
+    def update(self, removed_lines, inserted_lines):
+        """
+        Updates the index after some lines got replaced.
+        """
+        removed = self._count_lines(removed_lines)
+        inserted = self._count_lines(inserted_lines)
+        # only the difference changes the counts, and as few lines are
+        # usually removed, it is computed by visiting the removed words
+        for word, number in list(removed.items()):
+            if (found := inserted.get(word)):
+                common = min(number, found)
+                removed[word] = number - common
+                inserted[word] = found - common
+        self.remove_words(+removed)
+        # the words found on both sides get marked recent too
+        self.add_words(inserted, recent=True)
+
+    def clear(self):
+        """
+        Forgets all the words, and tells the parent index.
+        """
+        if self._parent is not None:
+            self._parent.remove_words(dict.fromkeys(self._counts, 1))
+        self._counts.clear()
+        self._recent.clear()
+        self._sorted.clear()
+        self._pending.clear()
+        self._stale = 0
+
+    def _sorted_words(self):
+        counts = self._counts
+        pending = self._pending
+        if self._stale > len(counts) or len(pending) > 64:
+            self._sorted = sorted(counts)
+            self._stale = 0
+            pending.clear()
+        elif pending:
+            words = self._sorted
+            for word in pending:
+                index = bisect_left(words, word)
+                if index == len(words) or words[index] != word:
+                    words.insert(index, word)
+                else:
+                    self._stale -= 1
+            pending.clear()
+        return self._sorted
+
+    def complete(self, prefix, max_results=20):
+        """
+        Returns the known words starting with prefix, most recently and
+        most frequently used first.  The prefix itself is not returned:
+        being typed, it is allways known, and completes nothing.
+        """
+        counts = self._counts
+        words = self._sorted_words()
+        candidates = []
+        for word in islice(words, bisect_left(words, prefix), None):
+            if not word.startswith(prefix) or len(candidates) == self.MAX_SCANNED:
+                break
+            if word in counts and word != prefix:
+                candidates.append(word)
+        recent = self._recent
+        candidates.sort(key=lambda word: (recent.get(word, 0), counts[word]), reverse=True)
+        return candidates[:max_results]
+
+    def __contains__(self, word):
+        return word in self._counts
+
+    def __iter__(self):
+        return iter(list(self._counts))
+
+    def __len__(self):
+        return len(self._counts)
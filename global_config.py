@@ -27,6 +27,8 @@ DONT_USE_JEDI_LIB = False
 DONT_USE_USER_CONFIG = False
 MINI = False
 BG_COLOR = '\x1b[48:5:234m'
+UNDO_MAX_SIZE = 32 * 1024 * 1024 # characters kept in each undo list
+LARGE_FILE_SIZE = 64 * 1024 * 1024 # bytes, bigger files are memory-mapped
 
 def _source_config():
     global USER_DIR
@@ -1,7 +1,12 @@
 from vy.utils import eval_effified_str
 from vy.editor import _Editor
 from vy.interface.helpers import Completer, one_inside_dict_starts_with
+from vy.filetypes.substitute import parse_range
 from pathlib import Path
+from re import compile as _compile
+
+# :[range]s[ubstitute]/{pattern}/{string}/[flags] needs no space
+_SUBSTITUTE = _compile(r"([%.$,'<>+\-\d\s]*)(?:substitute|su|s)([^\w\s\\\"|].*)")
 
 def starts_with_valid_range(string):
     buffer = ''
@@ -14,6 +19,8 @@ def starts_with_valid_range(string):
     return ''
 
 class CommandCompleter(Completer):
+    MAX_FOUND_FILES = 50
+
     def get_option(self, args):
         if ' ' in args:
             option, value = args.split(' ', maxsplit=1)
@@ -35,6 +42,15 @@ class CommandCompleter(Completer):
                 rv.append(str(buff.path))
         return rv, len(args)
         
+    def get_project_file(self, args):
+        from vy.project import project_index
+        return project_index().find(args, limit=self.MAX_FOUND_FILES), len(args)
+
+    def get_symbol(self, args):
+        from vy.symbols import symbol_index
+        found = symbol_index().find(args, limit=self.MAX_FOUND_FILES)
+        return [f'{qualname} {path}:{lin}' for _, qualname, _, path, lin in found], len(args)
+
     def get_complete(self):
         from collections import ChainMap
         local_actions = self.editor.current_buffer.actions
@@ -97,14 +113,26 @@ def loop(self: _Editor):
         self.save_in_jump_list()
         return 'normal'
 
-    if ' ' in user_input:
+    PART = self.current_buffer.selected_offsets
+
+    if (substitution := _SUBSTITUTE.fullmatch(user_input.lstrip(':'))):
+        cmd, ARG = 's', substitution.group(2)
+        if (text_range := substitution.group(1).strip()):
+            curbuf = self.current_buffer
+            try:
+                first, last = parse_range(text_range, curbuf.current_line_idx,
+                                          curbuf.number_of_lin - 1, curbuf.selected_lines)
+            except ValueError as exc:
+                self.screen.minibar(str(exc))
+                return 'normal'
+            offsets = curbuf.lines_offsets
+            PART = slice(offsets[first], offsets[last] + len(curbuf.splited_lines[last]))
+    elif ' ' in user_input:
         cmd, ARG = user_input.split(' ', maxsplit=1)
     else:
         cmd = user_input.strip()
     cmd = cmd.lstrip(':')
 
-    PART = self.current_buffer.selected_offsets
-
     if not (action := self.current_buffer.actions.get(':'+cmd)):
         try:
             action = self.actions.command[cmd]
@@ -352,7 +352,10 @@ class Completer:
             elif self.completion and self.completion != ['']:
                 index = 0
                 char = self.completion[0][index]
-                cond = all(item.startswith(char) for item in self.completion)
+                # fuzzy completions do not extend what was typed
+                typed = self.buffer.string[len(self.buffer.string) - self.prefix_len:]
+                cond = all(item.startswith(typed) and item.startswith(char)
+                           for item in self.completion)
                 if cond:
                     self.buffer.string = self.buffer.string[:-self.prefix_len]
                     self.buffer.cursor = max(0, len(self.buffer.string) -1)
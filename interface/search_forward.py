@@ -1,9 +1,45 @@
 from vy.interface.helpers import Completer
 from vy.editor import _Editor
+from vy.filetypes.searchindex import compile_needle
+
+class SearchCompleter(Completer):
+    """
+    Reads the needle to search.  As the user types, the cursor moves to
+    the first match and the matches shown on screen are highlighted.
+    """
+    def __init__(self, file, prompt, editor, backward=False):
+        super().__init__(file, prompt, editor)
+        self.backward = backward
+        self.origin = 0
+
+    def __call__(self, buffered=None):
+        curbuf = self.editor.current_buffer
+        self.origin = curbuf.cursor
+        try:
+            return super().__call__(buffered)
+        finally:
+            curbuf.search_index.highlight = None
+            curbuf.cursor = self.origin
+
+    def update_minibar(self):
+        super().update_minibar()
+        curbuf = self.editor.current_buffer
+        needle = self.buffer.string
+        if not needle:
+            curbuf.search_index.highlight = None
+            curbuf.cursor = self.origin
+            return
+        pattern = compile_needle(needle)
+        curbuf.search_index.highlight = pattern
+        # only the lines on screen get searched, the whole buffer
+        # will be once the needle is validated
+        limit = self.editor.screen.focused.number_of_lin
+        found = curbuf.search_index.peek(pattern, self.origin, self.backward, limit)
+        curbuf.cursor = found[0] if found else self.origin
 
 def init(editor):
     global readline
-    readline = Completer('search_forward_history', '/', editor)
+    readline = SearchCompleter('search_forward_history', '/', editor)
 
 def loop(editor: _Editor):
     try:
@@ -14,10 +50,8 @@ def loop(editor: _Editor):
     if user_input:
         editor.registr['/'] = user_input
     
+    if editor.registr['/']:
         editor.actions.normal('n')
-#        from time import sleep
-#        sleep(0.2)
-        editor.actions.normal('zz')
         
     return 'normal'
     
@@ -1,12 +1,25 @@
 from vy.global_config import DEBUG
 
+from collections import deque
+from concurrent.futures import Future, InvalidStateError
 import subprocess
 import threading
 import itertools
 import queue
 import json
 import os
-import time
+
+def code_units(text, encoding):
+    """
+    Returns the lenght of text counted the way the columns are, given the
+    position encoding the server picked: the buffer counts characters
+    (utf-32), most servers count utf-16 code units.
+    """
+    if encoding == 'utf-32' or text.isascii():
+        return len(text)
+    if encoding == 'utf-8':
+        return len(text.encode('utf-8', 'surrogatepass'))
+    return len(text.encode('utf-16-le', 'surrogatepass')) // 2
 
 def open_lsp_channel(server, buffer):
     return False
@@ -23,33 +36,54 @@ class LSPClient:
     set of language-specific tasks as defined in the LSP specifications. It interacts with the
     server using JSON-RPC requests and processes responses accordingly.
 
+    Messages are pipelined: a writer thread sends whatever was queued in a single write,
+    and a reader thread resolves the future of every request as its response comes in,
+    so that sending never waits for the server.  A request made with latest_only=True
+    cancels (by '$/cancelRequest') the pending request of the same method, the answer of
+    which is not needed anymore.  Server notifications are given to the handlers set by
+    on_notification(), published diagnostics are kept in the diagnostics dict.
+
     Parameters:
         server_command (list[str]): The command used to start the LSP server (e.g., `['pylsp']`).
-        timeout (float, optional): Timeout duration in seconds for each request. Default is 2.0 seconds.
+        timeout (float, optional): Timeout duration in seconds for each request. Default is 5.0 seconds.
     """
+    LOG_SIZE = 1000         # messages kept in the log
+    LOG_WIDTH = 500         # bytes kept of every logged message
 
     def __init__(self, server_command, target_buffer, timeout=5.0):
         self._server_command = server_command
         self._target_buffer = target_buffer
         self._timeout = timeout
-        self._proc = subprocess.Popen(
-                server_command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0
-        )
-        self._pending_responses = {}
         self._id_gen = itertools.count(1)
-        self._reader_thread = threading.Thread(target=self._read_loop, daemon=True)
-        self._reader_thread.start()
-
-        if DEBUG:
-            self._stderr_thread = threading.Thread(target=self._stderr_loop, daemon=True)
-            self._stderr_thread.start()
-
+        self._lock = threading.Lock()
+        self._pending_responses = {}    # request id: Future
+        self._latest = {}               # method: id of its latest request
+        self._handlers = {}             # method: handler of the notification
+        self.diagnostics = {}           # uri: last published diagnostics
+        self.log = deque(maxlen=self.LOG_SIZE)
+        self.on_notification('textDocument/publishDiagnostics', self._store_diagnostics)
+        self._start()
+        self._handshake()
+
+    def _start(self):
+        self._proc = proc = subprocess.Popen(
+                self._server_command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        self._outbox = outbox = queue.SimpleQueue()
+        self._broken = False
+        for loop, args in ((self._write_loop, (proc, outbox)),
+                           (self._read_loop, (proc,)),
+                           (self._stderr_loop, (proc,))):
+            threading.Thread(target=loop, args=args, daemon=True,
+                             name=f'LSPClient.{loop.__name__}()').start()
+
+    def _handshake(self):
         # Minimal realistic client capabilities. These can be extended depending on language server needs.
         # See https://microsoft.github.io/language-server-protocol/specifications/specification-current/#clientCapabilities
         capabilities = {
             "workspace": {
                 "workspaceFolders": {"supported": False, "changeNotifications": False}
-                
+
             },
             "textDocument": {
                 "synchronization": {"openClose": True, "save": {"includeText": True}, "change": 2},
@@ -70,6 +104,9 @@ class LSPClient:
             "experimental": {}
         }
         capabilities = {
+            "general": {
+                "positionEncodings": ["utf-32"]
+            },
             "textDocument": {
                 "completion": {
                     "completionItem": {
@@ -88,17 +125,29 @@ class LSPClient:
 
         # The root URI of the workspace. Set this to the root directory of your project.
         # Use "file:///" if no project directory is available.
-        
+        target_buffer = self._target_buffer
         root_uri = "file://" + (str(target_buffer.path.parent) if target_buffer.path else '/')
-        
+
         # Initialize and send the 'initialized' notification immediately after
-        self.initialize(process_id=process_id, root_uri=root_uri, capabilities=capabilities)
+        response = self.initialize(process_id=process_id, root_uri=root_uri, capabilities=capabilities)
         self.initialized()
 
+        server_capabilities = ((response or {}).get('result') or {}).get('capabilities', {})
+        # A server that did not pick an encoding counts the columns in utf-16
+        # code units, see code_units().
+        self.position_encoding = server_capabilities.get('positionEncoding', 'utf-16')
+        # textDocumentSync is either a TextDocumentSyncKind or an options dict,
+        # 2 means the server accepts incremental changes.
+        sync = server_capabilities.get('textDocumentSync', 1)
+        self.incremental_sync = (sync.get('change', 1) if isinstance(sync, dict) else sync) == 2
+        # the saved text is only sent if the server asks for it
+        save = sync.get('save') if isinstance(sync, dict) else None
+        self.save_includes_text = isinstance(save, dict) and bool(save.get('includeText'))
+
     def __bool__(self):
         """
-        The server has a True value so that 
-        
+        The server has a True value so that
+
         Returns:
             bool: Always returns True to indicate an active client.
         """
@@ -106,210 +155,217 @@ class LSPClient:
 
     def _restart_server(self):
         self._proc.kill()
-        self.__init__(self._server_command, self._target_buffer, self._timeout)
+        self._start()
+        self._handshake()
+        # the new server knows nothing about the buffer
+        self._target_buffer._lsp_full_sync()
 
-    def _stderr_loop(self):
+    def _log(self, direction, data):
+        self.log.append(f'{direction} {data[:self.LOG_WIDTH].decode("utf-8", "replace").rstrip()}')
+
+    def write_log(self, path='lsp_client.log'):
+        """
+        Writes the last LOG_SIZE messages exchanged with the server (and
+        the lines it wrote on stderr) to a file.  The messages are only
+        recorded if vy.global_config.DEBUG is set.
+        """
+        with open(path, 'w') as out:
+            out.writelines(entry + '\n' for entry in list(self.log))
+
+    def on_notification(self, method, handler):
+        """
+        Sets the function to be called (by the reader thread) with the
+        params of the notifications of method sent by the server.
+        """
+        self._handlers[method] = handler
+
+    def _store_diagnostics(self, params):
+        self.diagnostics[params['uri']] = params.get('diagnostics', [])
+
+    def _stderr_loop(self, proc):
         """
         Internal method for continuously reading stderr from the LSP server process.
-        
-        This method runs in a separate thread and logs all stderr output to a file.
+
+        This method runs in a separate thread, so that the server never blocks on a
+        full pipe, and logs the stderr output.
+        """
+        for line in proc.stderr:
+            if DEBUG:
+                self._log('[STDERR]', line)
+
+    def _write_loop(self, proc, outbox):
+        """
+        Internal method writing the queued messages to the LSP server process.
+
+        Everything queued while the previous write was going on is sent at once.
         """
         while True:
-            line = self._proc.stderr.readline().decode("utf-8")
-            if line:
-                with open('stderr_from_lsp.log', 'a+') as out:
-                    out.write("[STDERR] " + line)
-                    out.flush()
+            payloads = [outbox.get()]
+            while True:
+                try:
+                    payloads.append(outbox.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                proc.stdin.write(b''.join(payloads))
+                proc.stdin.flush()
+            except (OSError, ValueError):
+                return self._connection_lost(proc)
 
-    def _send_request(self, method, params):
+    def _read_loop(self, proc):
         """
-        Internal method to send a JSON-RPC request to the LSP server.
+        Internal method for continuously reading responses from the LSP server process.
+
+        This method runs in a separate thread and processes incoming JSON-RPC messages.
+        """
+        stdout = proc.stdout
+        while True:
+            headers = {}
+            while line := stdout.readline():
+                if not line.strip():
+                    break
+                key, _, value = line.decode('ascii', 'replace').partition(':')
+                headers[key.strip().lower()] = value.strip()
+            else:
+                return self._connection_lost(proc)
+
+            content_length = int(headers.get("content-length", 0))
+            content = stdout.read(content_length)
+            if len(content) < content_length:
+                return self._connection_lost(proc)
+            if DEBUG:
+                self._log('<--', content)
+            try:
+                message = json.loads(content)
+            except ValueError:
+                continue
+            self._dispatch(message)
+
+    def _dispatch(self, message):
+        if "method" in message:
+            if "id" in message:
+                # a request from the server, none is supported
+                items = (message.get('params') or {}).get('items', ())
+                result = [None] * len(items) if message['method'] == 'workspace/configuration' else None
+                self._post({"jsonrpc": "2.0", "id": message['id'], "result": result})
+            elif (handler := self._handlers.get(message['method'])) is not None:
+                try:
+                    handler(message.get('params'))
+                except Exception as exc:
+                    if DEBUG:
+                        self._log('!!!', repr(exc).encode('utf-8'))
+        elif "id" in message:
+            with self._lock:
+                future = self._pending_responses.pop(str(message['id']), None)
+            if future is not None:
+                try:
+                    future.set_result(message)
+                except InvalidStateError:
+                    pass    # cancelled meanwhile
+
+    def _connection_lost(self, proc):
+        with self._lock:
+            if proc is not self._proc or self._broken:
+                return
+            self._broken = True
+            pending, self._pending_responses = self._pending_responses, {}
+            self._latest.clear()
+        for future in pending.values():
+            try:
+                future.set_exception(ConnectionError(f'the LSP server {self._server_command!r} stopped'))
+            except InvalidStateError:
+                pass
+
+    def _post(self, message):
+        data = json.dumps(message).encode("utf-8")
+        if DEBUG:
+            self._log('-->', data)
+        self._outbox.put(b"Content-Length: %d\r\n\r\n" % len(data) + data)
+
+    def request(self, method, params, latest_only=False):
+        """
+        Sends a JSON-RPC request to the LSP server without waiting.
 
         Parameters:
             method (str): The LSP method to call.
             params (dict or None): Parameters to pass to the method.
+            latest_only (bool): Cancels the pending request of the same method.
 
         Returns:
-            dict: The server's response.
-
-        Raises:
-            TimeoutError: If no response is received within the timeout period.
+            Future: Resolved with the server's response.  Cancelling it sends a
+            '$/cancelRequest' to the server.
         """
+        if self._broken:
+            self._restart_server()
         request_id = str(next(self._id_gen))
-
-        request = {
+        future = Future()
+        with self._lock:
+            self._pending_responses[request_id] = future
+            previous = self._latest.get(method) if latest_only else None
+            if latest_only:
+                self._latest[method] = request_id
+            previous = self._pending_responses.get(previous)
+        if previous is not None:
+            previous.cancel()
+        future.add_done_callback(lambda future: future.cancelled() and self._cancel(request_id))
+        self._post({
             "jsonrpc": "2.0",
             "id": request_id,
             "method": method,
             "params": params
-        }
+        })
+        return future
 
-        response_queue = queue.Queue()
-        self._pending_responses[request_id] = response_queue
+    def _cancel(self, request_id):
+        with self._lock:
+            if self._pending_responses.pop(request_id, None) is None or self._broken:
+                return
+        self._post({"jsonrpc": "2.0", "method": "$/cancelRequest", "params": {"id": request_id}})
 
-        message = json.dumps(request).encode("utf-8")
-        payload = b"Content-Length: %d\r\n\r\n" % len(message) + message
-        try:
-            self._proc.stdin.write(payload)
-            self._proc.stdin.flush()
-        except BrokenPipeError:
-            self._restart_server()
-            self._proc.stdin.write(payload)
-            self._proc.stdin.flush()
-            
+    def _send_request(self, method, params, latest_only=False):
+        """
+        Internal method to send a JSON-RPC request to the LSP server and wait for its response.
+
+        Parameters:
+            method (str): The LSP method to call.
+            params (dict or None): Parameters to pass to the method.
+            latest_only (bool): Cancels the pending request of the same method.
 
-        with open('stdin_from_lsp.log', 'a') as out:
-            out.write(f"--> Request: {method}\n")
-            out.write(message.decode('utf-8') + "\n")
-            out.flush()
+        Returns:
+            dict: The server's response.
 
+        Raises:
+            TimeoutError: If no response is received within the timeout period.
+            CancelledError: If a later request of the same method superseded it.
+            ConnectionError: If the server stopped.
+        """
+        future = self.request(method, params, latest_only)
         try:
-            response = response_queue.get(timeout=self._timeout)
-            return response
-        except queue.Empty:
-            raise TimeoutError(f"No response for request {method} within {self._timeout}s")
-        finally:
-            del self._pending_responses[request_id]
+            return future.result(timeout=self._timeout)
+        except TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"No response for request {method} within {self._timeout}s") from None
 
     def _send_notification(self, method, params):
         """
         Internal method to send a JSON-RPC notification to the LSP server.
-        
+
         Notifications are one-way messages that do not expect a response.
 
         Parameters:
             method (str): The LSP method to call.
             params (dict): Parameters to pass to the method.
         """
-        notification = {
+        if self._broken:
+            self._restart_server()
+            if method == "textDocument/didChange":
+                # allready included in the full content sent on restart
+                return
+        self._post({
             "jsonrpc": "2.0",
             "method": method,
             "params": params
-        }
-        message = json.dumps(notification).encode('utf-8')
-        payload = (
-            b"Content-Length: "
-            + str(len(message)).encode('utf-8')
-            + b"\r\n\r\n"
-            + message
-        )
-
-        with open('stdin_from_lsp.log', 'a') as out:
-            out.write(f"--> Notification: {method}\n")
-            out.write(message.decode('utf-8') + "\n")
-            out.flush()
-
-        try:
-            self._proc.stdin.write(payload)
-            self._proc.stdin.flush()
-        except BrokenPipeError:
-            self._restart_server()
-            self._proc.stdin.write(payload)
-            self._proc.stdin.flush()
-    if DEBUG:
-        def _read_loop(self):
-            """
-            Internal method for continuously reading responses from the LSP server process.
-            
-            This method runs in a separate thread and processes incoming JSON-RPC messages.
-            """
-            while True:
-                headers = {}
-                while True:
-                    line = self._proc.stdout.readline().decode('utf-8')
-                    with open('stdout_from_lsp.log', 'a+') as out:
-                        out.write("<-- Header: " + line)
-                        out.flush()
-                    if not line.strip():
-                        break
-                    key, value = line.split(":", 1)
-                    headers[key.strip()] = value.strip()
-        
-                content_length = int(headers.get("Content-Length", 0))
-                if content_length:
-                    content = self._proc.stdout.read(content_length).decode("utf-8")
-                    with open('stdout_from_lsp.log', 'a+') as out:
-                        out.write("<-- Content: " + content + "\n")
-                        out.flush()
-                    
-                    try:
-                        response = json.loads(content)
-                        
-                        # Handle response to a request
-                        if "id" in response:
-                            response_id = str(response["id"])
-                            if response_id in self._pending_responses:
-                                self._pending_responses[response_id].put(response)
-                            else:
-                                with open('read_from_lsp.log', 'a') as out:
-                                    out.write(f"Received response for unknown id: {response_id}\n")
-                                    out.flush()
-                        # Handle server notifications (no id)
-                        elif "method" in response:
-                            with open('read_from_lsp.log', 'a') as out:
-                                out.write(f"Received notification: {response['method']}\n")
-                                out.flush()
-                    except json.JSONDecodeError as e:
-                        with open('read_from_lsp.log', 'a') as out:
-                            out.write(f"Error decoding JSON: {e}, content: {repr(content)}\n")
-                        out.flush()    
-    
-    else: #vy.global_config.DEBUG is False
-        def _read_loop(self):
-            """
-            Internal method for continuously reading responses from the LSP server process.
-            
-            This method runs in a separate thread and processes incoming JSON-RPC messages.
-            """
-            while True:
-                headers = {}
-                while (line := self._proc.stdout.readline().decode('utf-8').strip()):
-                    key, value = line.split(":", 1)
-                    headers[key.strip()] = value.strip()
-        
-                content_length = int(headers.get("Content-Length", 0))
-                if content_length:
-                    content = self._proc.stdout.read(content_length).decode("utf-8")
-                    try:
-                        response = json.loads(content)
-                        # Handle response to a request
-                        if "id" in response:
-                            response_id = str(response["id"])
-                            if response_id in self._pending_responses:
-                                self._pending_responses[response_id].put(response)
-                            else:
-                                pass
-                        # Handle server notifications (no id)
-                        elif "method" in response:
-                            pass     
-                    except json.JSONDecodeError as e:
-                        pass
-
-    def _read_exactly(self, stream, n):
-        """
-        Cross-platform blocking read of exactly `n` bytes, with timeout.
-        
-        Parameters:
-            stream (file-like object): The stream to read from.
-            n (int): Number of bytes to read.
-            
-        Returns:
-            str: The decoded content.
-            
-        Raises:
-            TimeoutError: If reading times out.
-        """
-        deadline = time.monotonic() + self._timeout
-        data = b''  # Use bytes instead of str
-        while len(data) < n:
-            if time.monotonic() > deadline:
-                raise TimeoutError(f"Timeout while reading {n} bytes (got {len(data)})")
-            chunk = stream.read(n - len(data))
-            if not chunk:
-                time.sleep(0.01)
-                continue
-            data += chunk
-        return data.decode('utf-8')
+        })
 
     def initialize(self, process_id: int, root_uri: str, capabilities: dict):
         """
@@ -360,15 +416,11 @@ class LSPClient:
 
         See: https://microsoft.github.io/language-server-protocol/specifications/specification-current/#exit
         """
-        notification = {
+        self._post({
             "jsonrpc": "2.0",
             "method": "exit",
             "params": {}
-        }
-        message = json.dumps(notification).encode('utf-8')
-        payload = f"Content-Length: {len(message)}\r\n\r\n".encode('utf-8') + message
-        self._proc.stdin.write(payload)
-        self._proc.stdin.flush()
+        })
     
     def text_document_did_open(self, uri: str, language_id: str, version: int, text: str):
         """
@@ -463,7 +515,7 @@ class LSPClient:
         return self._send_request("textDocument/hover", {
             "textDocument": text_document,
             "position": position
-        })
+        }, latest_only=True)
 
     def text_document_completion(self, 
                                  uri: str,
@@ -501,7 +553,7 @@ class LSPClient:
             "textDocument": text_document,
             "position": position,
             "context": context
-        })
+        }, latest_only=True)
         
         # Default to empty results if there's an issue
         if not lsp_response or 'result' not in lsp_response or 'items' not in lsp_response['result']:
@@ -667,7 +719,7 @@ class LSPClient:
         return self._send_request("textDocument/documentHighlight", {
             "textDocument": text_document,
             "position": position
-        })
+        }, latest_only=True)
 
     def text_document_formatting(self, uri: str, tab_size: int = 4, insert_spaces: bool = True):
         """
@@ -778,7 +830,7 @@ class LSPClient:
         return self._send_request("textDocument/signatureHelp", {
             "textDocument": text_document,
             "position": position
-        })
+        }, latest_only=True)
 
     def text_document_type_definition(self, uri: str, line: int, character: int):
         """
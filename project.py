@@ -0,0 +1,444 @@
+"""
+    ********************************
+    ****    The Project Tree    ****
+    ********************************
+
+The 'vy.project' module walks the files of a project, the way git would
+see them: the '.git' folders and the files matched by the '.gitignore'
+files are skipped.
+
+It also keeps an index of the files of a project (see FileIndex), built
+in the background on first use, that answers the fuzzy queries of the
+':find' command.
+
+Only the common subset of the gitignore syntax is understood: comments,
+negation (!), folder-only rules (trailing /), anchored rules (holding a
+/), and the *, ?, ** and [...] wildcards.
+
+>>> rules = GitIgnore(['*.pyc', '/build/', '!keep.pyc', 'docs/**/*.tmp'])
+>>> rules.match('foo.pyc', 'foo.pyc', False)
+True
+>>> rules.match('keep.pyc', 'keep.pyc', False)
+False
+>>> rules.match('src/build', 'build', True) is None
+True
+>>> rules.match('docs/a/b/c.tmp', 'c.tmp', False)
+True
+
+A query matches a path if its characters are found in the path, in the
+same order.  Matches on the file name and at the start of words are
+ranked first.
+
+>>> paths = ['vy/screen.py', 'vy/filetypes/basefile.py', 'vy/editor.py']
+>>> [paths[index] for index in fuzzy_rank('edpy', paths)]
+['vy/editor.py']
+>>> [paths[index] for index in fuzzy_rank('fi', paths)]
+['vy/filetypes/basefile.py']
+>>> [paths[index] for index in fuzzy_rank('vy', paths)]
+['vy/screen.py', 'vy/editor.py', 'vy/filetypes/basefile.py']
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from heapq import nlargest, nsmallest
+from multiprocessing import get_context
+from os import scandir, stat
+from re import compile as _compile, escape as _escape
+from threading import Lock, Thread
+from time import monotonic
+
+
+def _translate(glob):
+    """
+    Translates a gitignore glob to a regular expression.
+    """
+    result = ''
+    index, length = 0, len(glob)
+    while index < length:
+        char = glob[index]
+        if char == '*':
+            if glob[index:index + 3] == '**/':
+                result += '(?:.*/)?'
+                index += 3
+                continue
+            if glob[index:index + 2] == '**':
+                result += '.*'
+                index += 2
+                continue
+            result += '[^/]*'
+        elif char == '?':
+            result += '[^/]'
+        elif char == '[' and (stop := glob.find(']', index + 2)) != -1:
+            body = glob[index + 1:stop].replace('\\', '\\\\')
+            if body[0] == '!':
+                body = '^' + body[1:]
+            result += f'[{body}]'
+            index = stop
+        elif char == '\\' and index + 1 < length:
+            index += 1
+            result += _escape(glob[index])
+        else:
+            result += _escape(char)
+        index += 1
+    return result
+
+
+class GitIgnore:
+    """
+    The rules of a .gitignore file.
+    """
+    __slots__ = ('rules',)
+
+    def __init__(self, lines):
+        self.rules = []
+        for line in lines:
+            line = line.rstrip()
+            if not line or line.startswith('#'):
+                continue
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            folder_only = line.endswith('/')
+            line = line.rstrip('/')
+            anchored = '/' in line
+            regex = _compile(_translate(line.lstrip('/')) + r'\Z')
+            self.rules.append((regex, negate, folder_only, anchored))
+
+    @classmethod
+    def from_folder(cls, folder):
+        """
+        Returns the rules of folder/.gitignore, or None.
+        """
+        try:
+            with open(f'{folder}/.gitignore', errors='replace') as file:
+                return cls(file.read().splitlines()) or None
+        except OSError:
+            return None
+
+    def match(self, relative_path, name, is_dir):
+        """
+        Returns True if the path (relative to the .gitignore folder) is
+        ignored, False if it is explicitly kept, or None if no rule
+        applies.
+        """
+        result = None
+        for regex, negate, folder_only, anchored in self.rules:
+            if folder_only and not is_dir:
+                continue
+            if regex.match(relative_path if anchored else name):
+                result = not negate
+        return result
+
+    def __bool__(self):
+        return bool(self.rules)
+
+
+def is_ignored(ignores, path, name, is_dir):
+    """
+    Tells if path is ignored by any of the (folder, GitIgnore) pairs,
+    the deepest folders having the last word.
+    """
+    ignored = False
+    for folder, rules in ignores:
+        verdict = rules.match(path[len(folder) + 1:], name, is_dir)
+        if verdict is not None:
+            ignored = verdict
+    return ignored
+
+
+_pool = None
+
+def worker_pool():
+    """
+    Returns the pool of worker processes shared by all the searches,
+    started on first use, or a pool of threads if processes cannot be
+    started.  The workers are started by a fork server, as the editor
+    threads would leave the locks they hold in a forked child.
+    """
+    global _pool
+    if _pool is None:
+        try:
+            _pool = ProcessPoolExecutor(mp_context=get_context('forkserver'))
+        except ValueError:
+            _pool = ThreadPoolExecutor()
+    elif _pool._broken:
+        # a pool gets broken by a dead worker, that would die again
+        _pool = ThreadPoolExecutor()
+    return _pool
+
+
+def walk_project(root, must_stop=lambda: False, on_folder=None):
+    """
+    Yields the paths (as strings starting with root) of the files found
+    under root, skipping what git would ignore.  The walk stops as soon
+    as must_stop() returns True.  If given, on_folder() is called with
+    every visited folder before it gets read.
+    """
+    root = str(root).rstrip('/') or '/'
+    stack = [(root, [])]
+    while stack and not must_stop():
+        folder, ignores = stack.pop()
+        if on_folder is not None:
+            on_folder(folder)
+        if (rules := GitIgnore.from_folder(folder)) is not None:
+            ignores = ignores + [(folder, rules)]
+        try:
+            entries = list(scandir(folder))
+        except OSError:
+            continue
+        entries.sort(key=lambda entry: entry.name, reverse=True)
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if is_dir and entry.name == '.git':
+                continue
+            if ignores and is_ignored(ignores, entry.path, entry.name, is_dir):
+                continue
+            if is_dir:
+                stack.append((entry.path, ignores))
+            else:
+                yield entry.path
+
+
+_SEPARATORS = frozenset('/_-. ')
+
+
+def fuzzy_score(query, key):
+    """
+    Returns how well query (in lower case) matches key (a path in lower
+    case), higher is better, or None if it does not match.
+    """
+    name = key.rfind('/') + 1
+    best = None
+    # the file name is tried first, then the whole path
+    for start in (name, 0) if name else (0,):
+        score = 0
+        position = start - 1
+        for char in query:
+            found = key.find(char, position + 1)
+            if found == -1:
+                break
+            if found == position + 1:
+                score += 4
+            if found == 0 or key[found - 1] in _SEPARATORS:
+                score += 6
+            position = found
+        else:
+            if start:
+                score += 8
+            if best is None or score > best:
+                best = score
+    return best
+
+
+def fuzzy_rank(query, keys, limit=50, max_scored=1024):
+    """
+    Returns the indexes of the keys (paths in lower case) matching query,
+    best first.  Only the max_scored shortest matching keys get scored,
+    longer queries will narrow the results anyway.
+    """
+    query = query.lower()
+    ids, _ = _narrow(query, keys)
+    if len(ids) > max_scored:
+        ids = sorted(nsmallest(max_scored, ids, key=lambda index: len(keys[index])))
+    return _rank(query, keys, ids, limit)
+
+
+def _narrow(query, keys, ids=None, ends=None):
+    # The leftmost match of each key is followed, so that a longer
+    # query only needs to look after the end of the previous one.
+    if ids is None:
+        ids = range(len(keys))
+    if ends is None:
+        ends = [0] * len(ids)
+    for char in query:
+        new_ids, new_ends = [], []
+        add_id, add_end = new_ids.append, new_ends.append
+        for index, end in zip(ids, ends):
+            found = keys[index].find(char, end)
+            if found != -1:
+                add_id(index)
+                add_end(found + 1)
+        ids, ends = new_ids, new_ends
+    return list(ids), list(ends)
+
+
+def _scan(query, chunks, chunk_size, first, ids, ends, enough):
+    """
+    Appends to ids and ends the matches of query found in chunks (of
+    chunk_size keys joined by newlines) from the first one on, until
+    there are enough of them.  Returns the index of the next chunk.
+
+    Every character of query is searched by the regular expression up
+    to its first occurrence, which follows the same leftmost match as
+    _narrow().
+
+    >>> ids, ends = [], []
+    >>> _scan('ab', ['ab\\nxa_b\\nb', 'aab\\nbb'], 3, 0, ids, ends, 2)
+    1
+    >>> ids, ends
+    ([0, 1], [2, 4])
+    """
+    pattern = _compile(''.join(f'{_escape(char)}[^\\n{_escape(next_char)}]*'
+                               for char, next_char in zip(query, query[1:]))
+                       + _escape(query[-1]))
+    for chunk in range(first, len(chunks)):
+        if len(ids) >= enough:
+            return chunk
+        text = chunks[chunk]
+        index = chunk * chunk_size
+        line_start, done = 0, -1
+        for match in pattern.finditer(text):
+            start = text.rfind('\n', 0, match.start()) + 1
+            if start == done:
+                continue # another match in the same key
+            index += text.count('\n', line_start, start)
+            line_start = done = start
+            ids.append(index)
+            ends.append(match.end() - start)
+    return len(chunks)
+
+
+def _rank(query, keys, ids, limit):
+    scored = []
+    for index in ids:
+        key = keys[index]
+        scored.append((fuzzy_score(query, key), -len(key), -index))
+    return [-index for _, _, index in nlargest(limit, scored)]
+
+
+class FileIndex:
+    """
+    The paths, relative to root, of the files of a project.  The index is
+    built by a background thread, and built again when the modification
+    time of one of its folders changes, which is checked every
+    POLL_DELAY seconds while the index is used.
+
+    The paths are kept as plain strings, and their lower case versions
+    (the keys matched against) only when they differ.  Both are sorted
+    by lenght, so that the first matches found are the shortest ones,
+    the only ones scored, and the keys are also joined by chunks of
+    CHUNK_SIZE, to be scanned by a single regular expression.
+    """
+    POLL_DELAY = 2.0
+    MAX_SCORED = 1024
+    CHUNK_SIZE = 4096
+
+    def __init__(self, root):
+        self.root = str(root).rstrip('/') or '/'
+        self.paths = []
+        self._keys = []
+        self._chunks = []
+        self._mtimes = {}
+        self._lock = Lock()
+        self._worker = None
+        self._checked = 0.0
+        self._generation = 0
+        self._last = None
+        self.ready = False
+
+    def _start(self, target):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = Thread(target=target, daemon=True,
+                                  name=f'FileIndex({self.root!r}).{target.__name__}()')
+            self._worker.start()
+
+    def _build(self):
+        mtimes = {}
+        paths, keys = [], []
+        skip = len(self.root) + 1 if self.root != '/' else 1
+
+        def on_folder(folder):
+            try:
+                mtimes[folder] = stat(folder).st_mtime_ns
+            except OSError:
+                mtimes[folder] = None
+
+        first = not self.ready
+        published = 4096
+        for path in walk_project(self.root, on_folder=on_folder):
+            path = path[skip:]
+            paths.append(path)
+            lower = path.lower()
+            keys.append(path if lower == path else lower)
+            if first and len(paths) == published:
+                self._publish(paths, keys, None)
+                published *= 2
+        self._publish(paths, keys, mtimes)
+
+    def _publish(self, paths, keys, mtimes):
+        order = sorted(range(len(keys)), key=lambda index: len(keys[index]))
+        paths = [paths[index] for index in order]
+        keys = [keys[index] for index in order]
+        size = self.CHUNK_SIZE
+        chunks = ['\n'.join(keys[start:start + size]) for start in range(0, len(keys), size)]
+        with self._lock:
+            self.paths = paths
+            self._keys = keys
+            self._chunks = chunks
+            self._generation += 1
+            self._last = None
+            if mtimes is not None:
+                self._mtimes = mtimes
+                self.ready = True
+
+    def _poll(self):
+        for folder, mtime in list(self._mtimes.items()):
+            try:
+                changed = stat(folder).st_mtime_ns != mtime
+            except OSError:
+                changed = mtime is not None
+            if changed:
+                return self._build()
+
+    def refresh(self):
+        """
+        Starts building the index if not done yet, or checks in the
+        background if it needs to be built again.
+        """
+        now = monotonic()
+        if not self.ready:
+            if self._worker is None:
+                self._start(self._build)
+        elif now - self._checked >= self.POLL_DELAY:
+            self._checked = now
+            self._start(self._poll)
+
+    def find(self, query, limit=50):
+        """
+        Returns the paths matching query, best first.  The results of the
+        previous query are reused when query extends it.
+        """
+        self.refresh()
+        query = query.lower()
+        with self._lock:
+            keys, paths, chunks = self._keys, self.paths, self._chunks
+            generation, last = self._generation, self._last
+        if not query:
+            return paths[:limit]
+        if last is not None and last[1] == generation and query.startswith(last[0]):
+            # the previous matches are the ones of the keys scanned so far
+            ids, ends = _narrow(query[len(last[0]):], keys, last[2], last[3])
+            scanned = last[4]
+        else:
+            ids, ends, scanned = [], [], 0
+        scanned = _scan(query, chunks, self.CHUNK_SIZE, scanned, ids, ends, self.MAX_SCORED)
+        with self._lock:
+            if self._generation == generation:
+                self._last = (query, generation, ids, ends, scanned)
+        return [paths[index] for index in _rank(query, keys, ids[:self.MAX_SCORED], limit)]
+
+
+_indexes = {}
+
+def project_index(root='.'):
+    """
+    Returns the FileIndex of the folder root, starting to build it on
+    first use.
+    """
+    from os.path import realpath
+    root = realpath(root)
+    if (index := _indexes.get(root)) is None:
+        index = _indexes[root] = FileIndex(root)
+    index.refresh()
+    return index
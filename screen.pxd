@@ -1,8 +1,6 @@
 from os import get_terminal_size
 from sys import stdout
 
-from vy.filetypes.textfile cimport TextFile
-
 from cython cimport locals, final
 
 @locals(number=str,
@@ -14,14 +12,14 @@ from cython cimport locals, final
         char=str,
         nb_of_tabs=int,
         line=str)
-cdef list expandtabs_numbered(int tab_size, 
-                              int max_col,
-                              str text, 
-                              int on_lin, 
-                              int cursor_lin, 
-                              int cursor_col,
-                              int num_len,
-                              object visual)
+cpdef list expandtabs_numbered(int tab_size, 
+                               int max_col,
+                               str text, 
+                               int on_lin, 
+                               int cursor_lin, 
+                               int cursor_col,
+                               int num_len,
+                               object visual)
 
 @locals(retval=list, 
         cursor_col=int, 
@@ -31,14 +29,14 @@ cdef list expandtabs_numbered(int tab_size,
         char=str,
         nb_of_tabs=int,
         line=str)
-cdef list expandtabs(int tab_size,
-                     int max_col, 
-                     str text, 
-                     int on_lin, 
-                     int cursor_lin, 
-                     int cursor_col,
-                     int num_len,
-                     object visual)
+cpdef list expandtabs(int tab_size,
+                      int max_col, 
+                      str text, 
+                      int on_lin, 
+                      int cursor_lin, 
+                      int cursor_col,
+                      int num_len,
+                      object visual)
 
 @locals(retval=list, 
         cursor_col=int, 
@@ -65,8 +63,8 @@ cdef class Window:
     cdef public Window left_panel
     cdef public Window right_panel
     cdef public CompletionBanner minibar_completer
-    cdef public TextFile buff
-    #cdef public object buff
+    # any BaseFile: TextFile, GrepFile, LargeFile...
+    cdef public object buff
     cdef Window _focused 
     cdef Window parent
     cdef int shift_to_col
@@ -75,6 +73,11 @@ cdef class Window:
     cdef int v_split_shift
     cdef list _last_computed
     cdef public tuple shown_lines
+    cdef dict _rendered
+    cdef object _rendered_params
+    cdef object _rendered_generation
+    cdef tuple _rendered_cursor
+    cdef tuple _rendered_selection
 
     @locals(rv=list,
             max_lin=int,
@@ -2,9 +2,13 @@
 This module is a mess that handles screen rendering.
 """
 
+from functools import lru_cache
 from os import get_terminal_size
 from sys import stdout
 
+from vy.utils import redraw_needed
+from vy import global_config
+
 def expand_quick(max_col, text):
     if not text:
         return [ ' ' * max_col ]
@@ -189,6 +193,44 @@ def expandtabs(tab_size, max_col, text, on_lin, cursor_lin, cursor_col, num_len,
     retval.append(line + (' ' * (max_col - on_col)))
     return retval
 
+def highlight_matches(pretty_line, raw_line, pattern):
+    """
+    Highlights the matches of pattern found in raw_line, inside of
+    pretty_line, its lexed version.
+    """
+    bounds = dict()
+    for match in pattern.finditer(raw_line.removesuffix('\n')):
+        if match.end() > match.start():
+            bounds[match.start()] = '\x1b[30;43m'
+            bounds[match.end()] = f'\x1b[97m{global_config.BG_COLOR}'
+    if not bounds:
+        return pretty_line
+    line = ''
+    on_col = 0
+    esc_flag = False
+    for char in pretty_line:
+        if esc_flag:
+            if char == 'm':
+                esc_flag = False
+        elif char == '\x1b':
+            esc_flag = True
+        else:
+            if on_col in bounds:
+                line += bounds[on_col]
+            on_col += 1
+        line += char
+    return line + bounds.get(on_col, '')
+
+RENDER_CACHE_SIZE = 4096
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def expand_cached(expand, tab_size, max_col, text, on_lin, num_len):
+    """
+    Same as expand(), for a line holding neither the cursor nor the
+    selection.  The returned list must not be modified.
+    """
+    return expand(tab_size, max_col, text, on_lin, -1, 0, num_len, (0, 0))
+
 class CompletionBanner:
     def __init__(self):
         self.view_start = 0
@@ -201,12 +243,14 @@ class CompletionBanner:
     def set_value(self, completion, selected):
         self.completion = completion
         self.selected = selected
+        redraw_needed.set()
 
     def __call__(self, make_func):
         self.set_value(*make_func())
 
     def give_up(self):
         self.__init__()
+        redraw_needed.set()
 
     def __iter__(self):
 #        self.completion, self.selected = self.make_func()
@@ -375,53 +419,120 @@ class Window():
         return expand_quick(self.number_of_col, f'\x1b[2m{self.buff.footer}\x1b[22m')
 
     def gen_body(self, min_lin, max_lin):
+        buff = self.buff
         max_col = self.number_of_col
-        wrap = self.buff.set_wrap
-        if number := self.buff.set_number:
+        wrap = buff.set_wrap
+        if number := buff.set_number:
             num_len = len(str(max_lin))
             expand = expandtabs_numbered
         else:
             expand = expandtabs
             num_len = None
-        tab_size = self.buff.set_tabsize
+        tab_size = buff.set_tabsize
 
         default = f"~{' ':{max_col- 1}}"
         true_cursor = 0
 
         try:
-            (start_lin, start_col), (stop_lin, stop_col) = self.buff.selected_lin_col
+            (start_lin, start_col), (stop_lin, stop_col) = buff.selected_lin_col
         except TypeError:
             start_col = stop_col = 0
             start_lin = stop_lin = -1
 
-        cursor_lin, cursor_col, raw_line_list = self.buff.get_raw_screen(min_lin, max_lin)
+        # Only the lines the buffer marked as dirty since last frame, and
+        # the ones where the cursor or the selection changed, get expanded
+        # again.  The others are taken from self._rendered.
+        rendered = self._rendered
+        highlight = buff.search_index.highlight
+        params = (buff, max_col, num_len, tab_size, highlight)
+        generation, changes = buff.dirty_lines_since(self._rendered_generation)
+        if changes is None or params != self._rendered_params:
+            rendered.clear()
+            self._rendered_params = params
+        else:
+            for first, stop, shift in changes:
+                if shift:
+                    for on_lin in [on_lin for on_lin in rendered if on_lin >= first]:
+                        del rendered[on_lin]
+                else:
+                    for on_lin in range(first, stop):
+                        rendered.pop(on_lin, None)
+        self._rendered_generation = generation
+
+        try:
+            cursor_lin, cursor_col = buff._cursor_lin_col
+        except ValueError:
+            raise RuntimeError('cursor_lin_col undefined') # buffer in inconsistant state
+        if (cursor_lin, cursor_col) != self._rendered_cursor:
+            rendered.pop(self._rendered_cursor[0], None)
+            rendered.pop(cursor_lin, None)
+            self._rendered_cursor = cursor_lin, cursor_col
+
+        selection = (start_lin, start_col, stop_lin, stop_col)
+        if selection != self._rendered_selection:
+            old_start, _, old_stop, _ = self._rendered_selection
+            for first, stop in ((old_start, old_stop), (start_lin, stop_lin)):
+                for on_lin in range(max(first, min_lin), min(stop + 1, max_lin)):
+                    rendered.pop(on_lin, None)
+            self._rendered_selection = selection
+
+        for on_lin in [on_lin for on_lin in rendered if not min_lin <= on_lin < max_lin]:
+            del rendered[on_lin]
+
+        on_lin = min_lin
+        while on_lin < max_lin:
+            if on_lin in rendered:
+                on_lin += 1
+                continue
+            stop = on_lin + 1
+            while stop < max_lin and stop not in rendered:
+                stop += 1
+            _, _, raw_line_list = buff.get_raw_screen(on_lin, stop)
+            for on_lin, pretty_line in enumerate(raw_line_list, start=on_lin):
+                if pretty_line is None:
+                    rendered[on_lin] = None
+                    continue
+                if highlight is not None:
+                    try:
+                        raw_line = buff._splited_lines[on_lin]
+                    except IndexError:
+                        raise RuntimeError('buffer modified while drawing')
+                    pretty_line = highlight_matches(pretty_line, raw_line, highlight)
+
+                if start_lin <= on_lin <= stop_lin:
+                    if start_lin != on_lin:
+                        start_v_col = -1
+                    else:
+                        start_v_col = start_col
+                    if stop_lin != on_lin:
+                        stop_v_col = -1
+                    else:
+                        stop_v_col = stop_col
+                else:
+                    start_v_col = stop_v_col = 0
+
+                if on_lin == cursor_lin or start_v_col or stop_v_col:
+                    rendered[on_lin] = expand(
+                        tab_size, max_col, pretty_line, on_lin, cursor_lin,
+                        cursor_col, num_len, (start_v_col, stop_v_col)
+                        )
+                else:
+                    # without a number, the line index does not matter
+                    rendered[on_lin] = expand_cached(
+                        expand, tab_size, max_col, pretty_line,
+                        on_lin if number else 0, num_len)
+            on_lin = stop
 
         line_list = list()
-        for on_lin, pretty_line in enumerate(raw_line_list, start=min_lin):
-            if pretty_line is None:
+        for on_lin in range(min_lin, max_lin):
+            to_print = rendered[on_lin]
+            if to_print is None:
                 line_list.append(default)
                 continue
 
             if on_lin == cursor_lin and true_cursor == 0:
                 true_cursor = min_lin + len(line_list)
 
-            if start_lin <= on_lin <= stop_lin:
-                if start_lin != on_lin:
-                    start_v_col = -1
-                else:
-                    start_v_col = start_col
-                if stop_lin != on_lin:
-                    stop_v_col = -1
-                else:
-                    stop_v_col = stop_col
-            else:
-                start_v_col = stop_v_col = 0
-
-            to_print = expand(
-                tab_size, max_col, pretty_line, on_lin, cursor_lin,
-                cursor_col, num_len, (start_v_col, stop_v_col)
-                )
-            
             if wrap or on_lin == cursor_lin:
                 line_list.extend(to_print)
             else:
@@ -461,6 +572,11 @@ class Window():
         self.v_split_shift = 0
         self._focused = self
         self.shown_lines = (0, 0)
+        self._rendered = dict()
+        self._rendered_params = None
+        self._rendered_generation = 0
+        self._rendered_cursor = (-1, -1)
+        self._rendered_selection = (-1, 0, -1, 0)
 
 
 class Screen(Window):
@@ -518,6 +634,7 @@ class Screen(Window):
             self._minibar_txt = lines
         else:
             self._minibar_txt = ('',)
+        redraw_needed.set()
         return lambda: self.minibar('') if self._minibar_txt == lines else None
     
     @property
@@ -531,8 +648,10 @@ class Screen(Window):
         return rv
 
     def infobar(self, left='', right=''):
-        self._infobar_left = left
-        self._infobar_right = right
+        if (left, right) != (self._infobar_left, self._infobar_right):
+            self._infobar_left = left
+            self._infobar_right = right
+            redraw_needed.set()
 
     @property
     def infobar_txt(self, ns={}):
@@ -630,8 +749,10 @@ class Screen(Window):
 
     def enable_mouse_tracking(self):
         stdout.write('\x1b[?9h')
+        stdout.write('\x1b[?1006h')    # SGR reports, no limit on coordinates
 #        stdout.write('\x1b[?1000h')
 
     def disable_mouse_tracking(self):
+        stdout.write('\x1b[?1006l')
         stdout.write('\x1b[?9l')
 #        stdout.write('\x1b[?1000l')
@@ -0,0 +1,328 @@
+"""
+    *********************************
+    ****    The Symbols Index    ****
+    *********************************
+
+The 'vy.symbols' module keeps an index of the symbols defined by the
+python files of a project: classes, functions, methods, module-level
+assignments and imports.  It answers 'gd', ':tag' and the symbol
+completion without the help of Jedi.
+
+The files are parsed with the ast module by a pool of processes, and
+the result is cached under USER_DIR/symbols, along with the size and
+modification time of every file, so that the next session only parses
+again the files that changed.  A saved buffer updates the index.
+
+Finding the definitions of a name is a dict lookup.
+
+>>> symbols = scan_source('''
+... import os.path as osp
+... CONSTANT = 1
+... class Foo(Base):
+...     def method(self): pass
+... async def bar(): pass
+... ''')
+>>> for symbol in symbols: print(symbol)
+('osp', 'osp', 'import', 2, 0)
+('CONSTANT', 'CONSTANT', 'variable', 3, 0)
+('Foo', 'Foo', 'class', 4, 0)
+('method', 'Foo.method', 'method', 5, 4)
+('bar', 'bar', 'function', 6, 0)
+>>> identifier_at('    return foo.bar(x)', 17)
+('bar', 15)
+"""
+import ast
+from hashlib import blake2b
+from os import replace, stat
+from os.path import realpath
+from pickle import dump, load
+from re import compile as _compile
+from threading import Lock, Thread, Timer
+
+from vy import global_config
+from vy.project import fuzzy_rank, walk_project, worker_pool
+
+CACHE_VERSION = 1
+BATCH_SIZE = 64
+
+_IDENTIFIER = _compile(r'\w+')
+
+
+def identifier_at(line, index):
+    """
+    Returns the identifier found at index of line and where it starts,
+    or ('', index).
+    """
+    for match in _IDENTIFIER.finditer(line):
+        if match.start() <= index < match.end():
+            return match.group(), match.start()
+        if match.start() > index:
+            break
+    return '', index
+
+
+def scan_source(source):
+    """
+    Returns the list of (name, qualified name, kind, line, column) of the
+    symbols defined by a python source.  Lines are counted from one and
+    columns from zero, as the ast module does.
+    """
+    symbols = []
+
+    def visit(body, scope, in_class):
+        for node in body:
+            if isinstance(node, ast.ClassDef):
+                symbols.append((node.name, scope + node.name, 'class',
+                                node.lineno, node.col_offset))
+                visit(node.body, f'{scope}{node.name}.', True)
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                symbols.append((node.name, scope + node.name,
+                                'method' if in_class else 'function',
+                                node.lineno, node.col_offset))
+            elif scope:
+                continue
+            elif isinstance(node, (ast.Import, ast.ImportFrom)):
+                for alias in node.names:
+                    if alias.name != '*':
+                        name = alias.asname or alias.name.partition('.')[0]
+                        symbols.append((name, name, 'import', node.lineno, node.col_offset))
+            elif isinstance(node, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                for target in targets:
+                    for name in ast.walk(target):
+                        if isinstance(name, ast.Name):
+                            symbols.append((name.id, name.id, 'variable',
+                                            name.lineno, name.col_offset))
+            elif isinstance(node, (ast.If, ast.Try)):
+                # definitions guarded by a condition or an ImportError
+                for block in (node.body, node.orelse, getattr(node, 'finalbody', ()),
+                              *(handler.body for handler in getattr(node, 'handlers', ()))):
+                    visit(block, scope, in_class)
+
+    visit(ast.parse(source).body, '', False)
+    return symbols
+
+
+def _scan_files(root, relative_paths):
+    """
+    Returns a list of (relative path, mtime, size, symbols) for the
+    python files of the batch.  This function is run by the worker
+    processes.
+    """
+    result = []
+    for relative_path in relative_paths:
+        path = f'{root}/{relative_path}'
+        try:
+            st = stat(path)
+            with open(path, 'rb') as file:
+                source = file.read()
+            symbols = scan_source(source)
+        except (OSError, SyntaxError, ValueError):
+            # a file that does not parse is indexed as empty
+            symbols = []
+            try:
+                st = stat(path)
+            except OSError:
+                continue
+        result.append((relative_path, st.st_mtime_ns, st.st_size, symbols))
+    return result
+
+
+class SymbolIndex:
+    """
+    The symbols of the python files found under root.  The index is
+    loaded from its cache and brought up to date by a background thread
+    on first use.
+
+    A saved file only updates its own symbols, the names that no longer
+    have any definition being left in the list searched by find() until
+    they make half of it.  The cache is saved SAVE_DELAY seconds after
+    the first update, along with the next ones.  If the editor quits
+    before, the next session parses these files again.
+    """
+    SAVE_DELAY = 10.0
+
+    def __init__(self, root):
+        self.root = realpath(root)
+        name = blake2b(self.root.encode('utf-8', 'surrogateescape'), digest_size=16).hexdigest()
+        self.cache_file = global_config.USER_DIR / 'symbols' / f'{name}.pickle'
+        self._files = {}        # relative path: (mtime, size, symbols)
+        self._by_name = {}      # name: [(relative path, qualified name, kind, lin, col)]
+        self._names = []
+        self._keys = []         # the names in lower case, for find()
+        self._listed = set()    # the names in _names
+        self._lock = Lock()
+        self._save_timer = None
+        self._worker = None
+        self.ready = False
+
+    def start(self):
+        """
+        Starts building the index in the background, if not done yet.
+        """
+        if self._worker is None:
+            self._worker = Thread(target=self._build, daemon=True,
+                                  name=f'SymbolIndex({self.root!r})._build()')
+            self._worker.start()
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_file, 'rb') as file:
+                version, root, files = load(file)
+        except Exception:
+            return {}
+        return files if version == CACHE_VERSION and root == self.root else {}
+
+    def _save_cache(self):
+        with self._lock:
+            self._save_timer = None
+            files = dict(self._files)
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            temp = self.cache_file.with_suffix('.tmp')
+            with open(temp, 'wb') as file:
+                dump((CACHE_VERSION, self.root, files), file)
+            replace(temp, self.cache_file)
+        except OSError:
+            pass
+
+    def _build(self):
+        files = self._load_cache()
+        found = {}
+        stale = []
+        skip = len(self.root) + 1
+        for path in walk_project(self.root):
+            if not path.endswith('.py'):
+                continue
+            relative_path = path[skip:]
+            try:
+                st = stat(path)
+            except OSError:
+                continue
+            known = files.get(relative_path)
+            if known is not None and known[:2] == (st.st_mtime_ns, st.st_size):
+                found[relative_path] = known
+            else:
+                stale.append(relative_path)
+
+        if stale:
+            batches = [stale[index:index + BATCH_SIZE]
+                       for index in range(0, len(stale), BATCH_SIZE)]
+            for result in worker_pool().map(_scan_files, [self.root] * len(batches), batches):
+                for relative_path, mtime, size, symbols in result:
+                    found[relative_path] = (mtime, size, symbols)
+
+        by_name = {}
+        for relative_path, (_, _, symbols) in found.items():
+            for name, qualname, kind, lin, col in symbols:
+                by_name.setdefault(name, []).append((relative_path, qualname, kind, lin, col))
+        with self._lock:
+            self._files = found
+            self._by_name = by_name
+            self._list_names()
+            self.ready = True
+        if stale or len(found) != len(files):
+            self._save_cache()
+
+    def _list_names(self):
+        # new lists, find() may be reading the old ones
+        self._names = list(self._by_name)
+        self._keys = [name.lower() for name in self._names]
+        self._listed = set(self._names)
+
+    def update_file(self, path):
+        """
+        Parses again the file at path, if it belongs to the project.
+        """
+        path = realpath(path)
+        if not path.startswith(self.root + '/') or not path.endswith('.py'):
+            return
+        relative_path = path[len(self.root) + 1:]
+        result = _scan_files(self.root, [relative_path])
+        with self._lock:
+            by_name = self._by_name
+            old = self._files.pop(relative_path, None)
+            if old is not None:
+                for name in {symbol[0] for symbol in old[2]}:
+                    # new lists, find() may be reading the old ones
+                    entries = [entry for entry in by_name.get(name, ())
+                               if entry[0] != relative_path]
+                    if entries:
+                        by_name[name] = entries
+                    else:
+                        by_name.pop(name, None)
+            for relative_path, mtime, size, symbols in result:
+                self._files[relative_path] = (mtime, size, symbols)
+                for name, qualname, kind, lin, col in symbols:
+                    by_name[name] = [*by_name.get(name, ()),
+                                     (relative_path, qualname, kind, lin, col)]
+                    if name not in self._listed:
+                        # appended in place, find() only reads the
+                        # indexes it knew
+                        self._listed.add(name)
+                        self._names.append(name)
+                        self._keys.append(name.lower())
+            if len(self._names) > 2 * len(by_name):
+                self._list_names()
+            if self._save_timer is None:
+                self._save_timer = Timer(self.SAVE_DELAY, self._save_cache)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+    def lookup(self, name, current=None, attribute=None):
+        """
+        Returns the definitions of name as a list of (path, qualified
+        name, kind, lin, col), the imports last and those found in the
+        file at path current first.  If attribute is True (the name
+        follows a dot) the methods come first, if it is False they come
+        after the functions, classes and variables.
+        """
+        self.start()
+        with self._lock:
+            entries = list(self._by_name.get(name, ()))
+        current = realpath(current) if current else None
+        entries.sort(key=lambda entry: (entry[2] == 'import',
+                                        attribute is not None and
+                                            (entry[2] == 'method') != attribute,
+                                        f'{self.root}/{entry[0]}' != current))
+        return [(f'{self.root}/{path}', *rest) for path, *rest in entries]
+
+    def find(self, query, limit=50):
+        """
+        Returns the (name, qualified name, kind, path, lin) of the symbols
+        whose name fuzzy-matches query, best first.
+        """
+        self.start()
+        if not query:
+            return []
+        with self._lock:
+            names, keys, by_name = self._names, self._keys, self._by_name
+        found = []
+        for index in fuzzy_rank(query, keys, limit):
+            name = names[index]
+            for path, qualname, kind, lin, _ in by_name.get(name, ()):
+                found.append((name, qualname, kind, path, lin))
+        return found[:limit]
+
+
+_indexes = {}
+
+def symbol_index(root='.'):
+    """
+    Returns the SymbolIndex of the folder root, starting to build it on
+    first use.
+    """
+    root = realpath(root)
+    if (index := _indexes.get(root)) is None:
+        index = _indexes[root] = SymbolIndex(root)
+    index.start()
+    return index
+
+
+def update_symbols(path):
+    """
+    Tells the existing indexes that the file at path changed.
+    """
+    for index in list(_indexes.values()):
+        if index.ready:
+            index.update_file(path)
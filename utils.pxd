@@ -39,3 +39,19 @@ cdef class _HistoryList:
     cpdef push(self)
     cpdef skip_next(self) noexcept
     cpdef last_record(self)
+
+@final
+cdef class _UndoList:
+    cdef:
+        public list data
+        public int pointer
+        str name
+        public object max_size
+        public object size
+        list _pending
+        object _pending_size
+        object _position
+    cpdef void record(self, object offset, str removed, str inserted, object position) noexcept
+    cpdef bint close(self, object position) noexcept
+    cpdef pop(self)
+    cpdef push(self)
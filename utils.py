@@ -1,6 +1,11 @@
 from _thread import allocate_lock
+from threading import Event
 from time import sleep
 
+redraw_needed = Event()
+# Set by anything changing what the screen shows (buffers content,
+# minibar, terminal size...), the editor waits for it before rendering.
+
 class DummyLine:
     r"""
     This class provides a simple interface around a line oriented
@@ -142,6 +147,107 @@ class _HistoryList:
     def __len__(self):
         return len(self.data)
 
+class _UndoList:
+    r"""
+    The undo history of a buffer.
+
+    Instead of snapshots of the whole text, it records reversible edits
+    (offset, removed text, inserted text).  Edits are accumulated by
+    record() until close() is called, once per command, and grouped into
+    a single record (edits, position_before, position_after) that undo
+    and redo will replay at once.  The oldest records are forgotten when
+    the total size of the recorded text exceeds max_size characters.
+
+    >>> x = _UndoList()
+    >>> x.record(0, '', 'foo', (0, 1))
+    >>> x.close((0, 4))
+    True
+    >>> x.pop()
+    ([(0, '', 'foo')], (0, 1), (0, 4))
+    >>> x.push()
+    ([(0, '', 'foo')], (0, 1), (0, 4))
+    """
+    def __init__(self, max_size=None, name='undo list'):
+        self.data = list()
+        self.pointer = 0
+        self.name = name
+        self.max_size = max_size
+        self.size = 0
+        self._pending = list()
+        self._pending_size = 0
+        self._position = None
+
+    def record(self, offset, removed, inserted, position):
+        """
+        Records an edit that replaced the removed text found at offset by
+        inserted.  Position is the cursor position before the edit, only
+        the one of the first edit of a group is kept.
+        """
+        if removed == inserted:
+            return
+        if not self._pending:
+            self._position = position
+        self._pending.append((offset, removed, inserted))
+        self._pending_size += len(removed) + len(inserted)
+
+    def close(self, position):
+        """
+        Groups the edits recorded since last call into a single undo
+        step, position being the cursor position after them.  Returns
+        True if a new record was made.
+        """
+        if not self._pending:
+            return False
+        for record in self.data[self.pointer:]:
+            self.size -= self._size_of(record)
+        del self.data[self.pointer:]
+        self.data.append((self._pending, self._position, position))
+        self.size += self._pending_size
+        self.pointer += 1
+        self._pending = list()
+        self._pending_size = 0
+        if self.max_size is not None:
+            while self.size > self.max_size and len(self.data) > 1:
+                self.size -= self._size_of(self.data.pop(0))
+                self.pointer -= 1
+        return True
+
+    @staticmethod
+    def _size_of(record):
+        return sum(len(removed) + len(inserted) for _, removed, inserted in record[0])
+
+    def pop(self):
+        """
+        Returns the record to undo, and moves backward.
+        """
+        if self.pointer > 0:
+            self.pointer -= 1
+            return self.data[self.pointer]
+        raise IndexError
+
+    def push(self):
+        """
+        Returns the record to redo, and moves forward.
+        """
+        if self.pointer == len(self.data):
+            raise IndexError
+        self.pointer += 1
+        return self.data[self.pointer-1]
+
+    def last_record(self):
+        """
+        Returns the record that would be undone next.
+        """
+        if self.pointer > 0:
+            return self.data[self.pointer-1]
+        raise IndexError
+
+    def __str__(self):
+        return f'( {self.name}: #{self.pointer} /{len(self.data)} )'
+
+    def __len__(self):
+        return len(self.data)
+
 def eval_effified_str(string):
     # better not work on it now
     return string